@@ -0,0 +1,67 @@
+"""Measure AsyncMBtiles read throughput with many concurrent clients."""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pymbtiles.aio import AsyncMBtiles
+
+from common import create_tileset
+
+
+async def client(src, coords):
+    for z, x, y in coords:
+        await src.read_tile(z, x, y)
+
+
+async def load(filename, workers, clients, requests, zoom, width):
+    rng = random.Random(0)
+    async with AsyncMBtiles(filename, workers=workers) as src:
+        plans = [
+            [(zoom, rng.randrange(width), rng.randrange(width)) for _ in range(requests)]
+            for _ in range(clients)
+        ]
+        start = time.perf_counter()
+        await asyncio.gather(*[client(src, plan) for plan in plans])
+        return time.perf_counter() - start, src.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=65536)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    zoom = 0
+    while 4 ** zoom < args.tiles:
+        zoom += 1
+    width = 2 ** zoom
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "test.mbtiles")
+        create_tileset(filename, args.tiles, zoom=zoom)
+
+        total = args.clients * args.requests
+        print("{} clients, {:,} requests".format(args.clients, total))
+        for workers in (1, 2, 4, 8):
+            seconds, stats = asyncio.run(
+                load(filename, workers, args.clients, args.requests, zoom, width)
+            )
+            print(
+                "{:<20} {:>12,.0f} requests/s  {:>6.1%} checkouts waited".format(
+                    "workers={}".format(workers), total / seconds, stats["wait_rate"]
+                )
+            )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare building a new tileset with and without deferred indexes."""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles
+
+from common import report, synthetic_tiles, timed
+
+
+def build(filename, tiles, batch_size, defer_indexes):
+    with MBtiles(filename, "w", defer_indexes=defer_indexes) as out:
+        for i in range(0, len(tiles), batch_size):
+            out.write_tiles(tiles[i : i + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=1000000)
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--duplicates", type=float, default=0.7)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument(
+        "--shuffle", action="store_true", help="write tiles in random order"
+    )
+    args = parser.parse_args()
+
+    tiles = list(
+        synthetic_tiles(
+            args.tiles, duplicate_ratio=args.duplicates, tile_size=args.tile_size
+        )
+    )
+    if args.shuffle:
+        random.Random(0).shuffle(tiles)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(
+            "{:,} tiles of {:,} bytes, {:.0%} duplicates".format(
+                args.tiles, args.tile_size, args.duplicates
+            )
+        )
+        for defer_indexes in (False, True):
+            filename = os.path.join(tmpdir, "{}.mbtiles".format(defer_indexes))
+            seconds = timed(build, filename, tiles, args.batch_size, defer_indexes)
+            report("defer_indexes={}".format(defer_indexes), seconds, args.tiles)
+            print("{:<40} {:>12,} bytes".format("", os.path.getsize(filename)))
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compare write_tiles with write_columns for large batches of small tiles,
+where the Python overhead of each tile dominates."""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles
+
+from common import report, synthetic_tiles, timed
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def write_tiles(filename, tiles, batch_size):
+    with MBtiles(filename, "w") as out:
+        for i in range(0, len(tiles), batch_size):
+            out.write_tiles(tiles[i : i + batch_size])
+
+
+def write_columns(filename, columns, batch_size):
+    zs, xs, ys, blobs = columns
+    with MBtiles(filename, "w") as out:
+        for i in range(0, len(blobs), batch_size):
+            j = i + batch_size
+            out.write_columns(zs[i:j], xs[i:j], ys[i:j], blobs[i:j])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=1000000)
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--duplicates", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=100000)
+    args = parser.parse_args()
+
+    tiles = list(
+        synthetic_tiles(
+            args.tiles, duplicate_ratio=args.duplicates, tile_size=args.tile_size
+        )
+    )
+    columns = [[tile[i] for tile in tiles] for i in range(4)]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "test.mbtiles")
+        print(
+            "{:,} tiles of {:,} bytes, batches of {:,}".format(
+                args.tiles, args.tile_size, args.batch_size
+            )
+        )
+
+        report(
+            "write_tiles",
+            timed(write_tiles, filename, tiles, args.batch_size),
+            args.tiles,
+        )
+        report(
+            "write_columns (lists)",
+            timed(write_columns, filename, columns, args.batch_size),
+            args.tiles,
+        )
+
+        if np is not None:
+            arrays = [np.array(values, dtype="uint32") for values in columns[:3]]
+            report(
+                "write_columns (numpy)",
+                timed(
+                    write_columns, filename, arrays + [columns[3]], args.batch_size
+                ),
+                args.tiles,
+            )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare compressed size and throughput of each compression codec and level."""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.compression import CODECS
+
+from common import report, timed
+
+# compression levels to compare for each codec
+LEVELS = {
+    "gzip": (1, 6, 9),
+    "zlib": (1, 6, 9),
+    "zstd": (1, 3, 19),
+    "brotli": (1, 6, 11),
+}
+
+
+def compressible_tiles(num_tiles, tile_size, seed=0):
+    """Generate tiles of repetitive data, similar to uncompressed vector tiles."""
+
+    rng = random.Random(seed)
+    words = [os.urandom(rng.randint(2, 12)) for _ in range(256)]
+
+    zoom = 0
+    while 4 ** zoom < num_tiles:
+        zoom += 1
+    width = 2 ** zoom
+
+    for i in range(num_tiles):
+        data = bytearray()
+        while len(data) < tile_size:
+            data.extend(words[int(rng.expovariate(0.05)) % len(words)])
+        yield Tile(zoom, i // width, i % width, bytes(data[:tile_size]))
+
+
+def write(filename, tiles, batch_size, workers, codec, level):
+    with MBtiles(filename, "w", compression=codec, compression_level=level) as out:
+        with out.parallel_writer(workers=workers, batch_size=batch_size) as writer:
+            writer.write_tiles(tiles)
+
+
+def read(filename, batch_size, codec):
+    with MBtiles(filename, compression=codec, decompress=True) as src:
+        for _ in src.iter_tiles(batch_size, data=True):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=20000)
+    parser.add_argument("--tile-size", type=int, default=32768)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    tiles = list(compressible_tiles(args.tiles, args.tile_size))
+    raw_bytes = sum(len(tile.data) for tile in tiles)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "test.mbtiles")
+        print(
+            "{:,} tiles of {:,} bytes, {} workers".format(
+                args.tiles, args.tile_size, args.workers
+            )
+        )
+
+        for codec in [None] + sorted(CODECS):
+            for level in LEVELS.get(codec, (None,)):
+                name = "{} {}".format(codec, level) if codec else "none"
+                seconds = timed(
+                    write, filename, tiles, args.batch_size, args.workers, codec, level
+                )
+                with MBtiles(filename) as src:
+                    stored = src._cursor.execute(
+                        "SELECT sum(length(tile_data)) FROM images"
+                    ).fetchone()[0]
+
+                report(
+                    "write {:<12} ratio {:>5.2f}".format(name, raw_bytes / stored),
+                    seconds,
+                    raw_bytes / 1e6,
+                    "MB",
+                )
+                report(
+                    "read  {}".format(name),
+                    timed(read, filename, args.batch_size, codec),
+                    raw_bytes / 1e6,
+                    "MB",
+                )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
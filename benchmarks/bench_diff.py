@@ -0,0 +1,81 @@
+"""Measure ops.diff and ops.apply_patch throughput for a tileset where a small
+fraction of tiles change between versions."""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.ops import apply_patch, diff
+
+from common import create_tileset, report, timed
+
+
+def make_new_version(filename, num_tiles, change_ratio, tile_size, seed=0):
+    """Change, add, and delete change_ratio of the tiles in filename, in
+    equal parts.
+    """
+
+    rng = random.Random(seed)
+    num_changes = int(num_tiles * change_ratio) // 3
+
+    with MBtiles(filename, "r+") as out:
+        z = out.zoom_range()[1]
+        coords = rng.sample(out.list_tiles(), 2 * num_changes)
+        changed, deleted = coords[:num_changes], coords[num_changes:]
+
+        out.write_tiles(Tile(z, x, y, os.urandom(tile_size)) for z, x, y in changed)
+        out.write_tiles(
+            Tile(z + 1, i, 0, os.urandom(tile_size)) for i in range(num_changes)
+        )
+        out._cursor.executemany(
+            "DELETE FROM map WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            deleted,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=200000)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--changes", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        old = os.path.join(tmpdir, "old.mbtiles")
+        new = os.path.join(tmpdir, "new.mbtiles")
+        patch = os.path.join(tmpdir, "patch.mbtiles")
+
+        create_tileset(old, args.tiles, tile_size=args.tile_size)
+        shutil.copy(old, new)
+        make_new_version(new, args.tiles, args.changes, args.tile_size)
+
+        print(
+            "{:,} tiles, {:.0%} changed between versions".format(
+                args.tiles, args.changes
+            )
+        )
+
+        for compare in ("tile_id", "data"):
+            seconds = timed(diff, old, new, patch, compare=compare)
+            report("diff (compare {})".format(compare), seconds, args.tiles)
+
+        target = os.path.join(tmpdir, "target.mbtiles")
+        shutil.copy(old, target)
+        report("apply_patch", timed(apply_patch, patch, target), args.tiles)
+
+        print(
+            "patch size: {:,.1f} MB, new tileset: {:,.1f} MB".format(
+                os.path.getsize(patch) / 1e6, os.path.getsize(new) / 1e6
+            )
+        )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
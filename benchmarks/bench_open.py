@@ -0,0 +1,61 @@
+"""Measure the time to open a tileset and read its first tile."""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from pymbtiles import MBtiles
+
+from common import create_tileset
+
+
+OPTIONS = (
+    ("r (bulk_load)", {}),
+    ("r (readonly_serving)", {"profile": "readonly_serving"}),
+    (
+        "r (readonly_serving, immutable)",
+        {"profile": "readonly_serving", "immutable": True},
+    ),
+)
+
+
+def open_and_read(filename, options):
+    start = time.perf_counter()
+    with MBtiles(filename, **options) as src:
+        opened = time.perf_counter()
+        src.read_tile(0, 0, 0)
+        read = time.perf_counter()
+
+    return opened - start, read - opened
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "test.mbtiles")
+        create_tileset(filename, args.tiles)
+
+        print("{:<40} {:>12} {:>12}".format("", "open (us)", "read (us)"))
+        for name, options in OPTIONS:
+            times = [open_and_read(filename, options) for _ in range(args.repeat)]
+            open_time = sorted(t[0] for t in times)[len(times) // 2]
+            read_time = sorted(t[1] for t in times)[len(times) // 2]
+            print(
+                "{:<40} {:>12.1f} {:>12.1f}".format(
+                    name, open_time * 1e6, read_time * 1e6
+                )
+            )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare set-based ops.extend / ops.difference with the per-tile path."""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles
+from pymbtiles.ops import _difference_tiles, _extend_tiles, difference, extend
+
+from common import create_tileset, report, timed
+
+
+def extend_per_tile(source_filename, target_filename, batch_size=1000):
+    with MBtiles(target_filename, "r+") as target, MBtiles(source_filename) as source:
+        _extend_tiles(source, target, batch_size=batch_size)
+
+
+def difference_per_tile(leftfilename, rightfilename, outfilename, batch_size=1000):
+    with MBtiles(leftfilename) as left, MBtiles(rightfilename) as right, MBtiles(
+        outfilename, "w"
+    ) as out:
+        _difference_tiles(left, right, out, batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=100000)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--duplicates", type=float, default=0.5)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        left = os.path.join(tmpdir, "left.mbtiles")
+        right = os.path.join(tmpdir, "right.mbtiles")
+
+        # right overlaps left by half of its tiles
+        create_tileset(
+            left,
+            args.tiles,
+            duplicate_ratio=args.duplicates,
+            tile_size=args.tile_size,
+            seed=1,
+        )
+        create_tileset(
+            right,
+            args.tiles + args.tiles // 2,
+            duplicate_ratio=args.duplicates,
+            tile_size=args.tile_size,
+            seed=2,
+        )
+        with MBtiles(right, "r+") as src:
+            src._cursor.execute(
+                "DELETE FROM map WHERE rowid <= ?", (args.tiles // 2,)
+            )
+
+        print("{:,} tiles per tileset".format(args.tiles))
+
+        for name, func in (("extend (per tile)", extend_per_tile), ("extend", extend)):
+            target = os.path.join(tmpdir, "target.mbtiles")
+            shutil.copy(left, target)
+            report(name, timed(func, right, target), args.tiles)
+
+        for name, func in (
+            ("difference (per tile)", difference_per_tile),
+            ("difference", difference),
+        ):
+            out = os.path.join(tmpdir, "out.mbtiles")
+            report(name, timed(func, left, right, out), args.tiles)
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
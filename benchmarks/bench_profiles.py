@@ -0,0 +1,70 @@
+"""Compare write and read throughput of the connection profiles."""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from pymbtiles import MBtiles
+
+from common import report, synthetic_tiles, timed
+
+
+WRITE_PROFILES = ("bulk_load", "wal_concurrent", "safe")
+READ_PROFILES = ("bulk_load", "wal_concurrent", "readonly_serving", "safe")
+
+
+def write(filename, tiles, profile, batch_size):
+    with MBtiles(filename, "w", profile=profile) as out:
+        for i in range(0, len(tiles), batch_size):
+            out.write_tiles(tiles[i : i + batch_size])
+
+
+def read(filename, coords, profile):
+    with MBtiles(filename, profile=profile) as src:
+        for z, x, y in coords:
+            src.read_tile(z, x, y)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=100000)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=100000)
+    args = parser.parse_args()
+
+    tiles = list(synthetic_tiles(args.tiles, tile_size=args.tile_size))
+    rng = random.Random(0)
+    coords = [rng.choice(tiles)[:3] for _ in range(args.reads)]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(
+            "{:,} tiles of {:,} bytes, batches of {:,}".format(
+                args.tiles, args.tile_size, args.batch_size
+            )
+        )
+        for profile in WRITE_PROFILES:
+            filename = os.path.join(tmpdir, profile + ".mbtiles")
+            report(
+                "write ({})".format(profile),
+                timed(write, filename, tiles, profile, args.batch_size),
+                args.tiles,
+            )
+
+        filename = os.path.join(tmpdir, "bulk_load.mbtiles")
+        for profile in READ_PROFILES:
+            report(
+                "random read ({})".format(profile),
+                timed(read, filename, coords, profile),
+                args.reads,
+            )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
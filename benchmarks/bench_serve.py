@@ -0,0 +1,180 @@
+"""Load test the tile server: request random tiles from many client threads
+over keep-alive connections and report throughput and latency percentiles.
+
+Serves a synthetic tileset unless --filename is given.  Use --url to load test
+a server that is already running.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+    from urllib.parse import urlparse
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection
+    from urlparse import urlparse
+
+from pymbtiles import MBtiles
+from pymbtiles.serve import TileServer
+
+from common import create_tileset
+
+
+def percentile(values, fraction):
+    """Return the value at fraction of sorted values (nearest rank)."""
+
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def client(host, port, paths, revalidate, latencies, statuses, lock):
+    connection = HTTPConnection(host, port)
+    etags = {}
+    times = []
+    counts = {}
+    try:
+        for path in paths:
+            headers = {"Accept-Encoding": "gzip"}
+            if revalidate and path in etags:
+                headers["If-None-Match"] = etags[path]
+
+            start = time.perf_counter()
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            times.append(time.perf_counter() - start)
+
+            counts[response.status] = counts.get(response.status, 0) + 1
+            etag = response.getheader("ETag")
+            if etag:
+                etags[path] = etag
+    finally:
+        connection.close()
+
+    with lock:
+        latencies.extend(times)
+        for status, count in counts.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+
+def load_test(host, port, coords, clients, requests, revalidate, seed=0):
+    """
+    Request random tiles of coords from clients threads, requests per thread.
+
+    Returns
+    -------
+    (seconds, sorted latencies in seconds, count of each response status)
+    """
+
+    rng = random.Random(seed)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    threads = []
+    for _ in range(clients):
+        # a small set of tiles per client, so that revalidation has an effect
+        tiles = rng.sample(coords, min(len(coords), max(1, requests // 4)))
+        paths = [
+            "/{0}/{1}/{2}".format(*rng.choice(tiles)) for _ in range(requests)
+        ]
+        threads.append(
+            threading.Thread(
+                target=client,
+                args=(host, port, paths, revalidate, latencies, statuses, lock),
+            )
+        )
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    return seconds, sorted(latencies), statuses
+
+
+def report_latencies(name, seconds, latencies, statuses):
+    print(
+        "{:<24} {:>10,.0f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  {}".format(
+            name,
+            len(latencies) / seconds,
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            ", ".join(
+                "{}: {:,}".format(status, count)
+                for status, count in sorted(statuses.items())
+            ),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filename", help="mbtiles file to serve")
+    parser.add_argument("--url", help="URL of a running server of --filename")
+    parser.add_argument("--tiles", type=int, default=100000)
+    parser.add_argument("--tile-size", type=int, default=16384)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    server = None
+    try:
+        filename = args.filename
+        if filename is None:
+            filename = os.path.join(tmpdir, "test.mbtiles")
+            create_tileset(filename, args.tiles, tile_size=args.tile_size)
+
+        # request tiles in the XYZ scheme
+        with MBtiles(filename) as src:
+            coords = [
+                (z, x, (1 << z) - 1 - y)
+                for batch in src.list_tiles_batched(10000)
+                for z, x, y in batch
+            ]
+
+        if args.url:
+            url = urlparse(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            server = TileServer(filename, port=0, pool_size=args.pool_size)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            host, port = server.server_address
+
+        print(
+            "{:,} tiles, {} clients x {:,} requests".format(
+                len(coords), args.clients, args.requests
+            )
+        )
+        for name, revalidate in (("GET", False), ("GET If-None-Match", True)):
+            report_latencies(
+                name,
+                *load_test(
+                    host, port, coords, args.clients, args.requests, revalidate
+                )
+            )
+
+        if server is not None:
+            print("pool: {}".format(server.pool.stats))
+
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare write_tiles throughput with each tile_id hash and the parallel writer."""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from pymbtiles import HASH_FUNCTIONS, MBtiles
+
+from common import report, synthetic_tiles, timed
+
+
+def write_serial(filename, tiles, batch_size, tile_id_hash="sha1"):
+    with MBtiles(filename, "w", tile_id_hash=tile_id_hash) as out:
+        for i in range(0, len(tiles), batch_size):
+            out.write_tiles(tiles[i : i + batch_size])
+
+
+def write_parallel(filename, tiles, batch_size, workers, processes=False):
+    with MBtiles(filename, "w") as out:
+        with out.parallel_writer(
+            workers=workers, batch_size=batch_size, processes=processes
+        ) as writer:
+            writer.write_tiles(tiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tiles", type=int, default=50000)
+    parser.add_argument("--tile-size", type=int, default=32768)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    tiles = list(
+        synthetic_tiles(
+            args.tiles, duplicate_ratio=args.duplicates, tile_size=args.tile_size
+        )
+    )
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "test.mbtiles")
+        print(
+            "{:,} tiles of {:,} bytes, {} workers".format(
+                args.tiles, args.tile_size, args.workers
+            )
+        )
+
+        report(
+            "write_tiles",
+            timed(write_serial, filename, tiles, args.batch_size),
+            args.tiles,
+        )
+        for name in sorted(HASH_FUNCTIONS):
+            if name != "sha1":
+                report(
+                    "write_tiles ({})".format(name),
+                    timed(write_serial, filename, tiles, args.batch_size, name),
+                    args.tiles,
+                )
+
+        report(
+            "parallel_writer (threads)",
+            timed(write_parallel, filename, tiles, args.batch_size, args.workers),
+            args.tiles,
+        )
+        report(
+            "parallel_writer (processes)",
+            timed(write_parallel, filename, tiles, args.batch_size, args.workers, True),
+            args.tiles,
+        )
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Shared helpers for benchmark scripts.
+
+Benchmarks are standalone scripts.  Install the package (`pip install -e .`)
+and run them from the root of the repository:
+
+    python benchmarks/bench_ops.py --tiles 100000
+"""
+
+import random
+import time
+
+from pymbtiles import MBtiles, Tile
+
+
+def random_bytes(rng, size):
+    """Return size random bytes from rng, so that data are the same between runs."""
+
+    return rng.getrandbits(8 * size).to_bytes(size, "little") if size else b""
+
+
+def synthetic_tiles(num_tiles, duplicate_ratio=0.5, tile_size=1024, zoom=None, seed=0):
+    """Generate Tile objects with random data.
+
+    Parameters
+    ----------
+    num_tiles : int
+        number of tiles to generate
+    duplicate_ratio : float, optional (default: 0.5)
+        fraction of tiles that reuse the data of a previous tile
+    tile_size : int, optional (default: 1024)
+        size of each tile in bytes
+    zoom : int, optional (default: None)
+        zoom level of tiles.  If None, the lowest zoom level that can hold
+        num_tiles is used.
+    seed : int, optional (default: 0)
+        random seed, so that tiles and their data are the same between runs
+
+    Returns
+    -------
+    generator of Tile objects in (x, y) order
+    """
+
+    rng = random.Random(seed)
+
+    if zoom is None:
+        zoom = 0
+        while 4 ** zoom < num_tiles:
+            zoom += 1
+
+    width = 2 ** zoom
+    if num_tiles > width * width:
+        raise ValueError("zoom level {} cannot hold {} tiles".format(zoom, num_tiles))
+
+    # a small pool of shared blobs stands in for ocean / blank tiles
+    shared = [random_bytes(rng, tile_size) for _ in range(16)]
+
+    for i in range(num_tiles):
+        if rng.random() < duplicate_ratio:
+            data = shared[rng.randrange(len(shared))]
+        else:
+            data = random_bytes(rng, tile_size)
+
+        yield Tile(zoom, i // width, i % width, data)
+
+
+def create_tileset(filename, num_tiles, batch_size=1000, **kwargs):
+    """Create a tileset at filename with synthetic tiles; kwargs are passed to
+    synthetic_tiles.
+    """
+
+    tiles = synthetic_tiles(num_tiles, **kwargs)
+    with MBtiles(filename, mode="w") as out:
+        while True:
+            batch = [tile for _, tile in zip(range(batch_size), tiles)]
+            if not batch:
+                break
+            out.write_tiles(batch)
+
+
+def timed(func, *args, **kwargs):
+    """Call func and return the elapsed time in seconds."""
+
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def report(name, seconds, count=None, unit="tiles"):
+    if count:
+        print(
+            "{:<40} {:>10.3f} s {:>14,.0f} {}/s".format(
+                name, seconds, count / seconds, unit
+            )
+        )
+    else:
+        print("{:<40} {:>10.3f} s".format(name, seconds))
@@ -0,0 +1,98 @@
+"""Compare benchmark results written by suite.py.
+
+    python benchmarks/compare.py baseline.json results.json --threshold 0.1
+
+Exits with status 1 if --fail is used and any benchmark is slower than the
+baseline by more than the threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare the best throughput of each benchmark present in both results.
+
+    Returns
+    -------
+    list of (name, baseline tiles/s, current tiles/s, change, regressed)
+    """
+
+    rows = []
+    for name in sorted(set(baseline["results"]) & set(current["results"])):
+        before = baseline["results"][name]["tiles_per_second"]
+        after = current["results"][name]["tiles_per_second"]
+        if not (before and after):
+            continue
+
+        change = after / before - 1
+        rows.append((name, before, after, change, change < -threshold))
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction of throughput lost that counts as a regression",
+    )
+    parser.add_argument(
+        "--fail", action="store_true", help="exit with status 1 on regressions"
+    )
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+
+    if baseline["parameters"] != current["parameters"]:
+        print("warning: results were run with different parameters")
+        for key in sorted(set(baseline["parameters"]) | set(current["parameters"])):
+            before = baseline["parameters"].get(key)
+            after = current["parameters"].get(key)
+            if before != after:
+                print("    {}: {} -> {}".format(key, before, after))
+
+    for key in ("python", "sqlite", "machine"):
+        before = baseline["environment"].get(key)
+        after = current["environment"].get(key)
+        if before != after:
+            print("warning: {} differs: {} -> {}".format(key, before, after))
+
+    print(
+        "{:<28} {:>14} {:>14} {:>8}".format(
+            "benchmark", "baseline/s", "current/s", "change"
+        )
+    )
+
+    regressions = 0
+    for name, before, after, change, regressed in compare(
+        baseline, current, args.threshold
+    ):
+        regressions += regressed
+        print(
+            "{:<28} {:>14,.0f} {:>14,.0f} {:>+7.1%}{}".format(
+                name, before, after, change, "  REGRESSION" if regressed else ""
+            )
+        )
+
+    if args.fail and regressions:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
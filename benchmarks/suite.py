@@ -0,0 +1,319 @@
+"""Run the benchmark suite of read, write, and ops hot paths and write the
+results as JSON, to compare between runs with compare.py:
+
+    python benchmarks/suite.py --scale medium --output results.json
+    python benchmarks/compare.py baseline.json results.json
+
+Tiles are generated from a fixed seed, so runs with the same parameters use
+the same tiles.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+from pymbtiles import MBtiles
+from pymbtiles.ops import difference, extend, union
+
+from common import create_tileset, report, synthetic_tiles
+
+# Number of tiles in each tileset, by scale
+SCALES = {
+    "small": 10000,
+    "medium": 100000,
+    "large": 1000000,
+    "xlarge": 10000000,
+}
+
+# Maximum number of tiles written by write_tile (one transaction per tile) and
+# read by read_tile, so that those benchmarks finish at larger scales
+MAX_SINGLE_TILES = 10000
+MAX_READS = 100000
+
+RESULTS_VERSION = 1
+
+
+class Context(object):
+    """Parameters and files shared by benchmarks in a run."""
+
+    def __init__(self, tmpdir, num_tiles, tile_size, duplicate_ratio, batch_size):
+        self.tmpdir = tmpdir
+        self.num_tiles = num_tiles
+        self.tile_size = tile_size
+        self.duplicate_ratio = duplicate_ratio
+        self.batch_size = batch_size
+        self.source = os.path.join(tmpdir, "source.mbtiles")
+        self.other = os.path.join(tmpdir, "other.mbtiles")
+
+    def tiles(self, num_tiles=None, seed=0):
+        return synthetic_tiles(
+            num_tiles or self.num_tiles,
+            duplicate_ratio=self.duplicate_ratio,
+            tile_size=self.tile_size,
+            seed=seed,
+        )
+
+    def path(self, name):
+        filename = os.path.join(self.tmpdir, name)
+        if os.path.exists(filename):
+            os.remove(filename)
+        return filename
+
+    def setup(self):
+        create_tileset(
+            self.source,
+            self.num_tiles,
+            batch_size=self.batch_size,
+            duplicate_ratio=self.duplicate_ratio,
+            tile_size=self.tile_size,
+        )
+
+        # other tileset overlaps the second half of source
+        half = self.num_tiles // 2
+        create_tileset(
+            self.other,
+            self.num_tiles + half,
+            batch_size=self.batch_size,
+            duplicate_ratio=self.duplicate_ratio,
+            tile_size=self.tile_size,
+            seed=1,
+        )
+        with MBtiles(self.other, "r+") as src:
+            src._cursor.execute("DELETE FROM map WHERE rowid <= ?", (half,))
+
+
+def bench_write_tile(ctx):
+    tiles = list(ctx.tiles(min(ctx.num_tiles, MAX_SINGLE_TILES)))
+    with MBtiles(ctx.path("out.mbtiles"), "w") as out:
+        start = time.perf_counter()
+        for tile in tiles:
+            out.write_tile(*tile)
+        return time.perf_counter() - start, len(tiles)
+
+
+def bench_write_tiles(ctx):
+    # tiles are generated before each batch is timed, so that only writes are
+    # measured and memory use does not depend on the number of tiles
+    tiles = ctx.tiles()
+    seconds = 0
+    with MBtiles(ctx.path("out.mbtiles"), "w") as out:
+        while True:
+            batch = list(islice(tiles, ctx.batch_size))
+            if not batch:
+                break
+
+            start = time.perf_counter()
+            out.write_tiles(batch)
+            seconds += time.perf_counter() - start
+
+    return seconds, ctx.num_tiles
+
+
+def _read_coords(ctx):
+    with MBtiles(ctx.source) as src:
+        coords = []
+        for batch in src.list_tiles_batched(ctx.batch_size):
+            coords.extend(batch)
+            if len(coords) >= MAX_READS:
+                break
+    return coords[:MAX_READS]
+
+
+def _read(filename, coords):
+    with MBtiles(filename) as src:
+        start = time.perf_counter()
+        for z, x, y in coords:
+            src.read_tile(z, x, y)
+        return time.perf_counter() - start, len(coords)
+
+
+def bench_read_tile_sequential(ctx):
+    return _read(ctx.source, _read_coords(ctx))
+
+
+def bench_read_tile_random(ctx):
+    coords = _read_coords(ctx)
+    random.Random(0).shuffle(coords)
+    return _read(ctx.source, coords)
+
+
+def bench_list_tiles_batched(ctx):
+    with MBtiles(ctx.source) as src:
+        start = time.perf_counter()
+        count = sum(len(batch) for batch in src.list_tiles_batched(ctx.batch_size))
+        return time.perf_counter() - start, count
+
+
+def bench_list_tiles_batched_data(ctx):
+    with MBtiles(ctx.source) as src:
+        start = time.perf_counter()
+        count = sum(
+            len(batch) for batch in src.list_tiles_batched(ctx.batch_size, data=True)
+        )
+        return time.perf_counter() - start, count
+
+
+def bench_extend(ctx):
+    target = ctx.path("target.mbtiles")
+    shutil.copy(ctx.source, target)
+    start = time.perf_counter()
+    extend(ctx.other, target, batch_size=ctx.batch_size)
+    return time.perf_counter() - start, ctx.num_tiles
+
+
+def bench_union(ctx):
+    out = ctx.path("out.mbtiles")
+    start = time.perf_counter()
+    union(ctx.source, ctx.other, out, batch_size=ctx.batch_size)
+    return time.perf_counter() - start, 2 * ctx.num_tiles
+
+
+def bench_difference(ctx):
+    out = ctx.path("out.mbtiles")
+    start = time.perf_counter()
+    difference(ctx.source, ctx.other, out, batch_size=ctx.batch_size)
+    return time.perf_counter() - start, ctx.num_tiles
+
+
+# Benchmarks in the order they are run.  Each takes a Context and returns
+# (seconds, number of tiles).
+BENCHMARKS = [
+    ("write_tile", bench_write_tile),
+    ("write_tiles", bench_write_tiles),
+    ("read_tile_sequential", bench_read_tile_sequential),
+    ("read_tile_random", bench_read_tile_random),
+    ("list_tiles_batched", bench_list_tiles_batched),
+    ("list_tiles_batched_data", bench_list_tiles_batched_data),
+    ("extend", bench_extend),
+    ("union", bench_union),
+    ("difference", bench_difference),
+]
+
+
+def _git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("ascii")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": _git_commit(),
+    }
+
+
+def run(ctx, names, repeat):
+    """Run each benchmark in names repeat times and return results by name."""
+
+    results = {}
+    for name, func in BENCHMARKS:
+        if name not in names:
+            continue
+
+        timings = [func(ctx) for _ in range(repeat)]
+        seconds = sorted(t[0] for t in timings)
+        count = timings[0][1]
+        best = seconds[0]
+
+        results[name] = {
+            "count": count,
+            "seconds": seconds,
+            "best": best,
+            "median": seconds[len(seconds) // 2],
+            "tiles_per_second": count / best if best else None,
+        }
+        report(name, best, count)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument(
+        "--tiles", type=int, default=None, help="number of tiles; overrides --scale"
+    )
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--duplicates", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=[name for name, _ in BENCHMARKS],
+        help="run only these benchmarks",
+    )
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument(
+        "--tmpdir", help="directory for tilesets; defaults to the system default"
+    )
+    args = parser.parse_args()
+
+    num_tiles = args.tiles or SCALES[args.scale]
+    names = set(args.only or [name for name, _ in BENCHMARKS])
+    parameters = {
+        "tiles": num_tiles,
+        "tile_size": args.tile_size,
+        "duplicate_ratio": args.duplicates,
+        "batch_size": args.batch_size,
+        "repeat": args.repeat,
+    }
+
+    tmpdir = tempfile.mkdtemp(dir=args.tmpdir)
+    try:
+        ctx = Context(
+            tmpdir, num_tiles, args.tile_size, args.duplicates, args.batch_size
+        )
+        print(
+            "{:,} tiles of {:,} bytes, {:.0%} duplicates, best of {}".format(
+                num_tiles, args.tile_size, args.duplicates, args.repeat
+            )
+        )
+        ctx.setup()
+        results = run(ctx, names, args.repeat)
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "version": RESULTS_VERSION,
+                    "environment": environment(),
+                    "parameters": parameters,
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
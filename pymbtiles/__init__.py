@@ -1,10 +1,16 @@
 import hashlib
+import json
 import logging
+import math
 import os
+import re
 import sys
 import sqlite3
 from collections import namedtuple
 
+from pymbtiles.cache import NOT_CACHED
+from pymbtiles.compression import detect_codec, get_codec
+
 logger = logging.getLogger("pymbtiles")
 
 IS_PY2 = sys.version_info[0] == 2
@@ -12,6 +18,228 @@ IS_PY2 = sys.version_info[0] == 2
 
 Tile = namedtuple("Tile", ["z", "x", "y", "data"])
 TileCoordinate = namedtuple("TileCoordinate", ["z", "x", "y"])
+ZoomStats = namedtuple(
+    "ZoomStats",
+    [
+        "zoom_level",
+        "tile_count",
+        "min_column",
+        "max_column",
+        "min_row",
+        "max_row",
+        "total_bytes",
+        "min_bytes",
+        "max_bytes",
+        "size_histogram",
+    ],
+)
+
+# Number of tiles looked up per query in read_tiles; keeps the number of bound
+# parameters below the SQLite default limit (999) of older versions.
+READ_CHUNK_SIZE = 300
+
+# Connection settings applied when opening an mbtiles file, by profile name.
+# Each profile is a list of (pragma, value) pairs, applied in order.
+PROFILES = {
+    # fastest writes; no journal, so a crash during a write can corrupt the
+    # file, and other connections cannot read the file while it is open
+    "bulk_load": [
+        ("synchronous", "OFF"),
+        ("journal_mode", "OFF"),
+        ("locking_mode", "EXCLUSIVE"),
+        ("temp_store", "MEMORY"),
+        ("cache_size", -65536),
+    ],
+    # write-ahead log, so readers in other connections or processes can read
+    # the file while it is being written to, and writes survive a crash
+    "wal_concurrent": [
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("locking_mode", "NORMAL"),
+        ("wal_autocheckpoint", 1000),
+        ("temp_store", "MEMORY"),
+        ("cache_size", -65536),
+        ("mmap_size", 268435456),
+    ],
+    # reading tiles from many connections; only valid for mode 'r'
+    "readonly_serving": [
+        ("query_only", "ON"),
+        ("locking_mode", "NORMAL"),
+        ("cache_size", -65536),
+        ("mmap_size", 1073741824),
+    ],
+    # rollback journal with full fsync; slowest writes, safest against crashes
+    "safe": [
+        ("journal_mode", "DELETE"),
+        ("synchronous", "FULL"),
+        ("locking_mode", "NORMAL"),
+    ],
+}
+
+DEFAULT_PROFILE = "bulk_load"
+
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+VACUUM_MODES = ("incremental", "full")
+
+_FILE_FORMAT_PRAGMAS = ("page_size", "auto_vacuum")
+_WRITE_PRAGMAS = _FILE_FORMAT_PRAGMAS + ("journal_mode",)
+
+_PRAGMA_NAME = re.compile(r"^[a-z_]+$")
+_PRAGMA_VALUE = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+
+# Indexes not maintained while writing tiles with defer_indexes:
+# (name, table, columns)
+DEFERRED_INDEXES = (
+    ("map_index", "map", "zoom_level, tile_column, tile_row"),
+    ("images_id", "images", "tile_id"),
+)
+
+# Cache of ZoomStats by zoom level, created on first use by MBtiles.stats
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tile_stats (
+    zoom_level INTEGER PRIMARY KEY,
+    tile_count INTEGER,
+    min_column INTEGER,
+    max_column INTEGER,
+    min_row INTEGER,
+    max_row INTEGER,
+    total_bytes INTEGER,
+    min_bytes INTEGER,
+    max_bytes INTEGER,
+    size_histogram TEXT
+)
+"""
+
+# Tile schemes.  mbtiles files store rows in the TMS scheme, where row 0 is
+# the southernmost row; most web maps use the XYZ scheme, where row 0 is the
+# northernmost row.
+SCHEMES = ("xyz", "tms")
+
+# Metadata keys of the scheme of rows stored in the file (if not TMS), and of
+# a rewrite between schemes that has not finished
+SCHEME_KEY = "scheme"
+SCHEME_REWRITE_KEY = "scheme_rewrite"
+
+# Maximum number of tile_ids remembered per MBtiles instance to skip writing
+# duplicate tile data; the set is cleared when this is exceeded.
+MAX_KNOWN_TILE_IDS = 1000000
+
+
+def _validate_scheme(scheme):
+    if scheme not in SCHEMES:
+        raise ValueError("scheme must be one of: {0}".format(", ".join(SCHEMES)))
+
+
+def flip_y(z, y):
+    """
+    Convert tile rows between the TMS and XYZ tile schemes.
+
+    Parameters
+    ----------
+    z: int, or array of int
+        zoom level of each tile
+    y: int, or array of int
+        tile row of each tile.  Arrays may be numpy arrays (converted using
+        numpy operations), or sequences such as array.array or lists.
+
+    Returns
+    -------
+    int, numpy array of int64 if z or y is a numpy array, or list of int
+    """
+
+    if hasattr(y, "astype") or hasattr(z, "astype"):
+        # numpy is present if either is a numpy array
+        import numpy as np
+
+        z = np.asarray(z, dtype="int64")
+        return (1 << z) - 1 - np.asarray(y, dtype="int64")
+
+    if isinstance(y, int) or (IS_PY2 and isinstance(y, long)):  # noqa: F821
+        return (1 << z) - 1 - y
+
+    if isinstance(z, int):
+        return [(1 << z) - 1 - row for row in y]
+
+    return [(1 << zoom) - 1 - row for zoom, row in zip(z, y)]
+
+
+def _tileset_meta(meta):
+    """Return metadata without the keys that describe how rows are stored in
+    an mbtiles file, which do not apply to tiles copied to another file."""
+
+    return {
+        key: value
+        for key, value in meta.items()
+        if key not in (SCHEME_KEY, SCHEME_REWRITE_KEY)
+    }
+
+
+def _validate_tile(z, x, y):
+    if z < 0 or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise ValueError("Invalid tile coordinates: {0}/{1}/{2}".format(z, x, y))
+
+
+def _lonlat_to_tile(lon, lat, z):
+    """Return the (column, row) of the tile containing lon, lat at zoom level
+    z, with rows in the TMS tile scheme used by mbtiles.
+    """
+
+    n = 2 ** z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int(
+        (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    )
+    x = max(min(x, n - 1), 0)
+    y = max(min(y, n - 1), 0)
+    return x, n - 1 - y
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def _blake2b(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _xxh128(data):
+    return xxhash.xxh3_128_hexdigest(data)
+
+
+# Functions available to calculate tile_id from tile data, by name.
+HASH_FUNCTIONS = {"sha1": _sha1, "md5": _md5}
+
+if hasattr(hashlib, "blake2b"):
+    HASH_FUNCTIONS["blake2b"] = _blake2b
+
+try:
+    import xxhash
+
+    HASH_FUNCTIONS["xxh128"] = _xxh128
+except ImportError:
+    pass
+
+
+def _prepare_tile(tile, hash_func=_sha1, codec=None):
+    """Return a (z, x, y, tile_id, data) row for inserting tile into the
+    database, where data are compressed using codec if present, and tile_id
+    is the hash of the data.
+    """
+
+    data = tile.data if codec is None else codec.compress(tile.data)
+    return (tile.z, tile.x, tile.y, hash_func(data), data)
+
+
+def _prepare_tiles(tiles, hash_func=_sha1, codec=None):
+    return [_prepare_tile(tile, hash_func, codec) for tile in tiles]
 
 
 class MBtiles(object):
@@ -22,30 +250,130 @@ class MBtiles(object):
     """
 
     class Metadata(dict):
-        def __init__(self, db, cursor, autoload=True):
+        """
+        Metadata of the tileset.  Keys that are set or deleted are written to
+        the metadata table by flush(), which is called when the mbtiles file
+        is closed, or within the transaction of the next tiles written.  While
+        a transaction session of mbtiles is open, flush() writes within it.
+        """
+
+        def __init__(self, db, cursor, autoload=True, mbtiles=None):
             self._db = db
             self._cursor = cursor
+            self._mbtiles = mbtiles
+            # keys set or deleted since the last flush
+            self._changed = set()
+            self._deleted = set()
             if autoload:
                 self._cursor.execute("SELECT name, value from metadata")
                 dict.update(self, {row[0]: row[1] for row in self._cursor.fetchall()})
 
         def __setitem__(self, k, v):
+            if k in self and self[k] == v:
+                return
             dict.__setitem__(self, k, v)
-            print("setting", k, v)
-            self._cursor.execute(
-                "INSERT OR REPLACE INTO metadata (name, value) values (?, ?)", (k, v)
-            )
-            self._db.commit()
+            self._changed.add(k)
+            self._deleted.discard(k)
+
+        def __delitem__(self, k):
+            dict.__delitem__(self, k)
+            self._changed.discard(k)
+            self._deleted.add(k)
 
         def update(self, *args, **kwargs):
-            dict.update(self, *args, **kwargs)
-            self._cursor.executemany(
-                "INSERT OR REPLACE INTO metadata (name, value) values (?, ?)",
-                self.items(),
-            )
-            self._db.commit()
+            for k, v in dict(*args, **kwargs).items():
+                self[k] = v
+
+        def setdefault(self, k, default=None):
+            if k not in self:
+                self[k] = default
+            return self[k]
+
+        def pop(self, k, *args):
+            if k not in self:
+                return dict.pop(self, k, *args)
+            value = self[k]
+            del self[k]
+            return value
+
+        def popitem(self):
+            k, v = dict.popitem(self)
+            self._changed.discard(k)
+            self._deleted.add(k)
+            return k, v
+
+        def clear(self):
+            self._deleted.update(self)
+            self._changed.clear()
+            dict.clear(self)
+
+        @property
+        def dirty(self):
+            """True if there are changes that have not been written."""
+
+            return bool(self._changed or self._deleted)
+
+        def _write(self):
+            """Write changes; caller manages the transaction."""
+
+            if self._deleted:
+                self._cursor.executemany(
+                    "DELETE FROM metadata WHERE name=?", [(k,) for k in self._deleted]
+                )
+            if self._changed:
+                self._cursor.executemany(
+                    "INSERT OR REPLACE INTO metadata (name, value) values (?, ?)",
+                    [(k, self[k]) for k in self._changed],
+                )
+
+        def _mark_clean(self):
+            """Called after the transaction of _write is committed."""
+
+            self._changed = set()
+            self._deleted = set()
 
-    def __init__(self, filename, mode="r"):
+        def flush(self):
+            """
+            Write keys set or deleted since the last flush to the metadata
+            table, using a single transaction, or within the transaction
+            session of the mbtiles file if one is open.
+            """
+
+            if not self.dirty:
+                return
+
+            transaction = None if self._mbtiles is None else self._mbtiles._transaction
+            if transaction is not None:
+                transaction._write_meta(self)
+                return
+
+            self._cursor.execute("BEGIN")
+            try:
+                self._write()
+                self._cursor.execute("COMMIT")
+
+            except self._db.Error:
+                self._cursor.execute("ROLLBACK")
+                raise
+
+            self._mark_clean()
+
+    def __init__(
+        self,
+        filename,
+        mode="r",
+        profile=DEFAULT_PROFILE,
+        pragmas=None,
+        immutable=False,
+        check_same_thread=True,
+        cache=None,
+        tile_id_hash="sha1",
+        defer_indexes=False,
+        compression=None,
+        compression_level=None,
+        decompress=False,
+        scheme="tms",
+    ):
         """
         Creates an open mbtiles file.  Must be closed after all data are added.
 
@@ -55,12 +383,105 @@ class MBtiles(object):
             name of output mbtiles file
         mode: string, one of ('r', 'w', 'r+')
             if 'w', existing mbtiles file will be deleted first
+        profile: string, one of PROFILES (default: 'bulk_load')
+            name of the set of connection settings (journal mode, locking mode,
+            cache size, etc) used for this file.  See PROFILES.
+        pragmas: dict or list of (name, value) pairs, optional (default: None)
+            additional SQLite PRAGMA settings, applied after those of the profile.
+            page_size only takes effect for new files.
+        immutable: bool, optional (default: False)
+            if True, the file is opened as immutable: SQLite does not lock or
+            check the file for changes, and the whole file is memory-mapped.
+            Only valid for mode 'r', and only safe if nothing else writes to
+            the file while it is open.
+        check_same_thread: bool, optional (default: True)
+            if False, this instance may be used from threads other than the one
+            that created it.  Caller is responsible for making sure it is used
+            by only one thread at a time.
+        cache: TileCache, optional (default: None)
+            if present, tiles read are cached in and read from this cache.
+            Tiles written are removed from the cache.
+        tile_id_hash: string, one of HASH_FUNCTIONS, or function (default: 'sha1')
+            hash used to calculate tile_id of tiles written, which identifies
+            tiles with the same tile data.  A function must take tile data
+            bytes and return a string, and must be defined at module level to
+            be used with parallel_writer(processes=True).  Use the same hash for
+            all writes to a file so that duplicate tiles are stored once.
+        defer_indexes: bool, optional (default: False)
+            if True, the indexes of the map and images tables are built once
+            when the file is closed (or build_indexes is called) instead of
+            being updated for each tile written.  This is much faster for
+            writing many tiles to a new file, but reading tiles before the
+            indexes are built is slow.  Only valid for mode 'w'.
+        compression: string or Codec, optional (default: None)
+            if present, tile data are compressed with this codec when written
+            (e.g., 'gzip' for vector tiles); see compression.CODECS.  Data
+            passed to write_tile and write_tiles must not already be compressed.
+        compression_level: int, optional (default: None)
+            compression level; if None, the default level of the codec is used
+        decompress: bool, optional (default: False)
+            if True, tile data are decompressed when read.  Uses the codec of
+            compression if present, otherwise gzip or zstd are detected from
+            the data of each tile (see compression.detect_codec) and other
+            tiles are returned as is.
+        scheme: string, one of SCHEMES (default: 'tms')
+            tile scheme of the tile rows passed to and returned by this
+            instance.  Rows are converted if the file stores rows in the other
+            scheme (see rewrite_scheme); files store rows in the TMS scheme
+            unless their metadata include scheme=xyz.
         """
 
         self.mode = mode
         if mode not in ("r", "w", "r+"):
             raise ValueError("Mode must be r, w, or r+")
 
+        if profile not in PROFILES:
+            raise ValueError(
+                "profile must be one of: {0}".format(", ".join(sorted(PROFILES)))
+            )
+
+        settings = list(PROFILES[profile])
+        if pragmas:
+            settings.extend(pragmas.items() if hasattr(pragmas, "items") else pragmas)
+
+        if mode != "r" and ("query_only", "ON") in settings:
+            raise ValueError("profile {0} can only be used in mode r".format(profile))
+
+        if immutable and mode != "r":
+            raise ValueError("immutable can only be used in mode r")
+
+        if defer_indexes and mode != "w":
+            raise ValueError("defer_indexes can only be used in mode w")
+
+        if callable(tile_id_hash):
+            self._hash_func = tile_id_hash
+        elif tile_id_hash in HASH_FUNCTIONS:
+            self._hash_func = HASH_FUNCTIONS[tile_id_hash]
+        else:
+            raise ValueError(
+                "tile_id_hash must be a function or one of: {0}".format(
+                    ", ".join(sorted(HASH_FUNCTIONS))
+                )
+            )
+
+        self._codec = (
+            get_codec(compression, compression_level) if compression else None
+        )
+        self._decompress = decompress
+
+        _validate_scheme(scheme)
+        self.scheme = scheme
+
+        self.profile = profile
+        self.cache = cache
+
+        # tile_ids known to be in images, so their data need not be written
+        self._known_tile_ids = set()
+        # open Transaction, if any
+        self._transaction = None
+        self._tiles_written = 0
+        self._images_written = 0
+
         if os.path.exists(filename):
             if mode == "w":
                 os.remove(filename)
@@ -68,21 +489,33 @@ class MBtiles(object):
             raise IOError("mbtiles not found: {0}".format(filename))
 
         if IS_PY2:  # pragma: no cover
-            self._db = sqlite3.connect(filename, isolation_level=None)
+            self._db = sqlite3.connect(
+                filename, isolation_level=None, check_same_thread=check_same_thread
+            )
 
         else:
             connect_mode = "ro" if mode == "r" else "rwc"
+            if immutable:
+                connect_mode += "&immutable=1"
+                settings.append(("mmap_size", os.path.getsize(filename)))
+
             self._db = sqlite3.connect(
                 "file:{0}?mode={1}".format(filename, connect_mode),
                 uri=True,
                 isolation_level=None,
+                check_same_thread=check_same_thread,
             )
 
         self._cursor = self._db.cursor()
 
-        self._cursor.execute("PRAGMA synchronous=OFF")
-        self._cursor.execute("PRAGMA journal_mode=OFF")  # TODO: DELETE or WAL?
-        self._cursor.execute("PRAGMA locking_mode=EXCLUSIVE")
+        # page_size and auto_vacuum must be set before the journal mode is
+        # changed to WAL or any tables are created
+        settings.sort(key=lambda setting: setting[0] not in _FILE_FORMAT_PRAGMAS)
+        for name, value in settings:
+            # these change the file, which is not possible in mode r
+            if mode == "r" and name in _WRITE_PRAGMAS:
+                continue
+            self._set_pragma(name, value)
 
         # initialize tables if needed
         if mode != "r":
@@ -92,28 +525,127 @@ class MBtiles(object):
             self._cursor.executescript(schema)
             self._db.commit()
 
-        self._meta = self.Metadata(self._db, self._cursor)
+        # tiles may be stored in a tiles table instead of map and images
+        self._cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name IN ('map', 'tiles', 'tile_stats', 'metadata')"
+        )
+        tables = {row[0] for row in self._cursor.fetchall()}
+        # opening in mode r+ adds empty map and images tables
+        if "map" in tables and "tiles" not in tables:
+            self._coords_table = "map"
+        else:
+            self._coords_table = "tiles"
+        self._has_stats_table = "tile_stats" in tables
+        self._has_metadata_table = "metadata" in tables
+        self._stats = {}
+        self._written_zooms = set()
+
+        self._indexes_deferred = defer_indexes
+        if defer_indexes:
+            for index, _, _ in DEFERRED_INDEXES:
+                self._cursor.execute("DROP INDEX {0}".format(index))
+
+        self._read_stored_scheme()
+
+        # metadata are loaded on first use
+        self._meta = None
+
+    def _read_stored_scheme(self):
+        """Read the scheme of rows stored in the file from its metadata."""
+
+        meta = {}
+        if self._has_metadata_table:
+            meta = dict(
+                self._cursor.execute(
+                    "SELECT name, value FROM metadata WHERE name IN (?, ?)",
+                    (SCHEME_KEY, SCHEME_REWRITE_KEY),
+                ).fetchall()
+            )
+
+        if SCHEME_REWRITE_KEY in meta and self.mode == "r":
+            self._db.close()
+            raise ValueError(
+                "Rewrite of tile rows between schemes has not finished; open in "
+                "mode r+ and call rewrite_scheme to finish"
+            )
+
+        self._stored_scheme = meta.get(SCHEME_KEY, "tms")
+        self._flip = self._stored_scheme != self.scheme
+
+        # rows of tiles read, in the scheme of this instance
+        if self._flip:
+            self._row_sql = "((1 << zoom_level) - 1 - tile_row)"
+        else:
+            self._row_sql = "tile_row"
+
+    def _row(self, z, y):
+        """Convert a tile row between the scheme of this instance and the
+        scheme stored in the file."""
+
+        return (1 << z) - 1 - y if self._flip else y
 
     def __enter__(self):
         return self
 
+    def _set_pragma(self, name, value):
+        # PRAGMA statements do not support bound parameters
+        if not (_PRAGMA_NAME.match(name) and _PRAGMA_VALUE.match(str(value))):
+            raise ValueError("Invalid pragma: {0}={1}".format(name, value))
+
+        self._cursor.execute("PRAGMA {0}={1}".format(name, value))
+        self._cursor.fetchall()
+
+    def checkpoint(self, mode="PASSIVE"):
+        """
+        Checkpoint the write-ahead log into the database file.  Only has an
+        effect for files using journal_mode WAL (e.g., profile 'wal_concurrent').
+
+        Parameters
+        ----------
+        mode: string, one of CHECKPOINT_MODES (default: 'PASSIVE')
+            SQLite checkpoint mode.  'TRUNCATE' also truncates the log file.
+
+        Returns
+        -------
+        tuple of (busy, log pages, checkpointed pages); busy is 1 if the
+        checkpoint could not complete because of other connections.
+        """
+
+        mode = mode.upper()
+        if mode not in CHECKPOINT_MODES:
+            raise ValueError(
+                "mode must be one of: {0}".format(", ".join(CHECKPOINT_MODES))
+            )
+
+        return tuple(
+            self._cursor.execute("PRAGMA wal_checkpoint({0})".format(mode)).fetchone()
+        )
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
     @property
     def meta(self):
+        if self._meta is None:
+            self._meta = self.Metadata(self._db, self._cursor, mbtiles=self)
         return self._meta
 
     @meta.setter
     def meta(self, value):
-        self._meta = self.Metadata(self._db, self._cursor, autoload=False)
+        # existing keys not in value are kept in the metadata table
+        if self._meta is not None:
+            self._meta.flush()
+        self._meta = self.Metadata(
+            self._db, self._cursor, autoload=False, mbtiles=self
+        )
         self._meta.update(value)
 
     def has_tile(self, z, x, y):
         self._cursor.execute(
             "SELECT EXISTS (SELECT 1 FROM tiles "
             "where zoom_level=? and tile_column=? and tile_row=? LIMIT 1)",
-            (z, x, y),
+            (z, x, self._row(z, y)),
         )
 
         row = self._cursor.fetchone()
@@ -129,7 +661,9 @@ class MBtiles(object):
         list of TileCoordinate objects
         """
 
-        self._cursor.execute("select zoom_level, tile_column, tile_row from tiles")
+        self._cursor.execute(
+            "select zoom_level, tile_column, {0} from tiles".format(self._row_sql)
+        )
         return [TileCoordinate(*tile) for tile in self._cursor.fetchall()]
 
     def zoom_range(self):
@@ -138,7 +672,8 @@ class MBtiles(object):
 
         return tuple(
             self._cursor.execute(
-                "select min(zoom_level), max(zoom_level) from tiles"
+                "SELECT (SELECT min(zoom_level) FROM {0}), "
+                "(SELECT max(zoom_level) FROM {0})".format(self._coords_table)
             ).fetchone()
         )
 
@@ -153,11 +688,17 @@ class MBtiles(object):
             zoom level to query for available rows
         """
 
+        min_row, max_row = self._stored_row_range(z)
+        if self._flip and min_row is not None:
+            return self._row(z, max_row), self._row(z, min_row)
+        return min_row, max_row
+
+    def _stored_row_range(self, z):
         return tuple(
             self._cursor.execute(
-                "select min(tile_row), max(tile_row) from tiles where zoom_level = {}".format(
-                    z
-                )
+                "SELECT min(tile_row), max(tile_row) FROM {0} "
+                "WHERE zoom_level=?".format(self._coords_table),
+                (z,),
             ).fetchone()
         )
 
@@ -174,41 +715,263 @@ class MBtiles(object):
 
         return tuple(
             self._cursor.execute(
-                "select min(tile_column), max(tile_column) from tiles where zoom_level = {}".format(
-                    z
-                )
+                "SELECT (SELECT min(tile_column) FROM {0} WHERE zoom_level=?), "
+                "(SELECT max(tile_column) FROM {0} WHERE zoom_level=?)".format(
+                    self._coords_table
+                ),
+                (z, z),
             ).fetchone()
         )
 
-    def list_tiles_batched(self, batch_size=1000):
+    def _zoom_levels(self):
+        """Return zoom levels present in the tileset, using one index lookup
+        per zoom level.
+        """
+
+        zooms = []
+        z = self._cursor.execute(
+            "SELECT min(zoom_level) FROM {0}".format(self._coords_table)
+        ).fetchone()[0]
+        while z is not None:
+            zooms.append(z)
+            z = self._cursor.execute(
+                "SELECT min(zoom_level) FROM {0} WHERE zoom_level > ?".format(
+                    self._coords_table
+                ),
+                (z,),
+            ).fetchone()[0]
+
+        return zooms
+
+    def _zoom_stats(self, z):
+        """Calculate ZoomStats for zoom level z, with rows as stored."""
+
+        min_col, max_col = self.col_range(z)
+        min_row, max_row = self._stored_row_range(z)
+
+        # tile sizes are aggregated in SQLite, which reads the size of each
+        # tile without reading its data
+        self._cursor.execute(
+            "SELECT length(tile_data), count(*) FROM tiles "
+            "WHERE zoom_level=? GROUP BY 1",
+            (z,),
+        )
+
+        count = 0
+        total_bytes = 0
+        histogram = {}
+        sizes = []
+        for size, size_count in self._cursor.fetchall():
+            size = size or 0
+            sizes.append(size)
+            count += size_count
+            total_bytes += size * size_count
+            bucket = 1 << (size - 1).bit_length() if size else 0
+            histogram[bucket] = histogram.get(bucket, 0) + size_count
+
+        return ZoomStats(
+            z,
+            count,
+            min_col,
+            max_col,
+            min_row,
+            max_row,
+            total_bytes,
+            min(sizes) if sizes else None,
+            max(sizes) if sizes else None,
+            histogram,
+        )
+
+    def stats(self, refresh=False):
+        """Return statistics of the tiles at each zoom level.
+
+        Statistics are calculated for each zoom level the first time they are
+        requested, and cached in the tile_stats table of the file in modes
+        'w' and 'r+'.  Writing tiles at a zoom level removes its cached
+        statistics, so that only those zoom levels are calculated again.
+        Use refresh=True if tiles were changed by other tools.
+
+        Parameters
+        ----------
+        refresh : bool, optional (default: False)
+            if True, calculate statistics for all zoom levels again
+
+        Returns
+        -------
+        dict of zoom level to ZoomStats(zoom_level, tile_count, min_column,
+        max_column, min_row, max_row, total_bytes, min_bytes, max_bytes,
+        size_histogram), where size_histogram is a dict of the upper bound
+        (a power of 2) of each tile size bucket to the number of tiles in that
+        bucket.
+        """
+
+        writable = self.mode != "r"
+        if writable and not self._has_stats_table:
+            self._cursor.execute(STATS_SCHEMA)
+            self._has_stats_table = True
+
+        if refresh:
+            self._stats = {}
+            if writable:
+                self._cursor.execute("DELETE FROM tile_stats")
+
+        elif self._has_stats_table:
+            self._cursor.execute(
+                "SELECT {0} FROM tile_stats".format(", ".join(ZoomStats._fields))
+            )
+            for row in self._cursor.fetchall():
+                row = list(row)
+                row[-1] = {int(k): v for k, v in json.loads(row[-1]).items()}
+                self._stats[row[0]] = ZoomStats(*row)
+
+        stats = {}
+        for z in self._zoom_levels():
+            if z not in self._stats:
+                self._stats[z] = self._zoom_stats(z)
+                if writable:
+                    self._cursor.execute(
+                        "INSERT OR REPLACE INTO tile_stats ({0}) "
+                        "VALUES ({1})".format(
+                            ", ".join(ZoomStats._fields),
+                            ", ".join(["?"] * len(ZoomStats._fields)),
+                        ),
+                        self._stats[z][:-1] + (json.dumps(self._stats[z][-1]),),
+                    )
+
+            stats[z] = self._stats[z]
+            if self._flip:
+                stats[z] = stats[z]._replace(
+                    min_row=self._row(z, stats[z].max_row),
+                    max_row=self._row(z, stats[z].min_row),
+                )
+
+        return stats
+
+    def tiles_in_bbox(self, z, bbox):
+        """Return a list of TileCoordinate (z, x, y) tuples of tiles in the
+        tileset that intersect a geographic bounding box.
+
+        Parameters
+        ----------
+        z : int
+            zoom level
+        bbox : tuple of (west, south, east, north)
+            bounding box in longitude and latitude (WGS84) degrees
+
+        Returns
+        -------
+        list of TileCoordinate objects ordered by tile column then tile row
+        """
+
+        west, south, east, north = bbox
+        xmin, ymin = _lonlat_to_tile(west, south, z)
+        xmax, ymax = _lonlat_to_tile(east, north, z)
+        if self._stored_scheme == "xyz":
+            ymin, ymax = flip_y(z, ymax), flip_y(z, ymin)
+
+        self._cursor.execute(
+            "SELECT zoom_level, tile_column, {1} FROM {0} "
+            "WHERE zoom_level=? AND tile_column BETWEEN ? AND ? "
+            "AND tile_row BETWEEN ? AND ? "
+            "ORDER BY 2, 3".format(self._coords_table, self._row_sql),
+            (z, xmin, xmax, ymin, ymax),
+        )
+        return [TileCoordinate(*row) for row in self._cursor.fetchall()]
+
+    def list_tiles_batched(self, batch_size=1000, data=False):
         """Read a list of TileCoordinate (z, x, y) tuples from the tileset, in batches.
 
         Use this for larger tilesets to avoid reading all tiles into memory.
-        
+
+        Tiles are returned in (z, x, y) order of the rows stored in the file,
+        which is in descending order of y if rows are converted between
+        schemes (see scheme).  Batches are read using keyset
+        pagination over the map index, so reading each batch costs the same
+        regardless of how far into the tileset it is, and it is safe to read
+        or write other tiles between batches.
+
         Parameters
         ----------
-        batch_size : int, optional (default: None)
-            If present, tiles are read in batches using a generator.
-            Otherwise, tiles are returned as a generator.
-        
+        batch_size : int, optional (default: 1000)
+            number of tiles to read in each batch
+        data : bool, optional (default: False)
+            if True, each batch is a list of Tile objects including tile data
+
         Returns
         -------
         generator over each batch, each batch is a list of TileCoordinate objects
+        (or Tile objects if data is True)
         """
 
-        offset = 0
-        while True:
-            self._cursor.execute(
-                "select zoom_level, tile_column, tile_row from tiles limit {limit} offset {offset}".format(
-                    offset=offset, limit=batch_size
-                )
-            )
-            offset += batch_size
-            tiles = [TileCoordinate(z, x, y) for z, x, y in self._cursor.fetchall()]
-            if len(tiles):
-                yield tiles
-            else:
-                return
+        columns = "zoom_level, tile_column, " + self._row_sql
+        if data:
+            columns += ", tile_data"
+
+        query = (
+            "SELECT {columns} FROM tiles {where} "
+            "ORDER BY zoom_level, tile_column, tile_row LIMIT ?"
+        )
+        first_query = query.format(columns=columns, where="")
+        next_query = query.format(
+            columns=columns,
+            where="WHERE (zoom_level, tile_column, tile_row) > (?, ?, ?)",
+        )
+
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(first_query, (batch_size,))
+            while True:
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+
+                if data:
+                    yield [
+                        Tile(z, x, y, self._decode(str(d) if IS_PY2 else d))
+                        for z, x, y, d in rows
+                    ]
+                else:
+                    yield [TileCoordinate(*row) for row in rows]
+
+                if len(rows) < batch_size:
+                    return
+
+                z, x, y = rows[-1][:3]
+                cursor.execute(next_query, (z, x, self._row(z, y), batch_size))
+
+        finally:
+            cursor.close()
+
+    def iter_tiles(self, batch_size=1000, data=False):
+        """Iterate over tiles in the tileset in (z, x, y) order.
+
+        Tiles are read from the database in batches (see list_tiles_batched)
+        so that only a single batch is held in memory at a time.
+
+        Parameters
+        ----------
+        batch_size : int, optional (default: 1000)
+            number of tiles to read from the database at a time
+        data : bool, optional (default: False)
+            if True, yields Tile objects including tile data
+
+        Returns
+        -------
+        generator of TileCoordinate objects (or Tile objects if data is True)
+        """
+
+        for batch in self.list_tiles_batched(batch_size, data=data):
+            for tile in batch:
+                yield tile
+
+    def _decode(self, data):
+        """Decompress tile data read, if decompress is enabled."""
+
+        if data is None or not self._decompress:
+            return data
+
+        codec = self._codec or detect_codec(data)
+        return data if codec is None else codec.decompress(data)
 
     def read_tile(self, z, x, y):
         """
@@ -228,25 +991,185 @@ class MBtiles(object):
         tile data in bytes.  None if no tile exists.
         """
 
+        if self.cache is not None:
+            data = self.cache.get((z, x, y))
+            if data is not NOT_CACHED:
+                return self._decode(data)
+
         self._cursor.execute(
             "SELECT tile_data FROM tiles "
             "where zoom_level=? and tile_column=? and tile_row=? LIMIT 1",
-            (z, x, y),
+            (z, x, self._row(z, y)),
         )
 
         row = self._cursor.fetchone()
         if row is None:
+            data = None
+        elif IS_PY2:  # pragma: no cover
+            data = str(row[0])
+        else:
+            data = row[0]
+
+        if self.cache is not None:
+            self.cache.put((z, x, y), data)
+
+        return self._decode(data)
+
+    def read_tile_id(self, z, x, y):
+        """
+        Get the tile_id of a tile, which identifies its tile data: tiles with
+        the same tile_id have the same tile data.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        x: int
+            tile column
+        y: int
+            tile row
+
+        Returns
+        -------
+        string.  None if no tile exists, or if the tileset stores tiles in a
+        tiles table without tile_ids.
+        """
+
+        if self._coords_table != "map":
             return None
 
-        if IS_PY2:  # pragma: no cover
-            return str(row[0])
+        self._cursor.execute(
+            "SELECT tile_id FROM map "
+            "where zoom_level=? and tile_column=? and tile_row=? LIMIT 1",
+            (z, x, self._row(z, y)),
+        )
+
+        row = self._cursor.fetchone()
+        return None if row is None else row[0]
+
+    def _read_tile_and_id(self, z, x, y, length=None):
+        """Read the tile_id and tile data of a tile with a single query, so that
+        both are of the same version of the file.  The cache is not used.  If
+        length is present, only the first length bytes of tile data are
+        returned.  Returns (None, None) if no tile exists; tile_id is None if
+        the tileset stores tiles in a tiles table without tile_ids."""
+
+        data = "tile_data" if length is None else "substr(tile_data, 1, ?)"
+        if self._coords_table == "map":
+            query = (
+                "SELECT map.tile_id, {0} FROM map "
+                "JOIN images ON images.tile_id = map.tile_id "
+                "where zoom_level=? and tile_column=? and tile_row=? LIMIT 1"
+            )
+        else:
+            query = (
+                "SELECT NULL, {0} FROM tiles "
+                "where zoom_level=? and tile_column=? and tile_row=? LIMIT 1"
+            )
+
+        params = (z, x, self._row(z, y))
+        if length is not None:
+            params = (length,) + params
+        self._cursor.execute(query.format(data), params)
+
+        row = self._cursor.fetchone()
+        if row is None:
+            return None, None
+        elif IS_PY2:  # pragma: no cover
+            return row[0], str(row[1])
+        return row[0], row[1]
+
+    def read_tiles(self, coords):
+        """
+        Get tiles for many (z, x, y) values at once.
+
+        Coordinates are looked up in chunks using a single query per chunk,
+        which is much faster than calling read_tile for each tile.
+
+        Parameters
+        ----------
+        coords: iterable of TileCoordinate(z, x, y) tuples
+
+        Returns
+        -------
+        list of Tile objects, in the same order as coords.  data is None
+        for tiles that do not exist in the tileset.
+        """
+
+        coords = [TileCoordinate(*c) for c in coords]
+        found = {}
+
+        to_read = coords
+        if self.cache is not None:
+            to_read = []
+            for c in coords:
+                data = self.cache.get(c)
+                if data is NOT_CACHED:
+                    to_read.append(c)
+                else:
+                    found[c] = data
 
-        return row[0]
+        # rows are converted between schemes in the join
+        row = "((1 << z) - 1 - y)" if self._flip else "y"
+        for i in range(0, len(to_read), READ_CHUNK_SIZE):
+            chunk = to_read[i : i + READ_CHUNK_SIZE]
+            query = (
+                "WITH coords (z, x, y) AS (VALUES {values}) "
+                "SELECT z, x, y, tile_data FROM coords "
+                "JOIN tiles ON zoom_level=z AND tile_column=x AND tile_row={row}"
+            ).format(values=", ".join(["(?, ?, ?)"] * len(chunk)), row=row)
+
+            self._cursor.execute(query, [value for c in chunk for value in c])
+            for z, x, y, data in self._cursor.fetchall():
+                found[(z, x, y)] = str(data) if IS_PY2 else data
+
+        if self.cache is not None:
+            for c in to_read:
+                self.cache.put(c, found.get(c))
+
+        return [Tile(*c, data=self._decode(found.get(c))) for c in coords]
+
+    def read_tiles_in_bbox(self, z, xmin, xmax, ymin, ymax):
+        """
+        Get all tiles available in a range of tile columns and rows at zoom
+        level z, using a single range query.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        xmin, xmax: int
+            minimum and maximum tile column (inclusive)
+        ymin, ymax: int
+            minimum and maximum tile row (inclusive)
+
+        Returns
+        -------
+        list of Tile objects ordered by tile column then tile row.  Tiles not
+        present in the tileset are omitted.
+        """
+
+        if self._flip:
+            ymin, ymax = self._row(z, ymax), self._row(z, ymin)
+
+        self._cursor.execute(
+            "SELECT zoom_level, tile_column, {0}, tile_data FROM tiles "
+            "WHERE zoom_level=? AND tile_column BETWEEN ? AND ? "
+            "AND tile_row BETWEEN ? AND ? "
+            "ORDER BY 2, 3".format(self._row_sql),
+            (z, xmin, xmax, ymin, ymax),
+        )
+
+        return [
+            Tile(z, x, y, self._decode(str(d) if IS_PY2 else d))
+            for z, x, y, d in self._cursor.fetchall()
+        ]
 
     def write_tile(self, z, x, y, data):
         """
         Add a tile to the mbtiles file.  Note: this is not as performant as
-        add_tiles function for inserting several tiles at once.
+        add_tiles function for inserting several tiles at once, unless a
+        transaction is open (see transaction).
 
         Parameters
         ----------
@@ -260,58 +1183,643 @@ class MBtiles(object):
             tile data bytes
         """
 
-        id = hashlib.sha1(data).hexdigest()
+        row = _prepare_tile(Tile(z, x, y, data), self._hash_func, self._codec)
+        if self._transaction is not None:
+            self._transaction._write_rows([row])
+            return
 
-        self._cursor.execute(
-            "INSERT OR REPLACE INTO images (tile_id, tile_data) values (?, ?)",
-            (id, sqlite3.Binary(data)),  # is this necessary
+        self._insert_rows([row])
+        self._invalidate_stats()
+        self._db.commit()
+
+    def write_tiles(self, tiles):
+        """
+        Add several tiles to mbtiles file, using a single transaction.
+        Parameters
+        ----------
+        tiles: iterable of Tile(z, x, y, data) tuples
+        """
+
+        self._write_rows(
+            _prepare_tile(tile, self._hash_func, self._codec) for tile in tiles
         )
 
-        self._cursor.execute(
+    def write_columns(self, zs, xs, ys, blobs):
+        """
+        Add tiles given as columns: sequences of zoom levels, tile columns,
+        tile rows, and tile data, all of the same length.  Uses a single
+        transaction (unless a transaction is open, see transaction).
+
+        This is faster than write_tiles for large batches of tiles, because
+        tile data are hashed in bulk and rows are inserted using executemany,
+        without creating a Tile for each tile.
+
+        Parameters
+        ----------
+        zs, xs, ys: sequences of int, such as numpy arrays, array.array, or lists
+            zoom level, tile column, and tile row of each tile
+        blobs: sequence of bytes
+            tile data of each tile
+        """
+
+        if self._flip:
+            ys = flip_y(zs, ys)
+
+        zs, xs, ys = [
+            values.tolist() if hasattr(values, "tolist") else list(values)
+            for values in (zs, xs, ys)
+        ]
+        blobs = list(blobs)
+        if not len(zs) == len(xs) == len(ys) == len(blobs):
+            raise ValueError("zs, xs, ys, and blobs must have the same length")
+
+        # checked inline, since this loop runs for every tile
+        for z, x, y in zip(zs, xs, ys):
+            if z < 0 or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+                _validate_tile(z, x, y)
+
+        if self._codec is not None:
+            blobs = [self._codec.compress(data) for data in blobs]
+        tile_ids = list(map(self._hash_func, blobs))
+
+        if self._transaction is not None:
+            self._transaction._insert(
+                self._insert_columns, zs, xs, ys, tile_ids, blobs
+            )
+            self._transaction._wrote(len(blobs), sum(map(len, blobs)))
+            return
+
+        self._write_in_transaction(self._insert_columns, zs, xs, ys, tile_ids, blobs)
+
+    def _insert_columns(self, zs, xs, ys, tile_ids, blobs):
+        """Insert tiles given as columns; caller manages the transaction."""
+
+        if self.cache is not None:
+            rows = flip_y(zs, ys) if self._flip else ys
+            self._invalidate_cached(list(zip(zs, xs, rows)))
+
+        # tile data of each tile_id not known to be present, once
+        images = {}
+        for tile_id, data in zip(tile_ids, blobs):
+            if tile_id not in self._known_tile_ids and tile_id not in images:
+                images[tile_id] = data
+
+        if images:
+            rows = images.items()
+            if IS_PY2:  # pragma: no cover
+                rows = [(tile_id, sqlite3.Binary(data)) for tile_id, data in rows]
+
+            self._cursor.executemany(
+                "INSERT OR IGNORE INTO images (tile_id, tile_data) values (?, ?)", rows
+            )
+            self._images_written += self._cursor.rowcount
+
+            if len(self._known_tile_ids) + len(images) > MAX_KNOWN_TILE_IDS:
+                self._known_tile_ids.clear()
+            self._known_tile_ids.update(images)
+
+        self._cursor.executemany(
             "INSERT OR REPLACE INTO map "
             "(zoom_level, tile_column, tile_row, tile_id) "
             "values(?, ?, ?, ?)",
-            (z, x, y, id),
+            zip(zs, xs, ys, tile_ids),
         )
 
-        self._db.commit()
+        self._tiles_written += len(tile_ids)
+        self._written_zooms.update(zs)
 
-    def write_tiles(self, tiles):
+    def parallel_writer(
+        self, workers=None, batch_size=1000, max_pending=None, processes=False
+    ):
         """
-        Add several tiles to mbtiles file, using a single transaction.
+        Create a ParallelWriter that prepares tiles for writing in a pool of
+        workers and writes them to this mbtiles file in the order they were
+        added.  Must be closed after all tiles are added; use as a context
+        manager.
+
         Parameters
         ----------
-        tiles: iterable of Tile(z, x, y, data) tuples
+        workers: int, optional (default: None)
+            number of workers; defaults to the number of CPUs
+        batch_size: int, optional (default: 1000)
+            number of tiles prepared by a worker and written in each transaction
+        max_pending: int, optional (default: None)
+            maximum number of batches queued or being prepared before adding
+            tiles blocks; defaults to 2 * workers
+        processes: bool, optional (default: False)
+            if True, use a pool of processes instead of threads.  Hashing and
+            compression release the GIL for larger tiles, so threads are
+            usually sufficient.
+
+        Returns
+        -------
+        ParallelWriter
+        """
+
+        from pymbtiles.writer import ParallelWriter
+
+        return ParallelWriter(
+            self,
+            workers=workers,
+            batch_size=batch_size,
+            max_pending=max_pending,
+            processes=processes,
+        )
+
+    def transaction(self, batch_size=10000, max_bytes=64 * 1024 * 1024):
         """
+        Create a Transaction session, so that tiles written by many calls to
+        write_tile and write_tiles are committed using few transactions.  Use
+        as a context manager:
+
+            with mbtiles.transaction() as tx:
+                for tiles in chunks:
+                    mbtiles.write_tiles(tiles)
+            print(tx.rate)
+
+        Other operations that use their own transactions (e.g., ops functions)
+        must not be used while the session is open.
+
+        Parameters
+        ----------
+        batch_size: int, optional (default: 10000)
+            number of tiles written before the transaction is committed and a
+            new one started
+        max_bytes: int, optional (default: 64 MB)
+            size of tile data written before the transaction is committed and a
+            new one started
+
+        Returns
+        -------
+        Transaction
+        """
+
+        from pymbtiles.transaction import Transaction
+
+        return Transaction(self, batch_size=batch_size, max_bytes=max_bytes)
+
+    def _insert_rows(self, rows):
+        """Insert (z, x, y, tile_id, data) rows; caller manages the transaction."""
+
+        for z, x, y, tile_id, data in rows:
+            _validate_tile(z, x, y)
+
+            if self.cache is not None:
+                self._invalidate_cached([(z, x, y)])
+
+            if tile_id not in self._known_tile_ids:
+                # tile data are identified by their hash, so an existing
+                # image with the same tile_id has the same data
+                self._cursor.execute(
+                    "INSERT OR IGNORE INTO images (tile_id, tile_data) values (?, ?)",
+                    (tile_id, sqlite3.Binary(data)),
+                )
+                self._images_written += self._cursor.rowcount
+
+                if len(self._known_tile_ids) >= MAX_KNOWN_TILE_IDS:
+                    self._known_tile_ids.clear()
+                self._known_tile_ids.add(tile_id)
+
+            self._tiles_written += 1
+            self._written_zooms.add(z)
+
+            self._cursor.execute(
+                "INSERT OR REPLACE INTO map "
+                "(zoom_level, tile_column, tile_row, tile_id) "
+                "values(?, ?, ?, ?)",
+                (z, x, self._row(z, y), tile_id),
+            )
+
+    def _write_rows(self, rows):
+        """Insert (z, x, y, tile_id, data) rows using a single transaction, or
+        within the open Transaction."""
+
+        if self._transaction is not None:
+            self._transaction._write_rows(rows)
+            return
+
+        self._write_in_transaction(self._insert_rows, rows)
+
+    def _write_in_transaction(self, insert, *args):
+        """Call insert(*args) to insert tiles using a single transaction."""
 
         self._cursor.execute("BEGIN")
 
         try:
-            for tile in tiles:
-                id = hashlib.sha1(tile.data).hexdigest()
+            insert(*args)
+            self._invalidate_stats()
+            # metadata changes are committed with the tiles
+            meta_dirty = self._meta is not None and self._meta.dirty
+            if meta_dirty:
+                self._meta._write()
+            self._cursor.execute("COMMIT")
+            if meta_dirty:
+                self._meta._mark_clean()
+
+        except Exception:
+            logger.exception("Error inserting tiles, rolling back database")
+            self._cursor.execute("ROLLBACK")
+            # images inserted in this transaction are no longer present
+            self._known_tile_ids.clear()
+            raise
+
+    def _invalidate_cached(self, keys):
+        """Remove tiles (z, x, y) being written from the cache.  Within a
+        transaction session, they are removed again if it is rolled back, since
+        they may have been read and cached since."""
+
+        for key in keys:
+            self.cache.invalidate(key)
+
+        if self._transaction is not None:
+            self._transaction._written_keys.update(keys)
+
+    def _invalidate_stats(self):
+        """Remove cached statistics of zoom levels written to."""
+
+        if not self._written_zooms:
+            return
+
+        zooms = list(self._written_zooms)
+        self._written_zooms.clear()
+        for z in zooms:
+            self._stats.pop(z, None)
+
+        if self._has_stats_table:
+            self._cursor.execute(
+                "DELETE FROM tile_stats WHERE zoom_level IN ({0})".format(
+                    ", ".join(["?"] * len(zooms))
+                ),
+                zooms,
+            )
+
+    def build_indexes(self):
+        """
+        Build the indexes of the map and images tables, if they were deferred
+        when the file was opened (see defer_indexes).  Called automatically
+        by close().
+
+        Where the same tile was written more than once, the tile written last
+        is kept, the same as when indexes are not deferred.
+        """
+
+        if not self._indexes_deferred:
+            return
+
+        for index, table, columns in DEFERRED_INDEXES:
+            create = "CREATE UNIQUE INDEX {0} ON {1} ({2})".format(
+                index, table, columns
+            )
+            try:
+                self._cursor.execute(create)
+
+            except sqlite3.IntegrityError:
+                # remove duplicates; rowids increase as rows are inserted
+                self._cursor.execute("BEGIN")
                 self._cursor.execute(
-                    "INSERT OR REPLACE INTO images (tile_id, tile_data) values (?, ?)",
-                    (id, sqlite3.Binary(tile.data)),
+                    "DELETE FROM {table} WHERE rowid NOT IN "
+                    "(SELECT max(rowid) FROM {table} GROUP BY {columns})".format(
+                        table=table, columns=columns
+                    )
                 )
+                self._cursor.execute(create)
+                self._cursor.execute("COMMIT")
 
-                self._cursor.execute(
-                    "INSERT OR REPLACE INTO map "
-                    "(zoom_level, tile_column, tile_row, tile_id) "
-                    "values(?, ?, ?, ?)",
-                    (tile.z, tile.x, tile.y, id),
+        self._indexes_deferred = False
+
+    def _pragma_value(self, name):
+        return self._cursor.execute("PRAGMA {0}".format(name)).fetchone()[0]
+
+    def _database_size(self):
+        return self._pragma_value("page_count") * self._pragma_value("page_size")
+
+    def compact(self, vacuum=None, into=None, batch_size=10000):
+        """
+        Delete tile data that are no longer used by any tile (e.g., after
+        tiles were overwritten), and optionally vacuum the file to return the
+        space to the filesystem.
+
+        Unused tile data are deleted in batches, each in its own transaction,
+        so that other connections can read the file between batches.  Tiles
+        written by other connections while this runs are not affected.
+
+        Parameters
+        ----------
+        vacuum: string, one of VACUUM_MODES, optional (default: None)
+            if None, space used by deleted tile data is reused by later writes,
+            but the file does not become smaller.  'incremental' returns free
+            pages to the filesystem in batches; the file must have been
+            created with pragmas={'auto_vacuum': 'INCREMENTAL'}.  'full'
+            rebuilds the whole file, which locks it until complete.
+        into: string, optional (default: None)
+            if present, a compacted copy of the file is written to this
+            filename (using VACUUM INTO) instead of vacuuming the file, after
+            unused tile data are deleted.  The file is only read while the
+            copy is written.
+        batch_size: int, optional (default: 10000)
+            number of tile data deleted in each transaction; also the number of
+            pages freed in each transaction for 'incremental'
+
+        Returns
+        -------
+        dict with:
+            images_deleted: number of unused tile data deleted
+            bytes_before: size of the database before compacting
+            bytes_after: size of the database (or copy) after compacting
+            bytes_reclaimed: bytes_before - bytes_after
+            free_bytes: size of free pages remaining in the database
+        """
+
+        if self.mode == "r":
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        if self._transaction is not None:
+            raise ValueError("cannot compact while a transaction is open")
+
+        if vacuum is not None and vacuum not in VACUUM_MODES:
+            raise ValueError(
+                "vacuum must be one of: {0}".format(", ".join(VACUUM_MODES))
+            )
+
+        if vacuum == "incremental" and self._pragma_value("auto_vacuum") != 2:
+            raise ValueError(
+                "incremental vacuum requires a file created with auto_vacuum "
+                "INCREMENTAL"
+            )
+
+        self.build_indexes()
+        bytes_before = self._database_size()
+        cursor = self._cursor
+
+        # snapshot of tile_ids in use, taken again within the transaction of a
+        # batch whenever the file was changed since, so that tile data written
+        # by other connections in the meantime are never deleted.
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS live_tile_ids (tile_id TEXT PRIMARY KEY)"
+        )
+        snapshot = None
+
+        deleted = 0
+        last_rowid = 0
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = (self._pragma_value("data_version"), self._db.total_changes)
+                if version != snapshot:
+                    cursor.execute("DELETE FROM temp.live_tile_ids")
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO temp.live_tile_ids "
+                        "SELECT tile_id FROM map"
+                    )
+
+                rowids = [
+                    row[0]
+                    for row in cursor.execute(
+                        "SELECT rowid FROM images WHERE rowid > ? AND tile_id NOT IN "
+                        "(SELECT tile_id FROM temp.live_tile_ids) "
+                        "ORDER BY rowid LIMIT ?",
+                        (last_rowid, batch_size),
+                    ).fetchall()
+                ]
+                if rowids:
+                    cursor.executemany(
+                        "DELETE FROM images WHERE rowid=?", [(r,) for r in rowids]
+                    )
+                cursor.execute("COMMIT")
+
+            except self._db.Error:  # pragma: no cover
+                cursor.execute("ROLLBACK")
+                raise
+
+            snapshot = (self._pragma_value("data_version"), self._db.total_changes)
+
+            if not rowids:
+                break
+
+            deleted += len(rowids)
+            last_rowid = rowids[-1]
+
+        cursor.execute("DROP TABLE temp.live_tile_ids")
+
+        # deleted tile data may be known to be present
+        self._known_tile_ids.clear()
+
+        if into is not None:
+            cursor.execute("VACUUM INTO ?", (into,))
+            with MBtiles(into) as out:
+                bytes_after = out._database_size()
+
+        else:
+            if vacuum == "full":
+                cursor.execute("VACUUM")
+
+            elif vacuum == "incremental":
+                while self._pragma_value("freelist_count"):
+                    cursor.execute("PRAGMA incremental_vacuum({0})".format(batch_size))
+                    cursor.fetchall()
+
+            if vacuum is not None and self._pragma_value("journal_mode") == "wal":
+                self.checkpoint("TRUNCATE")
+
+            bytes_after = self._database_size()
+
+        return {
+            "images_deleted": deleted,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "free_bytes": self._pragma_value("freelist_count")
+            * self._pragma_value("page_size"),
+        }
+
+    def rewrite_scheme(self, scheme, batch_size=10000):
+        """
+        Convert the tile rows stored in the file to another tile scheme, in
+        place.  Once complete, the file stores scheme in its metadata, and
+        MBtiles instances that use that scheme read and write rows without
+        converting them.
+
+        Rows are converted in batches, each in its own transaction.  The
+        progress of the rewrite is stored in the metadata, so that if it is
+        interrupted, calling rewrite_scheme again with the same scheme
+        finishes it.  The file cannot be opened in mode 'r' until the rewrite
+        is finished.
+
+        Parameters
+        ----------
+        scheme: string, one of SCHEMES
+            tile scheme of rows stored in the file once complete
+        batch_size: int, optional (default: 10000)
+            number of tiles converted in each transaction
+
+        Returns
+        -------
+        int: number of tiles converted
+        """
+
+        if self.mode == "r":
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        _validate_scheme(scheme)
+
+        if self._transaction is not None:
+            raise ValueError("cannot rewrite rows while a transaction is open")
+
+        if self._meta is not None:
+            self._meta.flush()
+
+        cursor = self._cursor
+        row = cursor.execute(
+            "SELECT value FROM metadata WHERE name=?", (SCHEME_REWRITE_KEY,)
+        ).fetchone()
+
+        if row is None:
+            if scheme == self._stored_scheme:
+                return 0
+
+            progress = {"scheme": scheme, "phase": 1}
+            cursor.execute(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                (SCHEME_REWRITE_KEY, json.dumps(progress)),
+            )
+
+        else:
+            progress = json.loads(row[0])
+            if progress["scheme"] != scheme:
+                raise ValueError(
+                    "Unfinished rewrite of tile rows to scheme {0} must be "
+                    "finished first".format(progress["scheme"])
                 )
 
-            self._cursor.execute("COMMIT")
+        # Rows are converted in two phases so that no row is ever updated to
+        # the coordinates of another row that has not been converted yet:
+        # first to a negative row (y - 2^z), then from the negative row to
+        # the converted row (2^z - 1 - y).
+        phases = (
+            (1, "tile_row >= 0", "tile_row - (1 << zoom_level)"),
+            (2, "tile_row < 0", "-1 - tile_row"),
+        )
+
+        converted = 0
+        for phase, where, update in phases:
+            if phase < progress["phase"]:
+                continue
+
+            if phase > progress["phase"]:
+                progress["phase"] = phase
+                cursor.execute(
+                    "UPDATE metadata SET value=? WHERE name=?",
+                    (json.dumps(progress), SCHEME_REWRITE_KEY),
+                )
+
+            last_rowid = 0
+            while True:
+                rowids = [
+                    row[0]
+                    for row in cursor.execute(
+                        "SELECT rowid FROM {0} WHERE rowid > ? AND {1} "
+                        "ORDER BY rowid LIMIT ?".format(self._coords_table, where),
+                        (last_rowid, batch_size),
+                    ).fetchall()
+                ]
+                if not rowids:
+                    break
+
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor.execute(
+                        "UPDATE {0} SET tile_row = {1} "
+                        "WHERE rowid BETWEEN ? AND ? AND {2}".format(
+                            self._coords_table, update, where
+                        ),
+                        (rowids[0], rowids[-1]),
+                    )
+                    if phase == 2:
+                        converted += cursor.rowcount
+                    cursor.execute("COMMIT")
+
+                except self._db.Error:  # pragma: no cover
+                    cursor.execute("ROLLBACK")
+                    raise
+
+                last_rowid = rowids[-1]
+
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if scheme == "tms":
+                cursor.execute("DELETE FROM metadata WHERE name=?", (SCHEME_KEY,))
+            else:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                    (SCHEME_KEY, scheme),
+                )
+            cursor.execute("DELETE FROM metadata WHERE name=?", (SCHEME_REWRITE_KEY,))
+
+            # cached statistics are of the rows as stored
+            if self._has_stats_table:
+                cursor.execute("DELETE FROM tile_stats")
+            cursor.execute("COMMIT")
 
         except self._db.Error:  # pragma: no cover
-            logger.exception("Error inserting tiles, rolling back database")
-            self._cursor.execute("ROLLBACK")
+            cursor.execute("ROLLBACK")
             raise
 
+        self._stats = {}
+        self._meta = None
+        self._read_stored_scheme()
+
+        return converted
+
+    @property
+    def write_stats(self):
+        """
+        Statistics of tiles written since the file was opened.
+
+        Returns
+        -------
+        dict with:
+            tiles: number of tiles written
+            images: number of distinct tile data written to the file
+            duplicates: number of tiles whose tile data were already present
+            dedup_ratio: fraction of tiles whose tile data were already present
+        """
+
+        duplicates = self._tiles_written - self._images_written
+        return {
+            "tiles": self._tiles_written,
+            "images": self._images_written,
+            "duplicates": duplicates,
+            "dedup_ratio": duplicates / float(self._tiles_written)
+            if self._tiles_written
+            else 0.0,
+        }
+
     def close(self):
         """
-        Close the mbtiles file.
+        Close the mbtiles file.  Metadata changes that have not been written
+        are written first, and an open transaction session is closed,
+        committing its tiles.
         """
 
-        self._cursor.close()
-        self._db.close()
+        try:
+            if self._transaction is not None:
+                self._transaction.close()
+
+            if self._indexes_deferred:
+                self.build_indexes()
+
+            if self._meta is not None:
+                self._meta.flush()
+
+        finally:
+            if self._tiles_written:
+                stats = self.write_stats
+                logger.info(
+                    "Wrote %d tiles, %d duplicates (%.1f%%)",
+                    stats["tiles"],
+                    stats["duplicates"],
+                    stats["dedup_ratio"] * 100,
+                )
+
+            self._cursor.close()
+            self._db.close()
@@ -0,0 +1,209 @@
+"""asyncio interface for reading and writing mbtiles files.
+
+Requires Python 3.6+.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from pymbtiles import MBtiles
+from pymbtiles.pool import MBtilesPool
+
+
+class AsyncMBtiles(object):
+    """
+    asyncio interface for reading and writing mbtiles files.
+
+    Database calls run in a bounded pool of threads so that they do not block
+    the event loop.  Reads use a pool of read-only connections (see
+    MBtilesPool), so concurrent reads do not wait on each other.  Writes go
+    through a single connection on a single thread, in the order they were
+    awaited.
+
+    Must be closed after use:
+
+        async with AsyncMBtiles('my.mbtiles') as src:
+            tile_data = await src.read_tile(0, 0, 0)
+    """
+
+    def __init__(
+        self,
+        filename,
+        mode="r",
+        workers=4,
+        profile="readonly_serving",
+        write_profile="wal_concurrent",
+        immutable=False,
+        cache=None,
+    ):
+        """
+        Creates an open mbtiles file.  Must be closed after all data are added.
+
+        Parameters
+        ----------
+        filename: string
+            name of mbtiles file
+        mode: string, one of ('r', 'w', 'r+')
+            if 'w', existing mbtiles file will be deleted first
+        workers: int, optional (default: 4)
+            number of threads and read-only connections used for reads
+        profile: string, optional (default: 'readonly_serving')
+            connection profile of read-only connections; see MBtiles
+        write_profile: string, optional (default: 'wal_concurrent')
+            connection profile of the write connection in modes 'w' and 'r+'.
+            Must allow other connections to read while the file is open for
+            writing.
+        immutable: bool, optional (default: False)
+            if True, open read-only connections as immutable; only valid for
+            mode 'r'.  See MBtiles.
+        cache: TileCache, optional (default: None)
+            if present, tiles read are cached in this cache.  Tiles written
+            are removed from the cache.
+        """
+
+        self.mode = mode
+        self._writer = None
+        self._write_executor = None
+
+        if mode != "r":
+            self._writer = MBtiles(
+                filename,
+                mode=mode,
+                profile=write_profile,
+                check_same_thread=False,
+                cache=cache,
+            )
+            self._write_executor = ThreadPoolExecutor(1)
+
+        self._pool = MBtilesPool(
+            filename, size=workers, profile=profile, immutable=immutable, cache=cache
+        )
+        self._executor = ThreadPoolExecutor(workers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _run(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    def _run_write(self, name, *args):
+        """Call method name of the write connection on the write thread."""
+
+        if self._writer is None:
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        return asyncio.get_event_loop().run_in_executor(
+            self._write_executor, getattr(self._writer, name), *args
+        )
+
+    @property
+    def stats(self):
+        """Usage statistics of the read-only connection pool; see MBtilesPool."""
+
+        return self._pool.stats
+
+    async def read_meta(self):
+        """
+        Read the metadata of the mbtiles file.
+
+        Returns
+        -------
+        dict
+        """
+
+        return await self._run(lambda: self._pool.meta)
+
+    async def has_tile(self, z, x, y):
+        return await self._run(self._pool.has_tile, z, x, y)
+
+    async def read_tile(self, z, x, y):
+        """
+        Get a tile for z, x, y values.  See MBtiles.read_tile.
+        """
+
+        return await self._run(self._pool.read_tile, z, x, y)
+
+    async def read_tiles(self, coords):
+        """
+        Get tiles for many (z, x, y) values at once.  See MBtiles.read_tiles.
+        """
+
+        return await self._run(self._pool.read_tiles, list(coords))
+
+    async def iter_tiles(self, batch_size=1000, data=False):
+        """
+        Iterate over tiles in the tileset in (z, x, y) order:
+
+            async for tile in src.iter_tiles():
+                ...
+
+        A read-only connection is checked out for the duration of the
+        iteration.  See MBtiles.iter_tiles.
+        """
+
+        connection = self._pool.connection()
+        mbtiles = await self._run(connection.__enter__)
+        batches = mbtiles.list_tiles_batched(batch_size, data=data)
+        try:
+            while True:
+                batch = await self._run(next, batches, None)
+                if batch is None:
+                    break
+
+                for tile in batch:
+                    yield tile
+
+        finally:
+            await self._run(batches.close)
+            await self._run(connection.__exit__, None, None, None)
+
+    async def write_tile(self, z, x, y, data):
+        """
+        Add a tile to the mbtiles file.  See MBtiles.write_tile.
+        """
+
+        await self._run_write("write_tile", z, x, y, data)
+
+    async def write_tiles(self, tiles):
+        """
+        Add several tiles to mbtiles file, using a single transaction.  See
+        MBtiles.write_tiles.
+        """
+
+        await self._run_write("write_tiles", list(tiles))
+
+    async def write_meta(self, meta):
+        """
+        Add or update metadata values.
+
+        Parameters
+        ----------
+        meta: dict
+        """
+
+        if self._writer is None:
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        def write():
+            self._writer.meta.update(meta)
+            self._writer.meta.flush()
+
+        await asyncio.get_event_loop().run_in_executor(self._write_executor, write)
+
+    async def close(self):
+        """
+        Close the mbtiles file, after all pending writes are complete.
+        """
+
+        # waiting for executor threads to exit blocks, so it is done in the
+        # default executor instead of the event loop
+        loop = asyncio.get_event_loop()
+        if self._writer is not None:
+            await self._run_write("close")
+            await loop.run_in_executor(None, self._write_executor.shutdown)
+
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self._pool.close()
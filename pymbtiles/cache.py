@@ -0,0 +1,187 @@
+import threading
+from collections import Counter, OrderedDict
+
+
+# Approximate memory used by each cache entry in addition to its tile data,
+# so that entries for missing or empty tiles still count toward the limit.
+ENTRY_OVERHEAD = 200
+
+# Returned by TileCache.get for tiles that are not in the cache
+NOT_CACHED = object()
+
+# Default number of tiles whose requests are counted for hot_tiles
+MAX_HOT_TILES = 10000
+
+
+class TileCache(object):
+    """
+    Least recently used (LRU) cache of tile data keyed by (z, x, y), bounded
+    by the total size of cached tile data.
+
+    Missing tiles are cached as None, so that repeated requests for tiles
+    that are not in the tileset do not query the database.
+
+    A cache may be shared between MBtiles instances opened for the same file
+    (e.g., by MBtilesPool); it is safe to use from multiple threads.
+    """
+
+    def __init__(
+        self,
+        max_bytes=64 * 1024 * 1024,
+        cache_missing=True,
+        track_hot=False,
+        max_hot=MAX_HOT_TILES,
+    ):
+        """
+        Parameters
+        ----------
+        max_bytes: int, optional (default: 64 MB)
+            maximum total size of cached tiles.  Each entry counts as the size
+            of its tile data plus ENTRY_OVERHEAD bytes.
+        cache_missing: bool, optional (default: True)
+            if True, tiles that do not exist in the tileset are cached
+        track_hot: bool, optional (default: False)
+            if True, count requests for each tile for hot_tiles
+        max_hot: int, optional (default: MAX_HOT_TILES)
+            approximate number of tiles whose requests are counted if
+            track_hot is True.  When twice as many tiles have been counted,
+            only the max_hot most requested are kept, so counts of tiles
+            requested less often are approximate.
+        """
+
+        self.max_bytes = max_bytes
+        self.cache_missing = cache_missing
+        self.track_hot = track_hot
+        self.max_hot = max_hot
+
+        self._entries = OrderedDict()
+        self._requests = Counter()
+        self._lock = threading.Lock()
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Get cached tile data for key (z, x, y).
+
+        Returns
+        -------
+        tile data in bytes, None if the tile is cached as missing, or
+        NOT_CACHED if the tile is not in the cache.
+        """
+
+        key = tuple(key)
+        with self._lock:
+            if self.track_hot:
+                self._requests[key] += 1
+                if len(self._requests) > 2 * self.max_hot:
+                    self._requests = Counter(
+                        dict(self._requests.most_common(self.max_hot))
+                    )
+
+            data = self._entries.pop(key, NOT_CACHED)
+            if data is NOT_CACHED:
+                self.misses += 1
+                return NOT_CACHED
+
+            # move to most recently used
+            self._entries[key] = data
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Add tile data for key (z, x, y) to the cache; data is None for tiles
+        that do not exist in the tileset.
+        """
+
+        if data is None and not self.cache_missing:
+            return
+
+        size = _size(data)
+        if size > self.max_bytes:
+            return
+
+        key = tuple(key)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= _size(self._entries.pop(key))
+
+            self._entries[key] = data
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= _size(evicted)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove key (z, x, y) from the cache, e.g., when the tile is written.
+        """
+
+        key = tuple(key)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= _size(self._entries.pop(key))
+
+    def clear(self):
+        """
+        Remove all tiles from the cache.  Statistics are not reset.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def hot_tiles(self, n=10):
+        """
+        Return the n most requested tiles, if track_hot is True.
+
+        Returns
+        -------
+        list of ((z, x, y), number of requests) tuples, most requested first
+        """
+
+        with self._lock:
+            return self._requests.most_common(n)
+
+    @property
+    def stats(self):
+        """
+        Cache statistics.
+
+        Returns
+        -------
+        dict with:
+            entries: number of cached tiles
+            bytes: size of cached tiles
+            hits: number of requests found in the cache
+            misses: number of requests not found in the cache
+            evictions: number of tiles removed to stay under max_bytes
+            hit_rate: fraction of requests found in the cache
+        """
+
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / float(requests) if requests else 0.0,
+            }
+
+
+def _size(data):
+    return ENTRY_OVERHEAD + (len(data) if data is not None else 0)
@@ -0,0 +1,174 @@
+"""Codecs to compress and decompress tile data.
+
+gzip and zlib are always available.  zstd requires the zstandard package, and
+brotli requires the brotli package.
+"""
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Codec(object):
+    """
+    Compresses and decompresses tile data.
+
+    Codecs only store their name and level, so that they can be sent to
+    worker processes.
+    """
+
+    name = None
+    default_level = None
+
+    def __init__(self, level=None):
+        """
+        Parameters
+        ----------
+        level: int, optional (default: None)
+            compression level; if None, the default level of the codec is used
+        """
+
+        self.level = self.default_level if level is None else level
+
+    def __repr__(self):
+        return "{0}(level={1})".format(self.__class__.__name__, self.level)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.level == other.level
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.name, self.level))
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+    def is_compressed(self, data):
+        """Return True if data starts with the signature of this codec."""
+
+        return False
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    default_level = 6
+
+    def compress(self, data):
+        # unlike the gzip module, this does not include the current time in the
+        # output, so the same tile always compresses to the same bytes and
+        # tile_id
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        return zlib.decompress(data, 31)
+
+    def is_compressed(self, data):
+        return data[:2] == b"\x1f\x8b"
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    default_level = 6
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    default_level = 3
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        # decompressobj also handles frames that do not include their size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+    def is_compressed(self, data):
+        return data[:4] == b"\x28\xb5\x2f\xfd"
+
+
+class BrotliCodec(Codec):
+    name = "brotli"
+    default_level = 11
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def decompress(self, data):
+        return brotli.decompress(data)
+
+
+# Codecs available, by name
+CODECS = {"gzip": GzipCodec, "zlib": ZlibCodec}
+
+if zstandard is not None:
+    CODECS["zstd"] = ZstdCodec
+
+if brotli is not None:
+    CODECS["brotli"] = BrotliCodec
+
+# Codecs that can be detected from their signature.  zlib and brotli data do
+# not have a signature that reliably tells them apart from uncompressed data.
+_DETECTABLE = [codec() for codec in (GzipCodec, ZstdCodec) if codec.name in CODECS]
+
+
+def get_codec(codec, level=None):
+    """
+    Return a Codec.
+
+    Parameters
+    ----------
+    codec: string, one of CODECS, or Codec
+    level: int, optional (default: None)
+        compression level; if None, the level of codec or the default level
+        of the codec is used
+
+    Returns
+    -------
+    Codec
+    """
+
+    if isinstance(codec, Codec):
+        return codec if level is None else type(codec)(level)
+
+    if codec not in CODECS:
+        raise ValueError(
+            "compression must be a Codec or one of: {0}".format(
+                ", ".join(sorted(CODECS))
+            )
+        )
+
+    return CODECS[codec](level)
+
+
+def detect_codec(data):
+    """
+    Return the Codec used to compress data based on its signature, or None
+    if data are not compressed by a codec that can be detected.  Only gzip
+    and zstd can be detected.
+    """
+
+    for codec in _DETECTABLE:
+        if codec.is_compressed(data):
+            return codec
+
+    return None
@@ -0,0 +1,458 @@
+"""Convert between mbtiles files and {z}/{x}/{y}.ext directories or tar files.
+
+Tiles are streamed in batches, so memory use is bounded by the batch size
+regardless of the size of the tileset.  Tiles that share the same tile data
+in the mbtiles file are written once and hard linked.
+"""
+
+import io
+import json
+import os
+import tarfile
+from multiprocessing.pool import ThreadPool
+
+from pymbtiles import MBtiles, Tile, _tileset_meta, _validate_scheme
+
+# Name of the file containing the metadata of the tileset in exported
+# directories and tar files
+METADATA_FILENAME = "metadata.json"
+
+
+def _tile_path(z, x, y, ext):
+    return os.path.join(str(z), str(x), "{0}.{1}".format(y, ext))
+
+
+def _parse_tile_path(path):
+    """Return (z, x, y) for a path ending in {z}/{x}/{y}.ext, or None."""
+
+    parts = path.replace("\\", "/").split("/")
+    if len(parts) < 3:
+        return None
+
+    try:
+        return int(parts[-3]), int(parts[-2]), int(parts[-1].split(".")[0])
+    except ValueError:
+        return None
+
+
+def _default_ext(src):
+    return src.meta.get("format", "png")
+
+
+def _iter_tile_batches(src, batch_size):
+    """Iterate over batches of (z, x, y, tile_id, data) tuples of tiles in src
+    in (z, x, y) order of the rows stored, with rows in the scheme of src.
+    tile_id is None for tilesets without a map table.
+    """
+
+    if src._coords_table != "map":
+        for batch in src.list_tiles_batched(batch_size, data=True):
+            yield [(z, x, y, None, data) for z, x, y, data in batch]
+        return
+
+    query = (
+        "SELECT m.zoom_level, m.tile_column, {row}, m.tile_id, i.tile_data "
+        "FROM map m JOIN images i ON i.tile_id = m.tile_id {where} "
+        "ORDER BY m.zoom_level, m.tile_column, m.tile_row LIMIT ?"
+    )
+    cursor = src._db.cursor()
+    try:
+        cursor.execute(query.format(row=src._row_sql, where=""), (batch_size,))
+        while True:
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            yield rows
+
+            if len(rows) < batch_size:
+                return
+
+            z, x, y = rows[-1][:3]
+            cursor.execute(
+                query.format(
+                    row=src._row_sql,
+                    where="WHERE (m.zoom_level, m.tile_column, m.tile_row) > (?, ?, ?)",
+                ),
+                (z, x, src._row(z, y), batch_size),
+            )
+    finally:
+        cursor.close()
+
+
+def _duplicate_tile_ids(src):
+    """Return the set of tile_ids used by more than one tile."""
+
+    if src._coords_table != "map":
+        return set()
+
+    src._cursor.execute("SELECT tile_id FROM map GROUP BY tile_id HAVING count(*) > 1")
+    return {row[0] for row in src._cursor.fetchall()}
+
+
+def _write_file(path, data):
+    """Write data to path, via a temporary file so that an interrupted
+    export never leaves a partial file at path.
+    """
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+def _link_file(source, path):
+    if os.path.exists(path):
+        return
+
+    try:
+        os.link(source, path)
+    except (OSError, AttributeError):
+        # hard links are not supported by this filesystem
+        with open(source, "rb") as f:
+            _write_file(path, f.read())
+
+
+def export_directory(
+    filename,
+    path,
+    ext=None,
+    scheme="xyz",
+    batch_size=1000,
+    workers=4,
+    hardlinks=True,
+    resume=True,
+):
+    """
+    Export tiles from an mbtiles file to {z}/{x}/{y}.ext files in a directory.
+
+    Metadata are written to metadata.json in the directory.
+
+    Parameters
+    ----------
+    filename : str
+        name of mbtiles file
+    path : str
+        output directory; created if it does not exist
+    ext : str, optional (default: None)
+        file extension of tiles.  If None, the format in the metadata of the
+        mbtiles file is used (or png if not present).
+    scheme : str, one of ('xyz', 'tms') (default: 'xyz')
+        tile scheme of the output
+    batch_size : int, optional (default: 1000)
+        number of tiles read from the mbtiles file at a time
+    workers : int, optional (default: 4)
+        number of threads used to write files
+    hardlinks : bool, optional (default: True)
+        if True, tiles with the same tile data are written once and hard
+        linked to the first file written.
+    resume : bool, optional (default: True)
+        if True, tiles that already exist in path are not written again, so
+        that an interrupted export can be continued.
+
+    Returns
+    -------
+    int: number of tiles exported
+    """
+
+    _validate_scheme(scheme)
+
+    pool = ThreadPool(workers)
+    count = 0
+    try:
+        with MBtiles(filename, scheme=scheme) as src:
+            ext = ext or _default_ext(src)
+
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+            _write_file(
+                os.path.join(path, METADATA_FILENAME),
+                json.dumps(_tileset_meta(src.meta), indent=2).encode("utf-8"),
+            )
+
+            duplicates = _duplicate_tile_ids(src) if hardlinks else set()
+            first_paths = {}  # tile_id: path of first file written
+            directories = set()
+
+            for batch in _iter_tile_batches(src, batch_size):
+                writes = []
+                links = []
+                for z, x, y, tile_id, data in batch:
+                    tile_path = os.path.join(path, _tile_path(z, x, y, ext))
+                    directory = os.path.dirname(tile_path)
+                    if directory not in directories:
+                        if not os.path.exists(directory):
+                            os.makedirs(directory)
+                        directories.add(directory)
+
+                    if tile_id in duplicates:
+                        if tile_id in first_paths:
+                            links.append((first_paths[tile_id], tile_path))
+                            continue
+                        first_paths[tile_id] = tile_path
+
+                    if not (resume and os.path.exists(tile_path)):
+                        writes.append((tile_path, data))
+
+                pool.map(lambda args: _write_file(*args), writes)
+                pool.map(lambda args: _link_file(*args), links)
+                count += len(batch)
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return count
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _iter_directory(path):
+    """Iterate over (z, x, y, filename) of tile files in path in z, x order."""
+
+    for z_name in sorted(os.listdir(path), key=lambda n: (len(n), n)):
+        z_path = os.path.join(path, z_name)
+        if not (z_name.isdigit() and os.path.isdir(z_path)):
+            continue
+
+        for x_name in sorted(os.listdir(z_path), key=lambda n: (len(n), n)):
+            x_path = os.path.join(z_path, x_name)
+            if not (x_name.isdigit() and os.path.isdir(x_path)):
+                continue
+
+            for y_name in os.listdir(x_path):
+                y = y_name.split(".")[0]
+                if y.isdigit() and not y_name.endswith(".tmp"):
+                    yield int(z_name), int(x_name), int(y), os.path.join(x_path, y_name)
+
+
+def _open_target(filename, resume, scheme):
+    if resume and os.path.exists(filename):
+        return MBtiles(filename, "r+", scheme=scheme)
+    return MBtiles(filename, "w", scheme=scheme)
+
+
+def import_directory(
+    path, filename, scheme="xyz", batch_size=1000, workers=4, resume=True
+):
+    """
+    Import tiles from {z}/{x}/{y}.ext files in a directory to an mbtiles file.
+
+    If present, metadata are read from metadata.json in the directory.
+
+    Parameters
+    ----------
+    path : str
+        input directory
+    filename : str
+        name of mbtiles file
+    scheme : str, one of ('xyz', 'tms') (default: 'xyz')
+        tile scheme of the input directory
+    batch_size : int, optional (default: 1000)
+        number of tiles written to the mbtiles file in each transaction
+    workers : int, optional (default: 4)
+        number of threads used to read files
+    resume : bool, optional (default: True)
+        if True and filename exists, tiles are added to it and tiles that
+        are already present are not imported again, so that an interrupted
+        import can be continued.  Otherwise, filename is overwritten.
+
+    Returns
+    -------
+    int: number of tiles imported
+    """
+
+    _validate_scheme(scheme)
+
+    pool = ThreadPool(workers)
+    count = 0
+    try:
+        with _open_target(filename, resume, scheme) as out:
+            metadata_filename = os.path.join(path, METADATA_FILENAME)
+            if os.path.exists(metadata_filename):
+                with open(metadata_filename) as f:
+                    out.meta = _tileset_meta(json.load(f))
+
+            def import_batch(batch):
+                data = pool.map(_read_file, [tile_path for _, tile_path in batch])
+                out.write_tiles(
+                    Tile(z, x, y, tile_data)
+                    for ((z, x, y), _), tile_data in zip(batch, data)
+                )
+                return len(batch)
+
+            batch = []
+            for z, x, y, tile_path in _iter_directory(path):
+                if resume and out.has_tile(z, x, y):
+                    continue
+
+                batch.append(((z, x, y), tile_path))
+                if len(batch) >= batch_size:
+                    count += import_batch(batch)
+                    batch = []
+
+            if batch:
+                count += import_batch(batch)
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return count
+
+
+def _add_tar_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_tar(filename, tarfilename, ext=None, scheme="xyz", batch_size=1000):
+    """
+    Export tiles from an mbtiles file to {z}/{x}/{y}.ext files in a tar file.
+
+    The tar file is written as a stream; it is compressed if tarfilename ends
+    in .gz, .bz2, or .xz.  Tiles with the same tile data are written once and
+    stored as hard links to the first file.  Metadata are written to
+    metadata.json.
+
+    Parameters
+    ----------
+    filename : str
+        name of mbtiles file
+    tarfilename : str
+        name of output tar file
+    ext : str, optional (default: None)
+        file extension of tiles.  If None, the format in the metadata of the
+        mbtiles file is used (or png if not present).
+    scheme : str, one of ('xyz', 'tms') (default: 'xyz')
+        tile scheme of the output
+    batch_size : int, optional (default: 1000)
+        number of tiles read from the mbtiles file at a time
+
+    Returns
+    -------
+    int: number of tiles exported
+    """
+
+    _validate_scheme(scheme)
+
+    compression = os.path.splitext(tarfilename)[1].lstrip(".")
+    if compression not in ("gz", "bz2", "xz"):
+        compression = ""
+
+    count = 0
+    with MBtiles(filename, scheme=scheme) as src:
+        ext = ext or _default_ext(src)
+        duplicates = _duplicate_tile_ids(src)
+        first_paths = {}
+
+        with tarfile.open(tarfilename, "w|" + compression) as tar:
+            _add_tar_file(
+                tar,
+                METADATA_FILENAME,
+                json.dumps(_tileset_meta(src.meta), indent=2).encode("utf-8"),
+            )
+
+            for batch in _iter_tile_batches(src, batch_size):
+                for z, x, y, tile_id, data in batch:
+                    name = "{0}/{1}/{2}.{3}".format(z, x, y, ext)
+                    if tile_id in duplicates:
+                        if tile_id in first_paths:
+                            info = tarfile.TarInfo(name)
+                            info.type = tarfile.LNKTYPE
+                            info.linkname = first_paths[tile_id]
+                            tar.addfile(info)
+                            continue
+
+                        first_paths[tile_id] = name
+
+                    _add_tar_file(tar, name, data)
+
+                count += len(batch)
+
+    return count
+
+
+def import_tar(tarfilename, filename, scheme="xyz", batch_size=1000, resume=True):
+    """
+    Import tiles from {z}/{x}/{y}.ext files in a tar file to an mbtiles file.
+
+    The tar file is read as a stream, and may be compressed.  If present,
+    metadata are read from metadata.json.
+
+    Parameters
+    ----------
+    tarfilename : str
+        name of input tar file
+    filename : str
+        name of mbtiles file
+    scheme : str, one of ('xyz', 'tms') (default: 'xyz')
+        tile scheme of the input
+    batch_size : int, optional (default: 1000)
+        number of tiles written to the mbtiles file in each transaction
+    resume : bool, optional (default: True)
+        if True and filename exists, tiles are added to it and tiles that
+        are already present are not imported again.  Otherwise, filename is
+        overwritten.
+
+    Returns
+    -------
+    int: number of tiles imported
+    """
+
+    _validate_scheme(scheme)
+
+    count = 0
+    with _open_target(filename, resume, scheme) as out, tarfile.open(
+        tarfilename, "r|*"
+    ) as tar:
+        batch = []
+
+        def flush():
+            out.write_tiles(batch)
+            del batch[:]
+
+        for info in tar:
+            if os.path.basename(info.name) == METADATA_FILENAME and info.isfile():
+                out.meta = _tileset_meta(
+                    json.loads(tar.extractfile(info).read().decode("utf-8"))
+                )
+                continue
+
+            coords = _parse_tile_path(info.name)
+            if coords is None or not (info.isfile() or info.islnk()):
+                continue
+
+            z, x, y = coords
+            if resume and out.has_tile(z, x, y):
+                continue
+
+            if info.islnk():
+                # linked tiles were written earlier in the stream
+                flush()
+                link_z, link_x, link_y = _parse_tile_path(info.linkname)
+                data = out.read_tile(link_z, link_x, link_y)
+                if data is None:
+                    raise ValueError(
+                        "Link target not found for {0}: {1}".format(
+                            info.name, info.linkname
+                        )
+                    )
+
+            else:
+                data = tar.extractfile(info).read()
+
+            batch.append(Tile(z, x, y, data))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+    return count
@@ -1,7 +1,162 @@
 import os
 import shutil
+from multiprocessing.pool import ThreadPool
 
-from pymbtiles import MBtiles, TileCoordinate, Tile
+from pymbtiles import (
+    MBtiles,
+    Tile,
+    IS_PY2,
+    SCHEME_KEY,
+    SCHEME_REWRITE_KEY,
+    VACUUM_MODES,
+    _tileset_meta,
+)
+from pymbtiles.compression import detect_codec, get_codec
+
+
+def _attach(mbtiles, filename, alias):
+    """Attach filename read-only to the connection of mbtiles as alias."""
+
+    if not os.path.exists(filename):
+        raise IOError("mbtiles not found: {0}".format(filename))
+
+    if IS_PY2:  # pragma: no cover
+        uri = filename
+    else:
+        uri = "file:{0}?mode=ro".format(filename)
+
+    mbtiles._cursor.execute("ATTACH DATABASE ? AS {0}".format(alias), (uri,))
+
+
+def _detach(mbtiles, alias):
+    mbtiles._cursor.execute("DETACH DATABASE {0}".format(alias))
+
+
+def _has_tile_tables(mbtiles, alias):
+    """Return True if the map and images tables are present in the database
+    attached as alias.  The MBtiles spec also allows tiles to be stored in a
+    single tiles table, which cannot be merged using set operations.
+    """
+
+    mbtiles._cursor.execute(
+        "SELECT name FROM {0}.sqlite_master "
+        "WHERE type='table' AND name IN ('map', 'images', 'tiles')".format(alias)
+    )
+    # empty map and images tables are added to tilesets opened in mode r+
+    return {row[0] for row in mbtiles._cursor.fetchall()} == {"map", "images"}
+
+
+def _attached_scheme(mbtiles, alias):
+    """Return the scheme of tile rows stored in the database attached as
+    alias.  Rows are copied between attached databases as stored, so set
+    operations are only used between databases that store the same scheme.
+    """
+
+    cursor = mbtiles._cursor
+    cursor.execute(
+        "SELECT count(*) FROM {0}.sqlite_master "
+        "WHERE type='table' AND name='metadata'".format(alias)
+    )
+    if not cursor.fetchone()[0]:
+        return "tms"
+
+    cursor.execute(
+        "SELECT name, value FROM {0}.metadata WHERE name IN (?, ?)".format(alias),
+        (SCHEME_KEY, SCHEME_REWRITE_KEY),
+    )
+    meta = dict(cursor.fetchall())
+    if SCHEME_REWRITE_KEY in meta:
+        raise ValueError(
+            "Rewrite of tile rows between schemes has not finished in database "
+            "attached as {0}".format(alias)
+        )
+
+    return meta.get(SCHEME_KEY, "tms")
+
+
+def _has_conflicting_images(mbtiles, alias):
+    """Return True if any tile_id in the database attached as alias refers to
+    different tile data than the same tile_id in mbtiles.
+
+    tile_ids are only content hashes if written by this library; other tools
+    may use arbitrary ids that cannot be shared between tilesets.
+    """
+
+    mbtiles._cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM {0}.images s "
+        "JOIN main.images t ON t.tile_id = s.tile_id "
+        "WHERE t.tile_data != s.tile_data LIMIT 1)".format(alias)
+    )
+    return mbtiles._cursor.fetchone()[0] == 1
+
+
+def _run_transaction(mbtiles, statements):
+    cursor = mbtiles._cursor
+    cursor.execute("BEGIN")
+    try:
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("COMMIT")
+
+    except mbtiles._db.Error:  # pragma: no cover
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def _extend_tiles(source, target, batch_size=1000):
+    """Add tiles from source MBtiles to target MBtiles one batch at a time,
+    checking each tile against target and rewriting the tile data.
+    """
+
+    for batch in source.list_tiles_batched(batch_size, data=True):
+        tiles_to_copy = [
+            tile for tile in batch if not target.has_tile(tile.z, tile.x, tile.y)
+        ]
+
+        if tiles_to_copy:
+            target.write_tiles(tiles_to_copy)
+
+
+def _extend_attached(target, alias):
+    """Add tiles from the database attached to target as alias that are not
+    already in target, using set operations within SQLite.
+
+    Tile data are copied directly between databases, and only for tile_ids
+    that are not already present in target.
+    """
+
+    # tiles in source that are missing from target
+    missing = (
+        "FROM {0}.map m "
+        "WHERE NOT EXISTS (SELECT 1 FROM main.tiles t "
+        "WHERE t.zoom_level=m.zoom_level AND t.tile_column=m.tile_column "
+        "AND t.tile_row=m.tile_row)"
+    ).format(alias)
+
+    statements = [
+        # images must be copied before map so that missing is unchanged
+        (
+            "INSERT INTO main.images (tile_id, tile_data) "
+            "SELECT s.tile_id, s.tile_data "
+            "FROM (SELECT DISTINCT m.tile_id AS tile_id {missing}) ids "
+            "JOIN {alias}.images s ON s.tile_id = ids.tile_id "
+            "WHERE NOT EXISTS "
+            "(SELECT 1 FROM main.images i WHERE i.tile_id = ids.tile_id)"
+        ).format(alias=alias, missing=missing),
+        # rows of map without tile data in target are replaced
+        (
+            "INSERT OR REPLACE INTO main.map "
+            "(zoom_level, tile_column, tile_row, tile_id) "
+            "SELECT m.zoom_level, m.tile_column, m.tile_row, m.tile_id {missing} "
+            "AND EXISTS (SELECT 1 FROM main.images i WHERE i.tile_id = m.tile_id)"
+        ).format(missing=missing),
+    ]
+
+    if target._has_stats_table:
+        statements.append("DELETE FROM main.tile_stats")
+
+    _run_transaction(target, statements)
+    target._stats = {}
 
 
 def extend(source_filename, target_filename, batch_size=1000):
@@ -21,17 +176,27 @@ def extend(source_filename, target_filename, batch_size=1000):
     target_tileset : str
         name of target tiles mbtiles file for adding tiles to
     batch_size : int, optional (default: 1000)
-        size of each batch to read from the source and write to the target
+        size of each batch to read from the source and write to the target.
+        Only used if tiles cannot be merged using set operations within SQLite,
+        including if source and target store tile rows in different schemes.
     """
 
-    with MBtiles(target_filename, "r+") as target, MBtiles(source_filename) as source:
-        for batch in source.list_tiles_batched(batch_size):
-            tiles_to_copy = [tile for tile in batch if not target.has_tile(*tile)]
+    with MBtiles(target_filename, "r+") as target:
+        _attach(target, source_filename, "source")
+        try:
+            if (
+                _has_tile_tables(target, "source")
+                and _attached_scheme(target, "source") == target._stored_scheme
+                and not _has_conflicting_images(target, "source")
+            ):
+                _extend_attached(target, "source")
+                return
 
-            if tiles_to_copy:
-                target.write_tiles(
-                    Tile(*tile, data=source.read_tile(*tile)) for tile in tiles_to_copy
-                )
+        finally:
+            _detach(target, "source")
+
+        with MBtiles(source_filename) as source:
+            _extend_tiles(source, target, batch_size=batch_size)
 
 
 def union(leftfilename, rightfilename, outfilename, batch_size=1000):
@@ -80,19 +245,566 @@ def difference(leftfilename, rightfilename, outfilename, batch_size=1000):
         second tileset filename
     outfilename : str
         output tileset filename
-    batch_size : int, optional (default: BATCH_SIZE)
-        size of each batch to read from the source and write to the target
+    batch_size : int, optional (default: 1000)
+        size of each batch to read from the source and write to the target.
+        Only used if tiles cannot be copied using set operations within SQLite,
+        including if left and right store tile rows in different schemes.
+    """
+
+    with MBtiles(outfilename, "w") as out:
+        _attach(out, leftfilename, "left")
+        _attach(out, rightfilename, "right")
+        try:
+            if _has_tile_tables(out, "left") and _attached_scheme(
+                out, "left"
+            ) == _attached_scheme(out, "right"):
+                _difference_attached(out, "left", "right")
+                return
+
+        finally:
+            _detach(out, "left")
+            _detach(out, "right")
+
+        with MBtiles(leftfilename) as left, MBtiles(rightfilename) as right:
+            _difference_tiles(left, right, out, batch_size=batch_size)
+
+
+def _difference_tiles(left, right, out, batch_size=1000):
+    """Write tiles from left MBtiles that are not in right MBtiles to out
+    MBtiles one batch at a time.
+    """
+
+    # tiles are written with rows in the scheme out stores
+    out.meta = _tileset_meta(left.meta)
+
+    for batch in left.list_tiles_batched(batch_size, data=True):
+        tiles_to_copy = [
+            tile for tile in batch if not right.has_tile(tile.z, tile.x, tile.y)
+        ]
+
+        if tiles_to_copy:
+            out.write_tiles(tiles_to_copy)
+
+
+def _difference_attached(out, left, right):
+    """Write tiles from the database attached as left that are not in the
+    database attached as right to out, using set operations within SQLite.
+    """
+
+    _run_transaction(
+        out,
+        [
+            "INSERT INTO main.metadata (name, value) "
+            "SELECT name, value FROM {left}.metadata".format(left=left),
+            (
+                "INSERT INTO main.map (zoom_level, tile_column, tile_row, tile_id) "
+                "SELECT m.zoom_level, m.tile_column, m.tile_row, m.tile_id "
+                "FROM {left}.map m "
+                "WHERE EXISTS "
+                "(SELECT 1 FROM {left}.images i WHERE i.tile_id = m.tile_id) "
+                "AND NOT EXISTS (SELECT 1 FROM {right}.tiles t "
+                "WHERE t.zoom_level=m.zoom_level AND t.tile_column=m.tile_column "
+                "AND t.tile_row=m.tile_row)"
+            ).format(left=left, right=right),
+            (
+                "INSERT INTO main.images (tile_id, tile_data) "
+                "SELECT s.tile_id, s.tile_data "
+                "FROM (SELECT DISTINCT tile_id FROM main.map) ids "
+                "JOIN {left}.images s ON s.tile_id = ids.tile_id"
+            ).format(left=left),
+        ],
+    )
+    out._meta = None  # reload on next use
+
+
+def _recoder(source, target, hash_func):
+    """Return a function that decompresses tile data using source (or the
+    codec detected from the data if source is None), compresses it using
+    target, and returns (tile_id, data).
     """
 
-    with MBtiles(leftfilename) as left, MBtiles(rightfilename) as right, MBtiles(
-        outfilename, "w"
-    ) as out:
-        out.meta = left.meta
+    def recode(data):
+        codec = source or detect_codec(data)
+        if codec is not None:
+            data = codec.decompress(data)
+        if target is not None:
+            data = target.compress(data)
+        return hash_func(data), data
 
-        for batch in left.list_tiles_batched(batch_size):
-            tiles_to_copy = [tile for tile in batch if not right.has_tile(*tile)]
+    return recode
+
+
+def _recompress_images(mbtiles, images, recode, pool, batch_size):
+    """Write recompressed tile data from the images table to main.images of
+    mbtiles, and record the new tile_id of each old tile_id in
+    temp.tile_id_map.
+
+    Returns
+    -------
+    (size of tile data before, size of tile data after)
+    """
+
+    cursor = mbtiles._cursor
+    cursor.execute("CREATE TEMP TABLE tile_id_map (old TEXT PRIMARY KEY, new TEXT)")
+    cursor.execute(
+        "INSERT INTO temp.tile_id_map (old) SELECT tile_id FROM {0}".format(images)
+    )
+
+    # images are read in the order of the snapshot of tile_ids, so that
+    # recompressed images written to the same table are not read again
+    query = (
+        "SELECT m.rowid, i.tile_data FROM temp.tile_id_map m "
+        "JOIN {0} i ON i.tile_id = m.old "
+        "WHERE m.rowid > ? ORDER BY m.rowid LIMIT ?"
+    ).format(images)
+
+    bytes_before = bytes_after = 0
+    last_rowid = 0
+    while True:
+        cursor.execute(query, (last_rowid, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        last_rowid = rows[-1][0]
+        recoded = pool.map(recode, [bytes(row[1] or b"") for row in rows])
+
+        cursor.executemany(
+            "INSERT OR IGNORE INTO main.images (tile_id, tile_data) VALUES (?, ?)",
+            recoded,
+        )
+        cursor.executemany(
+            "UPDATE temp.tile_id_map SET new=? WHERE rowid=?",
+            [(tile_id, row[0]) for (tile_id, _), row in zip(recoded, rows)],
+        )
+
+        bytes_before += sum(len(row[1] or b"") for row in rows)
+        bytes_after += sum(len(data) for _, data in recoded)
+
+    return bytes_before, bytes_after
+
+
+def recompress(
+    filename,
+    outfilename=None,
+    compression="gzip",
+    compression_level=None,
+    source_compression=None,
+    batch_size=1000,
+    workers=None,
+):
+    """
+    Recompress the tile data of a tileset, in place or to a new file.
+
+    tile_ids are recalculated from the recompressed tile data.  In place, the
+    tileset is changed in a single transaction; the file does not become
+    smaller until it is vacuumed (see compact).
+
+    Parameters
+    ----------
+    filename : str
+        name of tileset to recompress
+    outfilename : str, optional (default: None)
+        name of output tileset.  If None, filename is recompressed in place.
+    compression : str or Codec, optional (default: 'gzip')
+        codec used to compress tile data; see compression.CODECS.  If None,
+        tile data are stored decompressed.
+    compression_level : int, optional (default: None)
+        compression level; if None, the default level of the codec is used
+    source_compression : str or Codec, optional (default: None)
+        codec used to compress tile data in filename.  If None, gzip or zstd
+        are detected from the tile data of each tile (see
+        compression.detect_codec); other tiles are compressed as is.
+    batch_size : int, optional (default: 1000)
+        number of tiles recompressed at a time
+    workers : int, optional (default: None)
+        number of threads used to recompress tiles; defaults to the number
+        of CPUs
 
-            if tiles_to_copy:
-                out.write_tiles(
-                    Tile(*tile, data=left.read_tile(*tile)) for tile in tiles_to_copy
+    Returns
+    -------
+    dict with:
+        tiles: number of distinct tile data recompressed
+        bytes_before: size of tile data before recompressing
+        bytes_after: size of tile data after recompressing
+    """
+
+    target = get_codec(compression, compression_level) if compression else None
+    source = get_codec(source_compression) if source_compression else None
+
+    pool = ThreadPool(workers)
+    try:
+        if outfilename is None:
+            with MBtiles(filename, "r+", profile="safe") as mbtiles:
+                if mbtiles._coords_table != "map":
+                    raise ValueError(
+                        "Tilesets without map and images tables can only be "
+                        "recompressed to a new file"
+                    )
+
+                statements = [
+                    "UPDATE main.map SET tile_id = "
+                    "(SELECT new FROM temp.tile_id_map WHERE old = map.tile_id)",
+                    "DELETE FROM main.images WHERE tile_id IN "
+                    "(SELECT old FROM temp.tile_id_map WHERE old != new) "
+                    "AND tile_id NOT IN (SELECT new FROM temp.tile_id_map)",
+                ]
+                if mbtiles._has_stats_table:
+                    statements.append("DELETE FROM main.tile_stats")
+
+                result = _recompress_in_transaction(
+                    mbtiles, "main.images", statements, target, source, pool, batch_size
                 )
+                mbtiles._stats = {}
+                return result
+
+        with MBtiles(outfilename, "w") as out:
+            _attach(out, filename, "source")
+            try:
+                if _has_tile_tables(out, "source"):
+                    return _recompress_in_transaction(
+                        out,
+                        "source.images",
+                        [
+                            "INSERT INTO main.metadata (name, value) "
+                            "SELECT name, value FROM source.metadata",
+                            "INSERT INTO main.map "
+                            "(zoom_level, tile_column, tile_row, tile_id) "
+                            "SELECT s.zoom_level, s.tile_column, s.tile_row, t.new "
+                            "FROM source.map s "
+                            "JOIN temp.tile_id_map t ON t.old = s.tile_id",
+                        ],
+                        target,
+                        source,
+                        pool,
+                        batch_size,
+                    )
+            finally:
+                _detach(out, "source")
+
+            with MBtiles(filename) as src:
+                return _recompress_tiles(src, out, target, source, pool, batch_size)
+
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _recompress_in_transaction(
+    mbtiles, images, statements, target, source, pool, batch_size
+):
+    """Recompress images into mbtiles, then run statements that update map
+    using temp.tile_id_map, in a single transaction.
+    """
+
+    recode = _recoder(source, target, mbtiles._hash_func)
+    cursor = mbtiles._cursor
+    cursor.execute("BEGIN")
+    try:
+        bytes_before, bytes_after = _recompress_images(
+            mbtiles, images, recode, pool, batch_size
+        )
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("SELECT count(*) FROM temp.tile_id_map")
+        count = cursor.fetchone()[0]
+        cursor.execute("DROP TABLE temp.tile_id_map")
+        cursor.execute("COMMIT")
+
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    mbtiles._meta = None  # reload on next use
+    return {"tiles": count, "bytes_before": bytes_before, "bytes_after": bytes_after}
+
+
+def _recompress_tiles(src, out, target, source, pool, batch_size):
+    """Write recompressed tiles from src MBtiles to out MBtiles one batch at a
+    time.
+    """
+
+    out.meta = _tileset_meta(src.meta)
+    recode = _recoder(source, target, out._hash_func)
+
+    count = bytes_before = bytes_after = 0
+    for batch in src.list_tiles_batched(batch_size, data=True):
+        recoded = pool.map(recode, [tile.data for tile in batch])
+        out.write_tiles(
+            Tile(tile.z, tile.x, tile.y, data)
+            for tile, (_, data) in zip(batch, recoded)
+        )
+
+        count += len(batch)
+        bytes_before += sum(len(tile.data) for tile in batch)
+        bytes_after += sum(len(data) for _, data in recoded)
+
+    return {"tiles": count, "bytes_before": bytes_before, "bytes_after": bytes_after}
+
+
+# Table of tiles to delete when a patch is applied
+DELETIONS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS deletions (zoom_level INTEGER, tile_column INTEGER, "
+    "tile_row INTEGER, PRIMARY KEY (zoom_level, tile_column, tile_row))"
+)
+
+_SAME_COORDS = (
+    "{0}.zoom_level={1}.zoom_level AND {0}.tile_column={1}.tile_column "
+    "AND {0}.tile_row={1}.tile_row"
+)
+
+
+def diff(oldfilename, newfilename, patchfilename, compare="tile_id"):
+    """
+    Create a patch tileset with the changes from old to new, which can be
+    applied to old using apply_patch.
+
+    The patch contains tiles in new that are not in old or have different
+    tile data, the metadata of new, and a deletions table with the (z, x, y)
+    of tiles in old that are not in new.
+
+    Parameters
+    ----------
+    oldfilename : str
+        previous version of tileset
+    newfilename : str
+        current version of tileset
+    patchfilename : str
+        output patch tileset
+    compare : str, one of ('tile_id', 'data') (default: 'tile_id')
+        how tiles are compared.  'tile_id' compares the tile_id of tiles,
+        which is much faster, but is only valid if both tilesets calculate
+        tile_ids the same way from tile data (e.g., both were written by
+        this library with the same tile_id_hash).  'data' compares tile data.
+        Tilesets that store tiles in a single tiles table are always compared
+        by tile data.
+
+    Returns
+    -------
+    dict with number of tiles added, changed, and deleted
+    """
+
+    if compare not in ("tile_id", "data"):
+        raise ValueError("compare must be one of: tile_id, data")
+
+    with MBtiles(patchfilename, "w") as patch:
+        _attach(patch, oldfilename, "old")
+        _attach(patch, newfilename, "new")
+        try:
+            has_tile_tables = {
+                alias: _has_tile_tables(patch, alias) for alias in ("old", "new")
+            }
+            if _attached_scheme(patch, "old") != _attached_scheme(patch, "new"):
+                raise ValueError(
+                    "old and new tilesets store tile rows in different schemes; "
+                    "use MBtiles.rewrite_scheme first"
+                )
+
+            old_coords = "map" if has_tile_tables["old"] else "tiles"
+            new_coords = "map" if has_tile_tables["new"] else "tiles"
+
+            if compare == "tile_id" and all(has_tile_tables.values()):
+                changed = (
+                    "FROM new.map n WHERE NOT EXISTS (SELECT 1 FROM old.map o "
+                    "WHERE {0} AND o.tile_id=n.tile_id)"
+                ).format(_SAME_COORDS.format("o", "n"))
+                statements = [
+                    "INSERT INTO main.map (zoom_level, tile_column, tile_row, tile_id) "
+                    "SELECT n.zoom_level, n.tile_column, n.tile_row, n.tile_id "
+                    + changed,
+                    "INSERT INTO main.images (tile_id, tile_data) "
+                    "SELECT s.tile_id, s.tile_data "
+                    "FROM (SELECT DISTINCT tile_id FROM main.map) ids "
+                    "JOIN new.images s ON s.tile_id = ids.tile_id",
+                ]
+
+            else:
+                # tile_ids are calculated from the tile data that differ
+                patch._db.create_function("pymbtiles_tile_id", 1, patch._hash_func)
+                changed = (
+                    "FROM new.tiles n WHERE NOT EXISTS (SELECT 1 FROM old.tiles o "
+                    "WHERE {0} AND o.tile_data=n.tile_data)"
+                ).format(_SAME_COORDS.format("o", "n"))
+                statements = [
+                    "INSERT OR IGNORE INTO main.images (tile_id, tile_data) "
+                    "SELECT pymbtiles_tile_id(n.tile_data), n.tile_data " + changed,
+                    "INSERT INTO main.map (zoom_level, tile_column, tile_row, tile_id) "
+                    "SELECT n.zoom_level, n.tile_column, n.tile_row, "
+                    "pymbtiles_tile_id(n.tile_data) " + changed,
+                ]
+
+            statements += [
+                DELETIONS_SCHEMA,
+                (
+                    "INSERT INTO main.deletions "
+                    "SELECT o.zoom_level, o.tile_column, o.tile_row FROM old.{0} o "
+                    "WHERE NOT EXISTS (SELECT 1 FROM new.{1} n WHERE {2})"
+                ).format(old_coords, new_coords, _SAME_COORDS.format("o", "n")),
+                "INSERT INTO main.metadata (name, value) "
+                "SELECT name, value FROM new.metadata",
+            ]
+            _run_transaction(patch, statements)
+
+            cursor = patch._cursor
+            cursor.execute(
+                "SELECT count(*) FROM main.map m WHERE EXISTS "
+                "(SELECT 1 FROM old.{0} o WHERE {1})".format(
+                    old_coords, _SAME_COORDS.format("o", "m")
+                )
+            )
+            changed_count = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM main.map")
+            total = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM main.deletions")
+            deleted = cursor.fetchone()[0]
+
+        finally:
+            _detach(patch, "old")
+            _detach(patch, "new")
+
+    return {
+        "added": total - changed_count,
+        "changed": changed_count,
+        "deleted": deleted,
+    }
+
+
+def apply_patch(patchfilename, targetfilename):
+    """
+    Apply a patch created by diff to target, in a single transaction.
+
+    Tiles in the deletions table of the patch are deleted from target, tiles
+    in the patch are added to or replace tiles in target, and the metadata of
+    target are replaced by those of the patch.
+
+    Tile data in target that are no longer used by any tile are not removed;
+    use compact to remove them.
+
+    Parameters
+    ----------
+    patchfilename : str
+        patch tileset created by diff
+    targetfilename : str
+        tileset to update, usually the old tileset used to create the patch
+    """
+
+    with MBtiles(targetfilename, "r+") as target:
+        _attach(target, patchfilename, "patch")
+        try:
+            target._cursor.execute(
+                "SELECT count(*) FROM patch.sqlite_master "
+                "WHERE type='table' AND name='deletions'"
+            )
+            if not target._cursor.fetchone()[0]:
+                raise ValueError("Not a patch: {0}".format(patchfilename))
+
+            if _attached_scheme(target, "patch") != target._stored_scheme:
+                raise ValueError(
+                    "patch and target store tile rows in different schemes; use "
+                    "MBtiles.rewrite_scheme first"
+                )
+
+            patch_coords = (
+                "SELECT zoom_level, tile_column, tile_row FROM patch.deletions "
+                "UNION ALL SELECT zoom_level, tile_column, tile_row FROM patch.map"
+            )
+
+            if target._coords_table == "map":
+                if _has_conflicting_images(target, "patch"):
+                    raise ValueError(
+                        "tile_ids in patch refer to different tile data than in target"
+                    )
+
+                statements = [
+                    "DELETE FROM main.map WHERE (zoom_level, tile_column, tile_row) "
+                    "IN ({0})".format(patch_coords),
+                    "INSERT INTO main.images (tile_id, tile_data) "
+                    "SELECT p.tile_id, p.tile_data FROM patch.images p "
+                    "WHERE NOT EXISTS "
+                    "(SELECT 1 FROM main.images i WHERE i.tile_id = p.tile_id)",
+                    "INSERT INTO main.map (zoom_level, tile_column, tile_row, tile_id) "
+                    "SELECT zoom_level, tile_column, tile_row, tile_id FROM patch.map",
+                ]
+
+            else:
+                statements = [
+                    "DELETE FROM main.tiles WHERE (zoom_level, tile_column, tile_row) "
+                    "IN ({0})".format(patch_coords),
+                    "INSERT INTO main.tiles "
+                    "(zoom_level, tile_column, tile_row, tile_data) "
+                    "SELECT zoom_level, tile_column, tile_row, tile_data "
+                    "FROM patch.tiles",
+                ]
+
+            statements += [
+                "DELETE FROM main.metadata",
+                "INSERT INTO main.metadata (name, value) "
+                "SELECT name, value FROM patch.metadata",
+            ]
+            if target._has_stats_table:
+                statements.append("DELETE FROM main.tile_stats")
+
+            _run_transaction(target, statements)
+            target._stats = {}
+            target._meta = None
+
+        finally:
+            _detach(target, "patch")
+
+
+def compact(filename, outfilename=None, vacuum="full", batch_size=10000):
+    """
+    Delete tile data that are no longer used by any tile and vacuum the
+    tileset, in place or to a new file.
+
+    Parameters
+    ----------
+    filename : str
+        name of tileset to compact
+    outfilename : str, optional (default: None)
+        name of compacted copy of the tileset; filename is not changed.  If
+        None, filename is compacted in place.
+    vacuum : str, one of VACUUM_MODES, optional (default: 'full')
+        how to vacuum the compacted tileset; see MBtiles.compact.  A copy is
+        written once, using auto_vacuum INCREMENTAL if filename does not use
+        auto_vacuum, and vacuumed incrementally unless vacuum is None.
+    batch_size : int, optional (default: 10000)
+        number of tile data deleted in each transaction
+
+    Returns
+    -------
+    dict; see MBtiles.compact.  For a copy, bytes_before is the size of
+    filename.
+    """
+
+    if vacuum is not None and vacuum not in VACUUM_MODES:
+        raise ValueError("vacuum must be one of: {0}".format(", ".join(VACUUM_MODES)))
+
+    if outfilename is None:
+        with MBtiles(filename, "r+", profile="safe") as mbtiles:
+            return mbtiles.compact(vacuum=vacuum, batch_size=batch_size)
+
+    if os.path.exists(outfilename):
+        raise ValueError("{0} already exists".format(outfilename))
+
+    # filename is left unchanged.  VACUUM INTO writes a copy without free
+    # pages, using auto_vacuum INCREMENTAL (unless filename uses auto_vacuum
+    # already) so that the pages of tile data deleted from it are returned
+    # without rewriting the whole copy again.
+    with MBtiles(filename) as src:
+        bytes_before = src._database_size()
+        if src._pragma_value("auto_vacuum") == 0:
+            src._cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        src._cursor.execute("VACUUM INTO ?", (outfilename,))
+
+    with MBtiles(outfilename, "r+", profile="safe") as mbtiles:
+        # with auto_vacuum FULL, pages are returned as tile data are deleted
+        if mbtiles._pragma_value("auto_vacuum") != 2:
+            vacuum = None
+        elif vacuum is not None:
+            vacuum = "incremental"
+        result = mbtiles.compact(vacuum=vacuum, batch_size=batch_size)
+
+    result["bytes_before"] = bytes_before
+    result["bytes_reclaimed"] = bytes_before - result["bytes_after"]
+    return result
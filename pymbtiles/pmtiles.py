@@ -0,0 +1,670 @@
+"""Convert between mbtiles files and PMTiles v3 archives.
+
+PMTiles is a single-file format for tilesets that can be read with HTTP range
+requests from static storage.  Tiles are addressed by a tile ID along a
+Hilbert curve within each zoom level, and located using compressed
+directories of entries.  See:
+https://github.com/protomaps/PMTiles/blob/main/spec/v3/spec.md
+
+Conversions stream tiles, so memory use does not depend on the number of
+tiles in the tileset.  Temporary files are created next to the output file.
+"""
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from collections import namedtuple
+
+from pymbtiles import MBtiles, Tile, READ_CHUNK_SIZE, flip_y
+from pymbtiles.compression import detect_codec
+from pymbtiles.convert import _duplicate_tile_ids
+
+MAGIC = b"PMTiles"
+VERSION = 3
+HEADER_SIZE = 127
+
+# The header and root directory must fit in the first 16 KiB of the file
+MAX_ROOT_SIZE = 16384 - HEADER_SIZE
+
+# Number of entries in each leaf directory, increased until the root
+# directory fits within MAX_ROOT_SIZE
+LEAF_SIZE = 4096
+
+COMPRESSION_UNKNOWN = 0
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+COMPRESSION_BROTLI = 3
+COMPRESSION_ZSTD = 4
+
+# Tile compression by the name of the codec detected from tile data
+CODEC_COMPRESSIONS = {"gzip": COMPRESSION_GZIP, "zstd": COMPRESSION_ZSTD}
+
+TILE_TYPES = {"pbf": 1, "mvt": 1, "png": 2, "jpg": 3, "jpeg": 3, "webp": 4, "avif": 5}
+FORMATS = {1: "pbf", 2: "png", 3: "jpg", 4: "webp", 5: "avif"}
+
+Header = namedtuple(
+    "Header",
+    [
+        "root_offset",
+        "root_length",
+        "metadata_offset",
+        "metadata_length",
+        "leaf_offset",
+        "leaf_length",
+        "data_offset",
+        "data_length",
+        "addressed_tiles",
+        "tile_entries",
+        "tile_contents",
+        "clustered",
+        "internal_compression",
+        "tile_compression",
+        "tile_type",
+        "min_zoom",
+        "max_zoom",
+        "min_lon",
+        "min_lat",
+        "max_lon",
+        "max_lat",
+        "center_zoom",
+        "center_lon",
+        "center_lat",
+    ],
+)
+
+# run_length is 0 for entries that point to leaf directories
+Entry = namedtuple("Entry", ["tile_id", "offset", "length", "run_length"])
+
+_HEADER = struct.Struct("<7sB11Q6B4iB2i")
+
+# Entries are buffered in a temporary file in this format
+_ENTRY = struct.Struct("<QQII")
+
+
+def _rotate(n, x, y, rx, ry):
+    if ry == 0:
+        if rx == 1:
+            x = n - 1 - x
+            y = n - 1 - y
+        return y, x
+    return x, y
+
+
+def zxy_to_tileid(z, x, y):
+    """
+    Return the PMTiles tile ID for a tile.
+
+    Parameters
+    ----------
+    z: int
+        zoom level
+    x: int
+        tile column
+    y: int
+        tile row in the XYZ tile scheme
+
+    Returns
+    -------
+    int
+    """
+
+    if x >= 1 << z or y >= 1 << z:
+        raise ValueError("Tile {0}/{1}/{2} is outside the zoom level".format(z, x, y))
+
+    # number of tiles in all lower zoom levels
+    acc = ((1 << (2 * z)) - 1) // 3
+    n = 1 << z
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        x, y = _rotate(n, x, y, rx, ry)
+        s >>= 1
+
+    return acc + d
+
+
+def tileid_to_zxy(tile_id):
+    """
+    Return the (z, x, y) of a PMTiles tile ID, with y in the XYZ tile scheme.
+
+    Parameters
+    ----------
+    tile_id: int
+
+    Returns
+    -------
+    (z, x, y) tuple
+    """
+
+    acc = 0
+    z = 0
+    while acc + (1 << (2 * z)) <= tile_id:
+        acc += 1 << (2 * z)
+        z += 1
+
+    t = tile_id - acc
+    x = y = 0
+    s = 1
+    while s < 1 << z:
+        rx = 1 & (t >> 1)
+        ry = 1 & (t ^ rx)
+        x, y = _rotate(s, x, y, rx, ry)
+        x += s * rx
+        y += s * ry
+        t >>= 2
+        s <<= 1
+
+    return z, x, y
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data, compression):
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompress(data, 31)
+
+    if compression == COMPRESSION_NONE:
+        return data
+
+    raise ValueError("Unsupported internal compression: {0}".format(compression))
+
+
+def _serialize_directory(entries):
+    out = bytearray()
+    _write_varint(out, len(entries))
+
+    last_id = 0
+    for entry in entries:
+        _write_varint(out, entry.tile_id - last_id)
+        last_id = entry.tile_id
+
+    for entry in entries:
+        _write_varint(out, entry.run_length)
+
+    for entry in entries:
+        _write_varint(out, entry.length)
+
+    for i, entry in enumerate(entries):
+        # 0 means the entry immediately follows the previous one
+        if i > 0 and entry.offset == entries[i - 1].offset + entries[i - 1].length:
+            _write_varint(out, 0)
+        else:
+            _write_varint(out, entry.offset + 1)
+
+    return _compress(bytes(out))
+
+
+def _deserialize_directory(data):
+    data = bytearray(data)
+    num_entries, pos = _read_varint(data, 0)
+
+    tile_ids = []
+    last_id = 0
+    for _ in range(num_entries):
+        delta, pos = _read_varint(data, pos)
+        last_id += delta
+        tile_ids.append(last_id)
+
+    columns = []
+    for _ in range(2):
+        values = []
+        for _ in range(num_entries):
+            value, pos = _read_varint(data, pos)
+            values.append(value)
+        columns.append(values)
+    run_lengths, lengths = columns
+
+    entries = []
+    for i in range(num_entries):
+        value, pos = _read_varint(data, pos)
+        if value == 0 and i > 0:
+            offset = entries[i - 1].offset + entries[i - 1].length
+        else:
+            offset = value - 1
+        entries.append(Entry(tile_ids[i], offset, lengths[i], run_lengths[i]))
+
+    return entries
+
+
+def read_header(f):
+    """
+    Read the header of a PMTiles file.
+
+    Parameters
+    ----------
+    f: file object opened in binary mode
+
+    Returns
+    -------
+    Header
+    """
+
+    f.seek(0)
+    values = _HEADER.unpack(f.read(HEADER_SIZE))
+    if values[0] != MAGIC or values[1] != VERSION:
+        raise ValueError("Not a PMTiles v3 file")
+
+    return Header(*values[2:])
+
+
+def _iter_sorted_tiles(src, batch_size):
+    """
+    Return an iterator over batches of (tile ID, key) tuples of tiles in src
+    in tile ID order, and a function that reads tile data for a set of keys.
+
+    Tiles that share tile data have the same key.
+    """
+
+    # PMTiles tile IDs use rows in the XYZ scheme
+    if src._stored_scheme == "xyz":
+        tile_id = zxy_to_tileid
+    else:
+        tile_id = lambda z, x, y: zxy_to_tileid(z, x, flip_y(z, y))  # noqa: E731
+    src._db.create_function("pmtiles_tile_id", 3, tile_id)
+
+    if src._coords_table == "map":
+        # only coordinates and tile_ids are sorted; tile data are read by
+        # tile_id for each batch
+        query = (
+            "SELECT pmtiles_tile_id(zoom_level, tile_column, tile_row) AS id, tile_id "
+            "FROM map ORDER BY id"
+        )
+
+        def read_data(keys):
+            keys = list(keys)
+            data = {}
+            for i in range(0, len(keys), READ_CHUNK_SIZE):
+                chunk = keys[i : i + READ_CHUNK_SIZE]
+                src._cursor.execute(
+                    "SELECT tile_id, tile_data FROM images WHERE tile_id IN ({0})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                )
+                data.update(src._cursor.fetchall())
+            return data
+
+    else:
+        query = (
+            "SELECT pmtiles_tile_id(zoom_level, tile_column, tile_row) AS id, "
+            "tile_data FROM tiles ORDER BY id"
+        )
+
+        def read_data(keys):
+            return {key: key for key in keys}
+
+    def batches():
+        cursor = src._db.cursor()
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    return batches(), read_data
+
+
+def _write_entries(entries, f):
+    for entry in entries:
+        f.write(_ENTRY.pack(*entry))
+
+
+def _read_entries(f, count):
+    f.seek(0)
+    while True:
+        data = f.read(_ENTRY.size * count)
+        if not data:
+            return
+        yield [
+            Entry(*_ENTRY.unpack_from(data, i))
+            for i in range(0, len(data), _ENTRY.size)
+        ]
+
+
+def _build_directories(entries_file, num_entries, leaves_file, leaf_size):
+    """
+    Serialize entries to a root directory, and leaf directories written to
+    leaves_file if all entries do not fit in the root directory.
+
+    Returns
+    -------
+    (root directory bytes, length of leaf directories)
+    """
+
+    if num_entries <= MAX_ROOT_SIZE:
+        entries = [
+            entry for chunk in _read_entries(entries_file, LEAF_SIZE) for entry in chunk
+        ]
+        root = _serialize_directory(entries)
+        if len(root) <= MAX_ROOT_SIZE:
+            return root, 0
+
+    while True:
+        leaves_file.seek(0)
+        leaves_file.truncate()
+        root_entries = []
+        offset = 0
+        for chunk in _read_entries(entries_file, leaf_size):
+            leaf = _serialize_directory(chunk)
+            leaves_file.write(leaf)
+            root_entries.append(Entry(chunk[0].tile_id, offset, len(leaf), 0))
+            offset += len(leaf)
+
+        root = _serialize_directory(root_entries)
+        if len(root) <= MAX_ROOT_SIZE:
+            return root, offset
+
+        leaf_size = max(int(leaf_size * 1.2), leaf_size + 1)
+
+
+def _write_tile_data(src, batch_size, data_file, entries_file):
+    """
+    Write tile data of src to data_file and entries to entries_file, in tile
+    ID order.
+
+    Returns
+    -------
+    dict of header values
+    """
+
+    duplicates = _duplicate_tile_ids(src)
+    batches, read_data = _iter_sorted_tiles(src, batch_size)
+
+    offsets = {}  # key: (offset, length) of duplicated tile data
+    entry = None
+    last_key = None
+    data_length = 0
+    addressed_tiles = tile_entries = tile_contents = 0
+    tile_compression = COMPRESSION_NONE
+
+    for rows in batches:
+        tile_data = read_data(
+            {key for _, key in rows if key not in offsets and key != last_key}
+        )
+        entries = []
+        for tile_id, key in rows:
+            addressed_tiles += 1
+
+            if key == last_key and tile_id == entry.tile_id + entry.run_length:
+                entry = entry._replace(run_length=entry.run_length + 1)
+                continue
+
+            if key in offsets:
+                offset, length = offsets[key]
+
+            elif key == last_key:
+                offset, length = entry.offset, entry.length
+
+            else:
+                data = tile_data[key] or b""
+                if not tile_contents:
+                    codec = detect_codec(data)
+                    if codec is not None:
+                        tile_compression = CODEC_COMPRESSIONS.get(
+                            codec.name, COMPRESSION_UNKNOWN
+                        )
+
+                data_file.write(data)
+                offset, length = data_length, len(data)
+                data_length += length
+                tile_contents += 1
+                if key in duplicates:
+                    offsets[key] = (offset, length)
+
+            if entry is not None:
+                entries.append(entry)
+            entry = Entry(tile_id, offset, length, 1)
+            last_key = key
+
+        _write_entries(entries, entries_file)
+        tile_entries += len(entries)
+
+    if entry is not None:
+        _write_entries([entry], entries_file)
+        tile_entries += 1
+
+    return {
+        "data_length": data_length,
+        "addressed_tiles": addressed_tiles,
+        "tile_entries": tile_entries,
+        "tile_contents": tile_contents,
+        "tile_compression": tile_compression,
+    }
+
+
+def _e7(value):
+    return int(round(float(value) * 10000000))
+
+
+def mbtiles_to_pmtiles(
+    filename, pmtiles_filename, batch_size=1000, leaf_size=LEAF_SIZE
+):
+    """
+    Convert an mbtiles file to a PMTiles v3 file.
+
+    Tiles that share tile data in the mbtiles file are stored once, and runs
+    of consecutive tiles with the same tile data are stored as a single
+    directory entry.  Directories and metadata are gzip compressed; tile data
+    are stored as they are in the mbtiles file.
+
+    Parameters
+    ----------
+    filename: string
+        name of mbtiles file
+    pmtiles_filename: string
+        name of PMTiles file; overwritten if it exists
+    batch_size: int, optional (default: 1000)
+        number of tiles read from the mbtiles file at a time
+    leaf_size: int, optional (default: 4096)
+        initial number of entries in each leaf directory, if the directory
+        is too large to fit within the root directory
+
+    Returns
+    -------
+    Header of the PMTiles file
+    """
+
+    tmpdir = tempfile.mkdtemp(
+        prefix=".pmtiles", dir=os.path.dirname(os.path.abspath(pmtiles_filename))
+    )
+    try:
+        with open(os.path.join(tmpdir, "data"), "w+b") as data_file, open(
+            os.path.join(tmpdir, "entries"), "w+b"
+        ) as entries_file, open(os.path.join(tmpdir, "leaves"), "w+b") as leaves_file:
+
+            # sort tiles in temporary files rather than in memory
+            with MBtiles(filename, pragmas={"temp_store": "FILE"}) as src:
+                meta = dict(src.meta)
+                min_zoom, max_zoom = src.zoom_range()
+                values = _write_tile_data(src, batch_size, data_file, entries_file)
+
+            root, leaf_length = _build_directories(
+                entries_file, values["tile_entries"], leaves_file, leaf_size
+            )
+
+            metadata = {k: v for k, v in meta.items() if k != "json"}
+            if "json" in meta:
+                metadata.update(json.loads(meta["json"]))
+            metadata = _compress(json.dumps(metadata).encode("utf-8"))
+
+            bounds = meta.get("bounds", "-180,-85.05112878,180,85.05112878").split(",")
+            if "center" in meta:
+                center = meta["center"].split(",")
+            else:
+                center = [
+                    (float(bounds[0]) + float(bounds[2])) / 2,
+                    (float(bounds[1]) + float(bounds[3])) / 2,
+                    min_zoom or 0,
+                ]
+
+            header = Header(
+                root_offset=HEADER_SIZE,
+                root_length=len(root),
+                metadata_offset=HEADER_SIZE + len(root),
+                metadata_length=len(metadata),
+                leaf_offset=HEADER_SIZE + len(root) + len(metadata),
+                leaf_length=leaf_length,
+                data_offset=HEADER_SIZE + len(root) + len(metadata) + leaf_length,
+                clustered=1,
+                internal_compression=COMPRESSION_GZIP,
+                tile_type=TILE_TYPES.get(meta.get("format"), 0),
+                min_zoom=min_zoom or 0,
+                max_zoom=max_zoom or 0,
+                min_lon=_e7(bounds[0]),
+                min_lat=_e7(bounds[1]),
+                max_lon=_e7(bounds[2]),
+                max_lat=_e7(bounds[3]),
+                center_zoom=int(center[2]),
+                center_lon=_e7(center[0]),
+                center_lat=_e7(center[1]),
+                **values
+            )
+
+            with open(pmtiles_filename, "wb") as out:
+                out.write(_HEADER.pack(MAGIC, VERSION, *header))
+                out.write(root)
+                out.write(metadata)
+                for f in (leaves_file, data_file):
+                    f.seek(0)
+                    shutil.copyfileobj(f, out)
+
+        return header
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _iter_entries(f, header, offset, length):
+    """Iterate over tile entries in the directory at offset, depth first."""
+
+    f.seek(offset)
+    directory = _deserialize_directory(
+        _decompress(f.read(length), header.internal_compression)
+    )
+    for entry in directory:
+        if entry.run_length:
+            yield entry
+        else:
+            for leaf_entry in _iter_entries(
+                f, header, header.leaf_offset + entry.offset, entry.length
+            ):
+                yield leaf_entry
+
+
+def _from_e7(value):
+    return value / 10000000.0
+
+
+def pmtiles_to_mbtiles(pmtiles_filename, filename, batch_size=1000):
+    """
+    Convert a PMTiles v3 file to an mbtiles file.
+
+    Parameters
+    ----------
+    pmtiles_filename: string
+        name of PMTiles file
+    filename: string
+        name of mbtiles file; overwritten if it exists
+    batch_size: int, optional (default: 1000)
+        number of tiles written to the mbtiles file in each transaction
+
+    Returns
+    -------
+    int: number of tiles written
+    """
+
+    count = 0
+    with open(pmtiles_filename, "rb") as f, MBtiles(filename, mode="w") as out:
+        header = read_header(f)
+
+        f.seek(header.metadata_offset)
+        metadata = json.loads(
+            _decompress(
+                f.read(header.metadata_length), header.internal_compression
+            ).decode("utf-8")
+        )
+
+        meta = {
+            "format": FORMATS.get(header.tile_type, ""),
+            "minzoom": str(header.min_zoom),
+            "maxzoom": str(header.max_zoom),
+            "bounds": ",".join(
+                str(_from_e7(v))
+                for v in (
+                    header.min_lon,
+                    header.min_lat,
+                    header.max_lon,
+                    header.max_lat,
+                )
+            ),
+            "center": "{0},{1},{2}".format(
+                _from_e7(header.center_lon),
+                _from_e7(header.center_lat),
+                header.center_zoom,
+            ),
+        }
+        json_meta = {}
+        for key, value in metadata.items():
+            if isinstance(value, (dict, list)):
+                json_meta[key] = value
+            else:
+                meta[key] = str(value)
+        if json_meta:
+            meta["json"] = json.dumps(json_meta)
+        out.meta = meta
+
+        batch = []
+        last = None
+        for entry in _iter_entries(f, header, header.root_offset, header.root_length):
+            if (entry.offset, entry.length) != last:
+                f.seek(header.data_offset + entry.offset)
+                data = f.read(entry.length)
+                last = (entry.offset, entry.length)
+
+            # runs may address many tiles, so batches are written within runs
+            for tile_id in range(entry.tile_id, entry.tile_id + entry.run_length):
+                z, x, y = tileid_to_zxy(tile_id)
+                batch.append(Tile(z, x, flip_y(z, y), data))
+
+                if len(batch) >= batch_size:
+                    out.write_tiles(batch)
+                    count += len(batch)
+                    batch = []
+
+        if batch:
+            out.write_tiles(batch)
+            count += len(batch)
+
+    return count
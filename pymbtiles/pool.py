@@ -0,0 +1,284 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from pymbtiles import MBtiles, IS_PY2
+from pymbtiles.cache import NOT_CACHED
+
+if IS_PY2:  # pragma: no cover
+    from Queue import Queue, Empty
+else:
+    from queue import Queue, Empty
+
+
+class MBtilesPool(object):
+    """
+    Pool of read-only connections to an mbtiles file that can be shared
+    between threads, for example by the request threads of a tile server.
+
+    Each thread checks out its own connection for the duration of a call, so
+    reads are not serialized behind a single cursor.  Connections are opened
+    as needed up to size, and kept open for the lifetime of the pool so that
+    the statements used to read tiles stay prepared in each connection's
+    statement cache.
+    """
+
+    def __init__(
+        self,
+        filename,
+        size=4,
+        profile="readonly_serving",
+        immutable=False,
+        timeout=None,
+        cache=None,
+        scheme="tms",
+    ):
+        """
+        Creates a pool of connections to an existing mbtiles file.
+
+        Parameters
+        ----------
+        filename: string
+            name of mbtiles file
+        size: int, optional (default: 4)
+            maximum number of open connections
+        profile: string, optional (default: 'readonly_serving')
+            connection profile; see MBtiles
+        immutable: bool, optional (default: False)
+            if True, open the file as immutable; see MBtiles
+        timeout: float, optional (default: None)
+            maximum number of seconds to wait for a connection before raising
+            an error.  If None, waits indefinitely.
+        cache: TileCache, optional (default: None)
+            if present, tiles read are cached in this cache, shared by all
+            connections
+        scheme: string, one of SCHEMES (default: 'tms')
+            tile scheme of tile rows read; see MBtiles
+        """
+
+        if size < 1:
+            raise ValueError("size must be at least 1")
+
+        self.filename = filename
+        self.size = size
+        self._profile = profile
+        self._immutable = immutable
+        self._timeout = timeout
+        self.cache = cache
+        self.scheme = scheme
+
+        self._available = Queue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._hits = 0
+        self._misses = 0
+
+        # open the first connection now so that invalid files fail early
+        self._available.put(self._open())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _open(self):
+        mbtiles = MBtiles(
+            self.filename,
+            profile=self._profile,
+            immutable=self._immutable,
+            check_same_thread=False,
+            cache=self.cache,
+            scheme=self.scheme,
+        )
+        self._connections.append(mbtiles)
+        return mbtiles
+
+    def _checkout(self):
+        if self._closed:
+            raise ValueError("pool is closed")
+
+        try:
+            mbtiles = self._available.get_nowait()
+
+        except Empty:
+            mbtiles = None
+            with self._lock:
+                if len(self._connections) < self.size:
+                    mbtiles = self._open()
+
+            if mbtiles is None:
+                start = time.time()
+                try:
+                    mbtiles = self._available.get(timeout=self._timeout)
+                except Empty:
+                    raise RuntimeError(
+                        "Timed out waiting for a connection to {0}".format(
+                            self.filename
+                        )
+                    )
+
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time += time.time() - start
+
+        with self._lock:
+            self._checkouts += 1
+
+        return mbtiles
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for exclusive use by the calling thread.
+
+        Use as a context manager; the connection is returned to the pool on
+        exit:
+
+            with pool.connection() as src:
+                src.list_tiles()
+
+        Returns
+        -------
+        MBtiles
+        """
+
+        mbtiles = self._checkout()
+        try:
+            yield mbtiles
+        finally:
+            self._available.put(mbtiles)
+
+    def _count(self, found, total):
+        with self._lock:
+            self._hits += found
+            self._misses += total - found
+
+    def has_tile(self, z, x, y):
+        with self.connection() as mbtiles:
+            return mbtiles.has_tile(z, x, y)
+
+    def read_tile(self, z, x, y):
+        """
+        Get a tile for z, x, y values.  See MBtiles.read_tile.
+        """
+
+        with self.connection() as mbtiles:
+            data = mbtiles.read_tile(z, x, y)
+
+        self._count(data is not None, 1)
+        return data
+
+    def read_tile_id(self, z, x, y):
+        """
+        Get the tile_id of a tile.  See MBtiles.read_tile_id.
+        """
+
+        with self.connection() as mbtiles:
+            return mbtiles.read_tile_id(z, x, y)
+
+    def read_tile_and_id(self, z, x, y):
+        """
+        Get the tile_id and tile data of a tile, read from the same version of
+        the file.  See MBtiles.read_tile_id and MBtiles.read_tile.
+
+        Tile data found in the cache are returned without a tile_id, since the
+        tile_id in the file may be of other tile data.
+
+        Returns
+        -------
+        (tile_id, tile data).  tile data are None if no tile exists.
+        """
+
+        with self.connection() as mbtiles:
+            cache = mbtiles.cache
+            data = NOT_CACHED if cache is None else cache.get((z, x, y))
+            if data is NOT_CACHED:
+                tile_id, data = mbtiles._read_tile_and_id(z, x, y)
+                if cache is not None:
+                    cache.put((z, x, y), data)
+            else:
+                tile_id = None
+
+        self._count(data is not None, 1)
+        return tile_id, data
+
+    def read_tile_id_and_head(self, z, x, y, length):
+        """
+        Get the tile_id of a tile and the first length bytes of its tile data,
+        for example to detect their compression, without reading all tile
+        data into Python.  The cache is not used.
+
+        Returns
+        -------
+        (tile_id, first bytes of tile data).  Both are None if no tile exists.
+        """
+
+        with self.connection() as mbtiles:
+            return mbtiles._read_tile_and_id(z, x, y, length)
+
+    def read_tiles(self, coords):
+        """
+        Get tiles for many (z, x, y) values at once.  See MBtiles.read_tiles.
+        """
+
+        with self.connection() as mbtiles:
+            tiles = mbtiles.read_tiles(coords)
+
+        self._count(sum(1 for tile in tiles if tile.data is not None), len(tiles))
+        return tiles
+
+    @property
+    def meta(self):
+        with self.connection() as mbtiles:
+            return dict(mbtiles.meta)
+
+    @property
+    def stats(self):
+        """
+        Usage statistics of the pool.
+
+        Returns
+        -------
+        dict with:
+            connections: number of open connections
+            checkouts: number of times a connection was checked out
+            waits: number of checkouts that had to wait for a connection
+            wait_time: total seconds spent waiting for a connection
+            wait_rate: fraction of checkouts that had to wait
+            hits: number of tiles read that were present in the tileset
+            misses: number of tiles read that were not present in the tileset
+            hit_rate: fraction of tiles read that were present in the tileset
+        """
+
+        with self._lock:
+            reads = self._hits + self._misses
+            return {
+                "connections": len(self._connections),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "wait_rate": self._waits / float(self._checkouts)
+                if self._checkouts
+                else 0.0,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / float(reads) if reads else 0.0,
+            }
+
+    def close(self):
+        """
+        Close all connections.  Connections that are checked out are closed
+        as well; the pool must not be in use.
+        """
+
+        self._closed = True
+        with self._lock:
+            for mbtiles in self._connections:
+                mbtiles.close()
+            self._connections = []
@@ -0,0 +1,260 @@
+"""Build lower zoom levels (overviews) of raster tilesets from higher zoom levels.
+
+Requires numpy.  Tiles are decoded and encoded using Pillow unless other
+decode and encode functions are provided.
+"""
+
+import multiprocessing
+from io import BytesIO
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from pymbtiles import MBtiles, Tile
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+# Pillow format names by mbtiles format
+PIL_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+# Encoded uniform tiles by (color, shape, image format, encode), in each worker
+_uniform_tiles = {}
+MAX_UNIFORM_TILES = 1024
+
+
+def decode_image(data):
+    """Decode tile data to an RGBA array of shape (height, width, 4) using Pillow."""
+
+    if Image is None:  # pragma: no cover
+        raise ImportError("Pillow is required to decode tiles")
+
+    return np.asarray(Image.open(BytesIO(data)).convert("RGBA"))
+
+
+def encode_image(array, image_format="png"):
+    """Encode an RGBA array of shape (height, width, 4) using Pillow."""
+
+    if Image is None:  # pragma: no cover
+        raise ImportError("Pillow is required to encode tiles")
+
+    image = Image.fromarray(array, "RGBA")
+    pil_format = PIL_FORMATS.get(image_format, image_format.upper())
+    if pil_format == "JPEG":
+        image = image.convert("RGB")
+
+    out = BytesIO()
+    image.save(out, format=pil_format)
+    return out.getvalue()
+
+
+def downsample(mosaic):
+    """
+    Downsample an array of shape (2 * height, 2 * width, bands) to (height,
+    width, bands) by averaging each 2x2 block of pixels.
+    """
+
+    height = mosaic.shape[0] // 2
+    width = mosaic.shape[1] // 2
+    blocks = mosaic.reshape(height, 2, width, 2, -1).astype(np.uint16)
+    return ((blocks.sum(axis=(1, 3)) + 2) // 4).astype(np.uint8)
+
+
+def _is_uniform(array):
+    return bool((array == array[0, 0]).all())
+
+
+def _build_parent(args):
+    """
+    Build the tile data of a parent tile from the tile data of its children,
+    ordered top left, top right, bottom left, bottom right; missing children
+    are None and are transparent in the parent.
+
+    Returns
+    -------
+    (parent coordinates, tile data)
+    """
+
+    coords, children, decode, encode, image_format = args
+
+    # a parent of identical uniform children is the same as its children
+    if children[0] is not None and all(child == children[0] for child in children):
+        array = decode(children[0])
+        if _is_uniform(array):
+            return coords, children[0]
+
+    arrays = [None if child is None else decode(child) for child in children]
+    shape = next(array.shape for array in arrays if array is not None)
+    blank = np.zeros(shape, dtype=np.uint8)
+    arrays = [blank if array is None else array for array in arrays]
+
+    mosaic = np.concatenate(
+        [np.concatenate(arrays[:2], axis=1), np.concatenate(arrays[2:], axis=1)],
+        axis=0,
+    )
+    parent = downsample(mosaic)
+
+    if _is_uniform(parent):
+        # encode each uniform tile once, so that identical tiles have identical
+        # data and are stored once
+        key = (parent[0, 0].tobytes(), parent.shape, image_format, encode)
+        if key not in _uniform_tiles:
+            if len(_uniform_tiles) >= MAX_UNIFORM_TILES:
+                _uniform_tiles.clear()
+            _uniform_tiles[key] = encode(parent, image_format)
+        return coords, _uniform_tiles[key]
+
+    return coords, encode(parent, image_format)
+
+
+def _iter_parents(mbtiles, z, batch_size):
+    """
+    Iterate over (parent coordinates, children) of tiles at zoom level z.
+    Children of up to batch_size parents are read using a single range query.
+
+    Parents are found from the rows stored in the file, so mbtiles must use
+    the scheme the file stores.
+    """
+
+    cursor = mbtiles._db.cursor()
+    try:
+        columns = [
+            row[0]
+            for row in cursor.execute(
+                "SELECT DISTINCT tile_column / 2 FROM {0} WHERE zoom_level=? "
+                "ORDER BY 1".format(mbtiles._coords_table),
+                (z,),
+            ).fetchall()
+        ]
+
+        for px in columns:
+            rows = [
+                row[0]
+                for row in cursor.execute(
+                    "SELECT DISTINCT tile_row / 2 FROM {0} WHERE zoom_level=? "
+                    "AND tile_column BETWEEN ? AND ? ORDER BY 1".format(
+                        mbtiles._coords_table
+                    ),
+                    (z, 2 * px, 2 * px + 1),
+                ).fetchall()
+            ]
+
+            for i in range(0, len(rows), batch_size):
+                parent_rows = rows[i : i + batch_size]
+                tiles = {
+                    (tile.x, tile.y): tile.data
+                    for tile in mbtiles.read_tiles_in_bbox(
+                        z,
+                        2 * px,
+                        2 * px + 1,
+                        2 * parent_rows[0],
+                        2 * parent_rows[-1] + 1,
+                    )
+                }
+
+                for py in parent_rows:
+                    # TMS rows increase northward, so the top children are in
+                    # the higher row; XYZ rows increase southward
+                    x0, x1, y0, y1 = 2 * px, 2 * px + 1, 2 * py + 1, 2 * py
+                    if mbtiles.scheme == "xyz":
+                        y0, y1 = y1, y0
+                    children = [
+                        tiles.get((x0, y0)),
+                        tiles.get((x1, y0)),
+                        tiles.get((x0, y1)),
+                        tiles.get((x1, y1)),
+                    ]
+                    yield (z - 1, px, py), children
+
+    finally:
+        cursor.close()
+
+
+def build_overviews(
+    filename,
+    min_zoom=0,
+    max_zoom=None,
+    batch_size=256,
+    workers=None,
+    processes=True,
+    decode=decode_image,
+    encode=encode_image,
+):
+    """
+    Build the tiles of each zoom level from max_zoom - 1 down to min_zoom from
+    the tiles in the zoom level above, in place.
+
+    Each parent tile is built by combining its 2x2 child tiles and averaging
+    each 2x2 block of pixels.  Missing children are transparent.  Existing
+    tiles in the zoom levels that are built are replaced.
+
+    Parameters
+    ----------
+    filename: string
+        name of mbtiles file
+    min_zoom: int, optional (default: 0)
+        lowest zoom level to build
+    max_zoom: int, optional (default: None)
+        zoom level from which to start; defaults to the highest zoom level in
+        the tileset
+    batch_size: int, optional (default: 256)
+        number of parent tiles built at a time and written in each
+        transaction
+    workers: int, optional (default: None)
+        number of workers; defaults to the number of CPUs
+    processes: bool, optional (default: True)
+        if True, use a pool of processes instead of threads
+    decode: function, optional (default: decode_image)
+        function that takes tile data and returns an array of shape (height,
+        width, bands).  Must be defined at module level if processes is True.
+    encode: function, optional (default: encode_image)
+        function that takes an array of shape (height, width, bands) and the
+        format of the tileset and returns tile data.  Must be defined at
+        module level if processes is True.
+
+    Returns
+    -------
+    int: number of tiles written
+    """
+
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers) if processes else ThreadPool(workers)
+
+    count = 0
+    try:
+        with MBtiles(filename) as src:
+            scheme = src._stored_scheme
+
+        # tiles are read and written without converting rows
+        with MBtiles(filename, "r+", scheme=scheme) as mbtiles:
+            image_format = mbtiles.meta.get("format", "png")
+            if max_zoom is None:
+                max_zoom = mbtiles.zoom_range()[1]
+
+            for z in range(max_zoom, min_zoom, -1):
+                parents = _iter_parents(mbtiles, z, batch_size)
+                while True:
+                    batch = [
+                        (coords, children, decode, encode, image_format)
+                        for coords, children in islice(parents, batch_size)
+                    ]
+                    if not batch:
+                        break
+
+                    tiles = pool.map(_build_parent, batch)
+                    mbtiles.write_tiles(
+                        Tile(*coords, data=data) for coords, data in tiles
+                    )
+                    count += len(tiles)
+
+            if "minzoom" in mbtiles.meta:
+                mbtiles.meta["minzoom"] = str(min_zoom)
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return count
@@ -0,0 +1,411 @@
+"""Serve the tiles of an mbtiles file over HTTP.
+
+    python -m pymbtiles.serve my.mbtiles --port 8000
+
+Tiles are served at /{z}/{x}/{y} (optionally followed by the extension of the
+tile format), in the XYZ tile scheme by default, and TileJSON at
+/tilejson.json.  The tile_id of each tile is used as its ETag, so clients can
+revalidate cached tiles without the tile data being read or sent again.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+
+from pymbtiles import IS_PY2, SCHEMES, _validate_scheme
+from pymbtiles.compression import detect_codec
+from pymbtiles.pool import MBtilesPool
+
+if IS_PY2:  # pragma: no cover
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+logger = logging.getLogger("pymbtiles")
+
+# Content types of tiles, by the format in metadata
+CONTENT_TYPES = {
+    "pbf": "application/x-protobuf",
+    "mvt": "application/x-protobuf",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "json": "application/json",
+}
+
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)(?:\.\w+)?$")
+
+# Tiles requested at higher zoom levels are not found, without computing the
+# range of tile columns and rows
+MAX_ZOOM = 30
+TILEJSON_PATHS = ("/", "/tilejson.json")
+
+# Number of bytes at the start of tile data used to detect their compression
+SIGNATURE_LENGTH = 4
+
+# Added to the tile_id in the ETag of compressed tile data that are served
+# decompressed
+IDENTITY_SUFFIX = "-identity"
+
+
+def _parse_numbers(value, count, convert=float):
+    try:
+        numbers = [convert(v) for v in value.split(",")]
+    except (AttributeError, ValueError):
+        return None
+
+    return numbers if len(numbers) == count else None
+
+
+def _accepted_encodings(header):
+    """Return the set of content codings in an Accept-Encoding header."""
+
+    encodings = set()
+    for value in (header or "").split(","):
+        parts = [part.strip() for part in value.split(";")]
+        if not parts[0] or "q=0" in parts[1:] or "q=0.0" in parts[1:]:
+            continue
+        encodings.add(parts[0].lower())
+    return encodings
+
+
+def _representation(tile_id, data, accepted):
+    """
+    Return the ETag of the representation of tile data served to a client that
+    accepts encodings, its Content-Encoding (None if tile data are not served
+    compressed), and the codec used to decompress tile data for it (None if
+    tile data are served as stored).  Only the signature at the start of data
+    is used.
+    """
+
+    codec = detect_codec(data)
+    if codec is None:
+        return '"{0}"'.format(tile_id), None, None
+
+    # each representation has its own ETag
+    if codec.name in accepted:
+        return '"{0}"'.format(tile_id), codec.name, None
+
+    return '"{0}{1}"'.format(tile_id, IDENTITY_SUFFIX), None, codec
+
+
+def _etag_matches(header, etag):
+    """
+    Return True if an If-None-Match header matches etag, using weak
+    comparison.
+    """
+
+    if header is None:
+        return False
+
+    for value in header.split(","):
+        value = value.strip().replace("W/", "", 1)
+        if value == "*" or value == etag:
+            return True
+    return False
+
+
+class TileServer(ThreadingMixIn, HTTPServer):
+    """
+    Multi-threaded HTTP server of the tiles and TileJSON of an mbtiles file.
+
+    Each request thread reads tiles using a connection checked out from an
+    MBtilesPool.  Tile data are served as stored: tile data compressed with
+    gzip or zstd are served with the corresponding Content-Encoding to clients
+    that accept it, and decompressed for clients that do not.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        filename,
+        host="127.0.0.1",
+        port=8000,
+        pool_size=8,
+        scheme="xyz",
+        max_age=None,
+        immutable=False,
+        cache=None,
+        base_url=None,
+    ):
+        """
+        Creates a server; call serve_forever to start serving tiles, and
+        server_close to stop.
+
+        Parameters
+        ----------
+        filename: string
+            name of mbtiles file
+        host: string, optional (default: '127.0.0.1')
+            host name or address to listen on
+        port: int, optional (default: 8000)
+            port to listen on; if 0, any available port is used (see
+            server_address)
+        pool_size: int, optional (default: 8)
+            maximum number of open connections to the mbtiles file
+        scheme: string, one of ('xyz', 'tms') (default: 'xyz')
+            tile scheme of requested tile rows
+        max_age: int, optional (default: None)
+            if present, the number of seconds clients may cache tiles, sent in
+            a Cache-Control header
+        immutable: bool, optional (default: False)
+            if True, the file is opened as immutable; see MBtiles
+        cache: TileCache, optional (default: None)
+            if present, tiles read are cached in this cache
+        base_url: string, optional (default: None)
+            URL of this server used for tile URLs in TileJSON.  If None, the
+            Host header of the request is used.
+        """
+
+        _validate_scheme(scheme)
+
+        # tile rows are converted to the requested scheme when they are read
+        self.pool = MBtilesPool(
+            filename, size=pool_size, immutable=immutable, cache=cache, scheme=scheme
+        )
+        self.scheme = scheme
+        self.max_age = max_age
+        self.base_url = base_url
+        self.meta = self.pool.meta
+        with self.pool.connection() as src:
+            self.zoom_range = src.zoom_range()
+
+        self.format = self.meta.get("format", "png")
+        self.content_type = CONTENT_TYPES.get(
+            self.format, "application/octet-stream"
+        )
+
+        try:
+            HTTPServer.__init__(self, (host, port), TileRequestHandler)
+        except Exception:
+            self.pool.close()
+            raise
+
+    def tilejson(self, base_url):
+        """
+        Return the TileJSON of the tileset.
+
+        Parameters
+        ----------
+        base_url: string
+            URL of this server, without a trailing slash
+
+        Returns
+        -------
+        dict
+        """
+
+        meta = self.meta
+        tilejson = {
+            "tilejson": "3.0.0",
+            "scheme": self.scheme,
+            "tiles": ["{0}/{{z}}/{{x}}/{{y}}.{1}".format(base_url, self.format)],
+        }
+
+        for key in ("name", "description", "version", "attribution"):
+            if key in meta:
+                tilejson[key] = meta[key]
+
+        if self.zoom_range is not None:
+            tilejson["minzoom"], tilejson["maxzoom"] = self.zoom_range
+        for key in ("minzoom", "maxzoom"):
+            if key in meta:
+                tilejson[key] = int(meta[key])
+
+        bounds = _parse_numbers(meta.get("bounds"), 4)
+        if bounds is not None:
+            tilejson["bounds"] = bounds
+
+        center = _parse_numbers(meta.get("center"), 3)
+        if center is not None:
+            center[2] = int(center[2])
+            tilejson["center"] = center
+
+        # vector tilesets store their layers in the json metadata
+        if "json" in meta:
+            try:
+                tilejson.update(json.loads(meta["json"]))
+            except ValueError:
+                logger.warning("Invalid json metadata in %s", self.pool.filename)
+
+        return tilejson
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.pool.close()
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """Handles requests for tiles and TileJSON of a TileServer."""
+
+    # keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    # headers and body are written separately; without this, small responses
+    # on kept open connections wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body=b"", headers=None, send_body=True):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # the Content-Length of a 304 would be that of the representation
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def _handle(self, send_body):
+        path = self.path.split("?", 1)[0]
+
+        if path in TILEJSON_PATHS:
+            base_url = self.server.base_url or "http://{0}".format(
+                self.headers.get("Host", "{0}:{1}".format(*self.server.server_address))
+            )
+            body = json.dumps(self.server.tilejson(base_url.rstrip("/")))
+            self._send(
+                200,
+                body.encode("utf-8"),
+                {"Content-Type": "application/json"},
+                send_body,
+            )
+            return
+
+        match = TILE_PATH.match(path)
+        if match is None:
+            self._send(404, send_body=send_body)
+            return
+
+        z, x, y = [int(value) for value in match.groups()]
+        if z > MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+            self._send(404, send_body=send_body)
+            return
+
+        self._send_tile(z, x, y, send_body)
+
+    def _send_tile(self, z, x, y, send_body):
+        server = self.server
+        accepted = _accepted_encodings(self.headers.get("Accept-Encoding"))
+        if_none_match = self.headers.get("If-None-Match")
+
+        headers = {"Content-Type": server.content_type, "Vary": "Accept-Encoding"}
+        if server.max_age is not None:
+            headers["Cache-Control"] = "public, max-age={0}".format(server.max_age)
+
+        if if_none_match is not None:
+            # the ETag only depends on the tile_id and the signature of the
+            # tile data, so tile data are only read if it does not match
+            tile_id, head = server.pool.read_tile_id_and_head(
+                z, x, y, SIGNATURE_LENGTH
+            )
+            if head is None:
+                self._send(404, send_body=send_body)
+                return
+
+            if tile_id is not None:
+                etag, _, _ = _representation(tile_id, head, accepted)
+                if _etag_matches(if_none_match, etag):
+                    headers["ETag"] = etag
+                    self._send(304, headers=headers, send_body=False)
+                    return
+
+        # tile data are identified by tile_id; both are read from the same
+        # version of the file
+        tile_id, data = server.pool.read_tile_and_id(z, x, y)
+        if data is None:
+            self._send(404, send_body=send_body)
+            return
+
+        if tile_id is None:
+            # tile data of a tiles table, or found in the cache
+            tile_id = hashlib.sha1(data).hexdigest()
+
+        etag, encoding, codec = _representation(tile_id, data, accepted)
+        headers["ETag"] = etag
+        if _etag_matches(if_none_match, etag):
+            self._send(304, headers=headers, send_body=False)
+            return
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        elif codec is not None:
+            data = codec.decompress(data)
+
+        self._send(200, data, headers, send_body)
+
+
+def serve(filename, host="127.0.0.1", port=8000, **kwargs):
+    """
+    Serve the tiles of an mbtiles file until interrupted.
+
+    Parameters
+    ----------
+    filename: string
+        name of mbtiles file
+    host: string, optional (default: '127.0.0.1')
+        host name or address to listen on
+    port: int, optional (default: 8000)
+        port to listen on
+    **kwargs:
+        other options of TileServer
+    """
+
+    server = TileServer(filename, host=host, port=port, **kwargs)
+    logger.info("Serving %s at http://%s:%s", filename, *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the tiles of an mbtiles file")
+    parser.add_argument("filename")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--scheme", choices=SCHEMES, default="xyz")
+    parser.add_argument(
+        "--max-age", type=int, default=None, help="seconds clients may cache tiles"
+    )
+    parser.add_argument(
+        "--immutable",
+        action="store_true",
+        help="open the file as immutable; only if it does not change while served",
+    )
+    parser.add_argument("--base-url", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(
+        args.filename,
+        host=args.host,
+        port=args.port,
+        pool_size=args.pool_size,
+        scheme=args.scheme,
+        max_age=args.max_age,
+        immutable=args.immutable,
+        base_url=args.base_url,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,544 @@
+"""A tileset stored in many mbtiles files (shards) in a directory.
+
+Tiles are partitioned between shards by zoom level, or by the quadkey of
+their ancestor at a given zoom level, so that each shard stays small enough to
+copy and back up, and tiles can be written to many shards in parallel.  A
+manifest in the directory lists the shards and stores the metadata of the
+tileset.
+"""
+
+import json
+import os
+from collections import defaultdict
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+from pymbtiles import MBtiles, Tile, TileCoordinate, _tileset_meta, flip_y
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+PARTITIONS = ("zoom", "quadkey")
+
+# Shard of tiles below the quadkey zoom level, when partitioned by quadkey
+BASE_SHARD = "base"
+
+
+def quadkey(z, x, y):
+    """
+    Return the quadkey of a tile.
+
+    Parameters
+    ----------
+    z: int
+        zoom level
+    x: int
+        tile column
+    y: int
+        tile row, in the TMS scheme used by mbtiles
+
+    Returns
+    -------
+    string of z digits
+    """
+
+    y = (1 << z) - 1 - y
+    digits = []
+    for i in range(z, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+class ShardedMBtiles(object):
+    """
+    Interface for reading and writing a tileset stored in many mbtiles files,
+    with the same methods as MBtiles for reading and writing tiles.
+
+    meta attribute maps to the metadata in the manifest.
+    """
+
+    class Metadata(dict):
+        def __init__(self, tileset, *args, **kwargs):
+            dict.__init__(self, *args, **kwargs)
+            self._tileset = tileset
+
+        def __setitem__(self, k, v):
+            dict.__setitem__(self, k, v)
+            self._tileset._write_manifest()
+
+        def __delitem__(self, k):
+            dict.__delitem__(self, k)
+            self._tileset._write_manifest()
+
+        def update(self, *args, **kwargs):
+            dict.update(self, *args, **kwargs)
+            self._tileset._write_manifest()
+
+    def __init__(
+        self,
+        path,
+        mode="r",
+        partition="zoom",
+        quadkey_zoom=4,
+        workers=None,
+        batch_size=10000,
+        **kwargs
+    ):
+        """
+        Creates an open sharded tileset.  Must be closed after all data are
+        added.
+
+        Parameters
+        ----------
+        path: string
+            name of directory containing the manifest and shards
+        mode: string, one of ('r', 'w', 'r+')
+            if 'w', the manifest and shards of an existing tileset in path
+            will be deleted first
+        partition: string, one of PARTITIONS (default: 'zoom')
+            if 'zoom', each zoom level is stored in its own shard.  If
+            'quadkey', tiles at or above quadkey_zoom are stored in the shard
+            of their ancestor at quadkey_zoom, and tiles below quadkey_zoom in
+            a single base shard.  Only used for mode 'w'; otherwise read from
+            the manifest.
+        quadkey_zoom: int, optional (default: 4)
+            zoom level of the quadkeys of shards when partitioned by quadkey;
+            results in up to 4 ** quadkey_zoom + 1 shards.  Only used for
+            mode 'w'.
+        workers: int, optional (default: None)
+            number of threads used to write to shards in parallel; defaults to
+            the number of CPUs
+        batch_size: int, optional (default: 10000)
+            number of tiles grouped by shard and written at a time by
+            write_tiles
+        **kwargs:
+            other options used to open each shard; see MBtiles
+        """
+
+        self.mode = mode
+        if mode not in ("r", "w", "r+"):
+            raise ValueError("Mode must be r, w, or r+")
+
+        self.path = path
+        self._manifest_filename = os.path.join(path, MANIFEST_FILENAME)
+        self._workers = workers
+        self._batch_size = batch_size
+        self._kwargs = kwargs
+        self._kwargs["check_same_thread"] = False
+
+        if mode == "w":
+            if partition not in PARTITIONS:
+                raise ValueError(
+                    "partition must be one of: {0}".format(", ".join(PARTITIONS))
+                )
+            if partition == "quadkey" and quadkey_zoom < 1:
+                raise ValueError("quadkey_zoom must be at least 1")
+
+            if os.path.exists(self._manifest_filename):
+                for filename in self._read_manifest()["shards"].values():
+                    shard_filename = os.path.join(path, filename)
+                    if os.path.exists(shard_filename):
+                        os.remove(shard_filename)
+
+            elif not os.path.exists(path):
+                os.makedirs(path)
+
+            self.partition = partition
+            self.quadkey_zoom = quadkey_zoom if partition == "quadkey" else None
+            self._shard_filenames = {}
+            self._meta = self.Metadata(self)
+            self._write_manifest()
+
+        else:
+            if not os.path.exists(self._manifest_filename):
+                raise IOError(
+                    "sharded tileset not found: {0}".format(self._manifest_filename)
+                )
+
+            manifest = self._read_manifest()
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(
+                    "Unsupported manifest version: {0}".format(manifest.get("version"))
+                )
+
+            self.partition = manifest["partition"]
+            self.quadkey_zoom = manifest["quadkey_zoom"]
+            self._shard_filenames = manifest["shards"]
+            self._meta = self.Metadata(self, manifest["metadata"])
+
+        # shards are opened on first use
+        self._shards = {}
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read_manifest(self):
+        with open(self._manifest_filename) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        """Write the manifest via a temporary file, so that an interrupted
+        write never leaves a partial manifest.
+        """
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "partition": self.partition,
+            "quadkey_zoom": self.quadkey_zoom,
+            "shards": self._shard_filenames,
+            "metadata": self._meta,
+        }
+
+        tmp_filename = self._manifest_filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.rename(tmp_filename, self._manifest_filename)
+
+    @property
+    def meta(self):
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = self.Metadata(self, value)
+        self._write_manifest()
+
+    @property
+    def shards(self):
+        """Sorted list of the keys of all shards in the tileset."""
+
+        return sorted(self._shard_filenames)
+
+    def shard_key(self, z, x, y):
+        """
+        Return the key of the shard that stores a tile.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        x: int
+            tile column
+        y: int
+            tile row, in the scheme the tileset was opened with
+
+        Returns
+        -------
+        string
+        """
+
+        if self.partition == "zoom":
+            return "z{0}".format(z)
+
+        if z < self.quadkey_zoom:
+            return BASE_SHARD
+
+        if self._kwargs.get("scheme", "tms") == "xyz":
+            y = flip_y(z, y)
+
+        shift = z - self.quadkey_zoom
+        return "q" + quadkey(self.quadkey_zoom, x >> shift, y >> shift)
+
+    def _shard(self, key, create=False):
+        """
+        Return the open MBtiles of shard key, opening it if needed.  Returns
+        None if the shard does not exist and create is False.
+        """
+
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+
+        if key in self._shard_filenames:
+            mode = "r" if self.mode == "r" else "r+"
+
+        elif create:
+            self._shard_filenames[key] = "{0}.mbtiles".format(key)
+            self._write_manifest()
+            mode = "w"
+
+        else:
+            return None
+
+        shard = MBtiles(
+            os.path.join(self.path, self._shard_filenames[key]), mode, **self._kwargs
+        )
+        self._shards[key] = shard
+        return shard
+
+    def _check_writable(self):
+        if self.mode == "r":
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+    def _iter_shards(self):
+        for key in self.shards:
+            yield self._shard(key)
+
+    def has_tile(self, z, x, y):
+        shard = self._shard(self.shard_key(z, x, y))
+        return shard is not None and shard.has_tile(z, x, y)
+
+    def list_tiles(self):
+        """Read a list of TileCoordinate (z, x, y) tuples from all shards.
+
+        Returns
+        -------
+        list of TileCoordinate objects
+        """
+
+        return [tile for shard in self._iter_shards() for tile in shard.list_tiles()]
+
+    def iter_tiles(self, batch_size=1000, data=False):
+        """
+        Iterate over all tiles in the tileset, one shard at a time.
+
+        Parameters
+        ----------
+        batch_size: int, optional (default: 1000)
+            number of tiles read from a shard at a time
+        data: bool, optional (default: False)
+            if True, yield Tile objects with tile data instead of
+            TileCoordinate objects
+
+        Returns
+        -------
+        generator of TileCoordinate or Tile objects, in (z, x, y) order within
+        each shard; shards are in order of their keys.
+        """
+
+        for shard in self._iter_shards():
+            for tile in shard.iter_tiles(batch_size, data=data):
+                yield tile
+
+    def zoom_range(self):
+        """
+        Get the minimum and maximum zoom levels of all shards.
+
+        Returns
+        -------
+        tuple of (min_zoom, max_zoom), or None if there are no tiles
+        """
+
+        # shards may be empty, e.g., if a write to a new shard failed
+        ranges = [shard.zoom_range() for shard in self._iter_shards()]
+        ranges = [r for r in ranges if r[0] is not None]
+        if not ranges:
+            return None
+
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+
+    def read_tile(self, z, x, y):
+        """
+        Get a tile for z, x, y values from its shard.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        x: int
+            tile column
+        y: int
+            tile row
+
+        Returns
+        -------
+        tile data in bytes.  None if no tile exists.
+        """
+
+        shard = self._shard(self.shard_key(z, x, y))
+        if shard is None:
+            return None
+
+        return shard.read_tile(z, x, y)
+
+    def read_tiles(self, coords):
+        """
+        Get tiles for many (z, x, y) values at once, using one read_tiles call
+        per shard.
+
+        Parameters
+        ----------
+        coords: iterable of TileCoordinate(z, x, y) tuples
+
+        Returns
+        -------
+        list of Tile objects, in the same order as coords.  data is None
+        for tiles that do not exist in the tileset.
+        """
+
+        coords = [TileCoordinate(*c) for c in coords]
+
+        by_shard = defaultdict(list)
+        for c in coords:
+            by_shard[self.shard_key(*c)].append(c)
+
+        found = {}
+        for key, shard_coords in by_shard.items():
+            shard = self._shard(key)
+            if shard is not None:
+                for tile in shard.read_tiles(shard_coords):
+                    found[tile[:3]] = tile.data
+
+        return [Tile(*c, data=found.get(c)) for c in coords]
+
+    def write_tile(self, z, x, y, data):
+        """
+        Add a tile to its shard.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        x: int
+            tile column
+        y: int
+            tile row
+        data: bytes
+            tile data bytes
+        """
+
+        self._check_writable()
+        self._shard(self.shard_key(z, x, y), create=True).write_tile(z, x, y, data)
+
+    def write_tiles(self, tiles):
+        """
+        Add several tiles to their shards.
+
+        Tiles are grouped by shard batch_size tiles at a time, and each group
+        is written to its shard in a single transaction, in parallel with the
+        groups of other shards.
+
+        Parameters
+        ----------
+        tiles: iterable of Tile(z, x, y, data) tuples
+        """
+
+        self._check_writable()
+        if self._pool is None:
+            self._pool = ThreadPool(self._workers)
+
+        tiles = iter(tiles)
+        while True:
+            by_shard = defaultdict(list)
+            for tile in islice(tiles, self._batch_size):
+                by_shard[self.shard_key(*tile[:3])].append(tile)
+
+            if not by_shard:
+                break
+
+            # shards are created in this thread, so that the manifest is only
+            # written by one thread
+            groups = [
+                (self._shard(key, create=True), group)
+                for key, group in by_shard.items()
+            ]
+            self._pool.map(_write_group, groups)
+
+    @property
+    def write_stats(self):
+        """
+        Statistics of tiles written to all shards since the tileset was
+        opened; see MBtiles.write_stats.
+        """
+
+        tiles = sum(shard._tiles_written for shard in self._shards.values())
+        images = sum(shard._images_written for shard in self._shards.values())
+        return {
+            "tiles": tiles,
+            "images": images,
+            "duplicates": tiles - images,
+            "dedup_ratio": (tiles - images) / float(tiles) if tiles else 0.0,
+        }
+
+    def close(self):
+        """
+        Close all open shards.
+        """
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+
+def _write_group(args):
+    shard, tiles = args
+    shard.write_tiles(tiles)
+
+
+def reshard(
+    filename,
+    path,
+    partition="zoom",
+    quadkey_zoom=4,
+    batch_size=10000,
+    workers=None,
+    **kwargs
+):
+    """
+    Copy the tiles and metadata of a tileset to a new sharded tileset.
+
+    Parameters
+    ----------
+    filename: str
+        name of mbtiles file, or directory of a sharded tileset
+    path: str
+        name of directory of output sharded tileset.  An existing sharded
+        tileset in path is deleted first.
+    partition: str, one of PARTITIONS (default: 'zoom')
+        how tiles are partitioned between shards; see ShardedMBtiles
+    quadkey_zoom: int, optional (default: 4)
+        zoom level of the quadkeys of shards when partitioned by quadkey
+    batch_size: int, optional (default: 10000)
+        number of tiles read and written at a time
+    workers: int, optional (default: None)
+        number of threads used to write to shards in parallel; defaults to
+        the number of CPUs
+    **kwargs:
+        other options used to open each output shard; see MBtiles
+
+    Returns
+    -------
+    int: number of tiles copied
+    """
+
+    if os.path.isdir(filename):
+        src = ShardedMBtiles(filename)
+    else:
+        src = MBtiles(filename)
+
+    count = 0
+    try:
+        with ShardedMBtiles(
+            path,
+            "w",
+            partition=partition,
+            quadkey_zoom=quadkey_zoom,
+            workers=workers,
+            batch_size=batch_size,
+            **kwargs
+        ) as out:
+            out.meta = _tileset_meta(src.meta)
+
+            tiles = src.iter_tiles(batch_size, data=True)
+            while True:
+                batch = list(islice(tiles, batch_size))
+                if not batch:
+                    break
+
+                out.write_tiles(batch)
+                count += len(batch)
+
+    finally:
+        src.close()
+
+    return count
@@ -0,0 +1,307 @@
+import time
+from contextlib import contextmanager
+
+
+class Transaction(object):
+    """
+    Session that writes tiles to an MBtiles file using few transactions,
+    however the tiles are added.
+
+    While the session is open, write_tile and write_tiles of the MBtiles file
+    (and a ParallelWriter of the file) write within the current transaction
+    instead of committing their own.  The transaction is committed and a new
+    one started each time batch_size tiles or max_bytes of tile data have been
+    written since the last commit, and when the session is closed.
+
+    If an exception is raised within the session, the current transaction is
+    rolled back; tiles committed earlier are kept.  Each call that writes tiles
+    is atomic: if it fails, none of its tiles are kept.  Use savepoint to roll
+    back only part of the current transaction.  Rolling back requires a
+    rollback journal, which profile 'bulk_load' does not use; without one,
+    calls that fail may leave some of their tiles.  Use MBtiles.transaction
+    to create.
+    """
+
+    def __init__(self, mbtiles, batch_size=10000, max_bytes=64 * 1024 * 1024):
+        if mbtiles.mode == "r":
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self._mbtiles = mbtiles
+        self._cursor = mbtiles._cursor
+        self._batch_size = batch_size
+        self._max_bytes = max_bytes
+        self._savepoints = []
+        self._open = False
+        self._start = None
+        self._rollback_journal = mbtiles._pragma_value("journal_mode") != "off"
+
+        # write_stats of mbtiles at the last commit, restored on rollback
+        self._committed_stats = None
+        # True if metadata were written since the last commit
+        self._meta_written = False
+        # (z, x, y) of tiles written since the last commit, removed from the
+        # cache of mbtiles on rollback
+        self._written_keys = set()
+
+        self._pending_tiles = 0
+        self._pending_bytes = 0
+
+        self.tiles_written = 0
+        self.commits = 0
+
+    def __enter__(self):
+        if self._mbtiles._transaction is not None:
+            raise ValueError("a transaction is already open")
+
+        self._cursor.execute("BEGIN")
+        self._mbtiles._transaction = self
+        self._open = True
+        self._committed_stats = self._write_stats()
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.rollback()
+
+    @property
+    def rate(self):
+        """Average number of tiles written per second since the session was
+        opened."""
+
+        elapsed = time.time() - self._start if self._start else 0
+        return self.tiles_written / elapsed if elapsed else 0.0
+
+    @property
+    def pending(self):
+        """Number of tiles written that have not been committed."""
+
+        return self._pending_tiles
+
+    def write_tile(self, z, x, y, data):
+        """
+        Write a tile within the current transaction.  See MBtiles.write_tile.
+        """
+
+        self._mbtiles.write_tile(z, x, y, data)
+
+    def write_tiles(self, tiles):
+        """
+        Write several tiles within the current transaction.  See
+        MBtiles.write_tiles.
+        """
+
+        self._mbtiles.write_tiles(tiles)
+
+    def _write_stats(self):
+        return self._mbtiles._tiles_written, self._mbtiles._images_written
+
+    def _write_rows(self, rows):
+        """Insert (z, x, y, tile_id, data) rows within the current transaction,
+        and commit if a threshold is reached."""
+
+        count = [0, 0]
+
+        def counted(rows):
+            for row in rows:
+                count[0] += 1
+                count[1] += len(row[4])
+                yield row
+
+        self._insert(self._mbtiles._insert_rows, counted(rows))
+        self._wrote(*count)
+
+    def _insert(self, insert, *args):
+        """Call insert(*args) within a savepoint if possible, so that tiles of
+        a call that fails are not kept."""
+
+        if not self._open:
+            raise ValueError("transaction is closed")
+
+        if not self._rollback_journal:
+            insert(*args)
+            return
+
+        with self.savepoint():
+            insert(*args)
+
+    def _write_meta(self, meta):
+        """Write metadata changes within the current transaction; they are
+        committed with the tiles, or discarded on rollback."""
+
+        self._insert(meta._write)
+        meta._mark_clean()
+        self._meta_written = True
+
+    def _wrote(self, tiles, size):
+        """Count tiles of size bytes inserted within the current transaction,
+        and commit if a threshold is reached."""
+
+        self.tiles_written += tiles
+        self._pending_tiles += tiles
+        self._pending_bytes += size
+
+        # committing would release open savepoints
+        if not self._savepoints and (
+            self._pending_tiles >= self._batch_size
+            or self._pending_bytes >= self._max_bytes
+        ):
+            self.commit()
+
+    def commit(self):
+        """
+        Commit the tiles written so far and start a new transaction.  Must not
+        be called within a savepoint.
+        """
+
+        self._commit()
+        self._cursor.execute("BEGIN")
+
+    def _commit(self):
+        if self._savepoints:
+            raise ValueError("cannot commit within a savepoint")
+
+        mbtiles = self._mbtiles
+        mbtiles._invalidate_stats()
+
+        # metadata changes are committed with the tiles
+        meta_dirty = mbtiles._meta is not None and mbtiles._meta.dirty
+        if meta_dirty:
+            mbtiles._meta._write()
+
+        self._cursor.execute("COMMIT")
+        if meta_dirty:
+            mbtiles._meta._mark_clean()
+
+        self.commits += 1
+        self._meta_written = False
+        self._written_keys = set()
+        self._pending_tiles = 0
+        self._pending_bytes = 0
+        self._committed_stats = self._write_stats()
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Open a savepoint within the current transaction.  Use as a context
+        manager; if an exception is raised within it, tiles written since the
+        savepoint are rolled back and the exception is raised:
+
+            with mbtiles.transaction() as tx:
+                tx.write_tiles(tiles)
+                try:
+                    with tx.savepoint():
+                        tx.write_tiles(other_tiles)
+                except ValueError:
+                    # tiles is still written, other_tiles is not
+                    pass
+
+        The transaction is not committed while a savepoint is open.
+        """
+
+        if not self._open:
+            raise ValueError("transaction is closed")
+
+        mbtiles = self._mbtiles
+        if not self._rollback_journal:
+            raise ValueError(
+                "savepoints require a rollback journal; use a profile other than "
+                "{0}".format(mbtiles.profile)
+            )
+
+        name = "pymbtiles_{0}".format(len(self._savepoints))
+        state = (
+            self.tiles_written,
+            self._pending_tiles,
+            self._pending_bytes,
+            mbtiles._tiles_written,
+            mbtiles._images_written,
+        )
+
+        self._cursor.execute("SAVEPOINT {0}".format(name))
+        self._savepoints.append(name)
+        try:
+            yield self
+
+        except BaseException:
+            self._cursor.execute("ROLLBACK TO {0}".format(name))
+            self._cursor.execute("RELEASE {0}".format(name))
+            self._savepoints.pop()
+
+            (
+                self.tiles_written,
+                self._pending_tiles,
+                self._pending_bytes,
+                mbtiles._tiles_written,
+                mbtiles._images_written,
+            ) = state
+            # images inserted since the savepoint are no longer present
+            mbtiles._known_tile_ids.clear()
+            self._uncache_written()
+            raise
+
+        self._cursor.execute("RELEASE {0}".format(name))
+        self._savepoints.pop()
+
+    def rollback(self):
+        """
+        Roll back the tiles written since the last commit and close the
+        session.
+        """
+
+        if not self._open:
+            return
+
+        self._close()
+        self._cursor.execute("ROLLBACK")
+        self.tiles_written -= self._pending_tiles
+        self._pending_tiles = 0
+        self._pending_bytes = 0
+        (
+            self._mbtiles._tiles_written,
+            self._mbtiles._images_written,
+        ) = self._committed_stats
+
+        # images inserted in this transaction are no longer present
+        self._mbtiles._known_tile_ids.clear()
+        self._uncache_written()
+        self._written_keys = set()
+
+        if self._meta_written:
+            self._meta_written = False
+            self._mbtiles._meta = None  # reload on next use
+
+    def _uncache_written(self):
+        """Remove tiles written since the last commit from the cache, which
+        may hold data that were rolled back."""
+
+        cache = self._mbtiles.cache
+        if cache is not None:
+            for key in self._written_keys:
+                cache.invalidate(key)
+
+    def close(self):
+        """
+        Commit the tiles written since the last commit and close the session.
+        """
+
+        if not self._open:
+            return
+
+        try:
+            self._commit()
+        except BaseException:
+            self.rollback()
+            raise
+
+        self._close()
+
+    def _close(self):
+        self._open = False
+        self._savepoints = []
+        self._mbtiles._transaction = None
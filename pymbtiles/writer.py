@@ -0,0 +1,157 @@
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from pymbtiles import Tile, _prepare_tiles
+
+
+class ParallelWriter(object):
+    """
+    Writes tiles to an MBtiles file, preparing them (compressing tile data if
+    the file uses compression, and hashing tile data) in a pool of workers.
+
+    Tiles are collected into batches that are prepared by the workers.
+    Prepared batches are written by the caller's thread, which owns the
+    single SQLite connection, in the order they were added.  At most
+    max_pending batches are queued or being prepared at a time; adding more
+    tiles blocks until the oldest batch is written.
+
+    If preparing a batch fails, the error is raised by the call that reaches
+    that batch in order (write_tile, write_tiles, flush, or close); all
+    earlier batches are written first.  Use MBtiles.parallel_writer to create.
+    """
+
+    def __init__(
+        self, mbtiles, workers=None, batch_size=1000, max_pending=None, processes=False
+    ):
+        if mbtiles.mode == "r":
+            raise ValueError("mbtiles must be opened in w or r+ mode")
+
+        workers = workers or multiprocessing.cpu_count()
+
+        self._mbtiles = mbtiles
+        self._batch_size = batch_size
+        self._max_pending = max_pending or 2 * workers
+        self._pool = multiprocessing.Pool(workers) if processes else ThreadPool(workers)
+        self._pending = deque()
+        self._batch = []
+        self._closed = False
+        self._start = time.time()
+
+        self.tiles_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    @property
+    def rate(self):
+        """Average number of tiles written per second."""
+
+        elapsed = time.time() - self._start
+        return self.tiles_written / elapsed if elapsed else 0.0
+
+    def write_tile(self, z, x, y, data):
+        """
+        Add a tile to be written.
+
+        Parameters
+        ----------
+        z: int
+            zoom level
+        x: int
+            tile column
+        y: int
+            tile row
+        data: bytes
+            tile data bytes
+        """
+
+        self._add(Tile(z, x, y, data))
+
+    def write_tiles(self, tiles):
+        """
+        Add several tiles to be written.
+
+        Parameters
+        ----------
+        tiles: iterable of Tile(z, x, y, data) tuples
+        """
+
+        for tile in tiles:
+            self._add(tile)
+
+    def flush(self):
+        """
+        Prepare and write all tiles added so far.
+        """
+
+        self._submit()
+        while self._pending:
+            self._write_next()
+
+    def close(self):
+        """
+        Write all remaining tiles and stop the workers.  The MBtiles file is
+        left open.
+        """
+
+        if self._closed:
+            return
+
+        try:
+            self.flush()
+        except Exception:
+            self.terminate()
+            raise
+
+        self._closed = True
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """
+        Stop the workers, discarding tiles that have not yet been written.
+        """
+
+        self._closed = True
+        self._batch = []
+        self._pending.clear()
+        self._pool.terminate()
+        self._pool.join()
+
+    def _add(self, tile):
+        if self._closed:
+            raise ValueError("writer is closed")
+
+        self._batch.append(tile)
+        if len(self._batch) >= self._batch_size:
+            self._submit()
+
+    def _submit(self):
+        if self._batch:
+            self._pending.append(
+                self._pool.apply_async(
+                    _prepare_tiles,
+                    (self._batch, self._mbtiles._hash_func, self._mbtiles._codec),
+                )
+            )
+            self._batch = []
+
+        # write batches that are already prepared, then apply backpressure
+        while self._pending and self._pending[0].ready():
+            self._write_next()
+
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        rows = self._pending.popleft().get()
+        self._mbtiles._write_rows(rows)
+        self.tiles_written += len(rows)
@@ -13,6 +13,11 @@ setup(
     long_description_content_type="text/markdown",
     long_description=open("README.md").read(),
     install_requires=[],
-    extras_require={"test": ["pytest", "pytest-cov"]},
+    extras_require={
+        "test": ["pytest", "pytest-cov"],
+        "zstd": ["zstandard"],
+        "brotli": ["brotli"],
+        "pyramid": ["numpy", "pillow"],
+    },
     include_package_data=True,
 )
@@ -1,5 +1,12 @@
+import sys
+
 import pytest
 
+# pymbtiles.aio uses async / await syntax, which requires Python 3.6+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append("test_aio.py")
+
 
 @pytest.fixture(scope='session')
 def blank_png_tile():
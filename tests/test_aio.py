@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.aio import AsyncMBtiles
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_async_read(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(3, x, y, b"%d-%d" % (x, y)) for x in range(8) for y in range(8)]
+
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test tiles"}
+        out.write_tiles(tiles)
+
+    async def read():
+        async with AsyncMBtiles(filename, workers=2) as src:
+            assert await src.read_meta() == {"name": "test tiles"}
+            assert await src.has_tile(3, 0, 0)
+            assert await src.read_tile(3, 1, 2) == b"1-2"
+            assert await src.read_tile(4, 0, 0) is None
+
+            results = await asyncio.gather(
+                *[src.read_tile(*tile[:3]) for tile in tiles]
+            )
+            assert results == [tile.data for tile in tiles]
+
+            assert await src.read_tiles([(3, 7, 7)]) == [Tile(3, 7, 7, b"7-7")]
+
+            listed = [tile async for tile in src.iter_tiles(batch_size=10, data=True)]
+            assert listed == tiles
+
+            with pytest.raises(ValueError):
+                await src.write_tile(0, 0, 0, blank_png_tile)
+
+    run(read())
+
+
+def test_async_write(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    async def write():
+        async with AsyncMBtiles(filename, mode="w") as out:
+            await out.write_meta({"name": "test tiles"})
+            await out.write_tile(0, 0, 0, blank_png_tile)
+            await out.write_tiles([Tile(1, 0, 0, b"123")])
+
+            # written tiles are available to readers
+            assert await out.read_tile(1, 0, 0) == b"123"
+
+    run(write())
+
+    with MBtiles(filename) as src:
+        assert src.meta == {"name": "test tiles"}
+        assert src.read_tile(0, 0, 0) == blank_png_tile
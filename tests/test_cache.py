@@ -0,0 +1,103 @@
+from pymbtiles import MBtiles, Tile
+from pymbtiles.cache import ENTRY_OVERHEAD, NOT_CACHED, TileCache
+from pymbtiles.pool import MBtilesPool
+
+
+def test_cache_lru():
+    cache = TileCache(max_bytes=3 * (ENTRY_OVERHEAD + 10), track_hot=True)
+
+    assert cache.get((0, 0, 0)) is NOT_CACHED
+
+    cache.put((0, 0, 0), b"0" * 10)
+    cache.put((1, 0, 0), b"1" * 10)
+    cache.put((1, 0, 1), None)
+    assert len(cache) == 3
+    assert cache.bytes == 3 * ENTRY_OVERHEAD + 20
+
+    # use (0, 0, 0) so that (1, 0, 0) is least recently used
+    assert cache.get((0, 0, 0)) == b"0" * 10
+    assert cache.get((1, 0, 1)) is None
+
+    cache.put((1, 1, 0), b"2" * 10)
+    assert (1, 0, 0) not in cache
+    assert (0, 0, 0) in cache
+    assert cache.evictions == 1
+
+    # entries larger than the cache are not cached
+    cache.put((2, 0, 0), b"3" * 1000)
+    assert (2, 0, 0) not in cache
+
+    cache.invalidate((0, 0, 0))
+    assert (0, 0, 0) not in cache
+    assert cache.bytes == 2 * ENTRY_OVERHEAD + 10
+
+    stats = cache.stats
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
+    assert cache.hot_tiles(1) == [((0, 0, 0), 2)]
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
+
+
+def test_cache_missing():
+    cache = TileCache(cache_missing=False)
+    cache.put((0, 0, 0), None)
+    assert (0, 0, 0) not in cache
+    assert cache.get((0, 0, 0)) is NOT_CACHED
+    assert cache.hot_tiles() == []
+
+
+def test_cache_hot_tiles_bounded():
+    cache = TileCache(track_hot=True, max_hot=2)
+    for _ in range(3):
+        cache.get((0, 0, 0))
+    cache.get((1, 0, 0))
+    cache.get((1, 0, 0))
+
+    for x in range(10):
+        cache.get((4, x, 0))
+        assert len(cache._requests) <= 4
+
+    assert cache.hot_tiles(2) == [((0, 0, 0), 3), ((1, 0, 0), 2)]
+
+
+def test_mbtiles_cache(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    cache = TileCache()
+
+    with MBtiles(filename, mode="w", cache=cache) as out:
+        out.write_tile(0, 0, 0, blank_png_tile)
+
+        assert out.read_tile(0, 0, 0) == blank_png_tile
+        assert out.read_tile(1, 0, 0) is None
+        assert cache.stats["misses"] == 2
+
+        assert out.read_tile(0, 0, 0) == blank_png_tile
+        assert out.read_tile(1, 0, 0) is None
+        assert cache.stats["hits"] == 2
+
+        # writing tiles removes them from the cache
+        out.write_tiles([Tile(1, 0, 0, b"123")])
+        out.write_tile(0, 0, 0, b"456")
+        assert (1, 0, 0) not in cache
+        assert out.read_tile(1, 0, 0) == b"123"
+        assert out.read_tile(0, 0, 0) == b"456"
+
+        assert out.read_tiles([(0, 0, 0), (1, 0, 0), (2, 0, 0)]) == [
+            Tile(0, 0, 0, b"456"),
+            Tile(1, 0, 0, b"123"),
+            Tile(2, 0, 0, None),
+        ]
+        assert (2, 0, 0) in cache
+        assert out.read_tiles([(2, 0, 0)]) == [Tile(2, 0, 0, None)]
+
+    cache = TileCache(track_hot=True)
+    with MBtilesPool(filename, size=2, cache=cache) as pool:
+        for _ in range(3):
+            assert pool.read_tile(0, 0, 0) == b"456"
+        assert cache.stats["hits"] == 2
+        assert cache.hot_tiles() == [((0, 0, 0), 3)]
@@ -0,0 +1,54 @@
+import pickle
+
+import pytest
+
+from pymbtiles.compression import (
+    CODECS,
+    GzipCodec,
+    ZlibCodec,
+    detect_codec,
+    get_codec,
+)
+
+DATA = b"tile data " * 100
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_roundtrip(name):
+    codec = get_codec(name)
+    compressed = codec.compress(DATA)
+    assert len(compressed) < len(DATA)
+    assert codec.decompress(compressed) == DATA
+
+    # codecs can be sent to worker processes
+    assert pickle.loads(pickle.dumps(codec)) == codec
+
+
+def test_gzip_deterministic():
+    codec = GzipCodec()
+    assert codec.compress(DATA) == codec.compress(DATA)
+
+
+def test_get_codec():
+    assert get_codec("gzip").level == 6
+    assert get_codec("gzip", 9).level == 9
+    assert get_codec(ZlibCodec(1)) == ZlibCodec(1)
+    assert get_codec(ZlibCodec(1), 5) == ZlibCodec(5)
+
+    with pytest.raises(ValueError):
+        get_codec("bad")
+
+
+def test_detect_codec():
+    assert detect_codec(GzipCodec().compress(DATA)) == GzipCodec()
+    # zlib does not have a reliable signature
+    assert detect_codec(ZlibCodec(9).compress(DATA)) is None
+    assert detect_codec(DATA) is None
+    assert detect_codec(b"\x89PNG\r\n") is None
+    assert detect_codec(b"") is None
+
+
+def test_zstd():
+    pytest.importorskip("zstandard")
+    codec = get_codec("zstd")
+    assert detect_codec(codec.compress(DATA)) == codec
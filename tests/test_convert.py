@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.convert import export_directory, import_directory, export_tar, import_tar
+
+
+@pytest.fixture
+def tileset(tmpdir):
+    filename = str(tmpdir.join("source.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test", "format": "pbf"}
+        out.write_tiles(
+            [
+                Tile(0, 0, 0, b"0"),
+                Tile(1, 0, 0, b"same"),
+                Tile(1, 1, 0, b"same"),
+                Tile(1, 1, 1, b"other"),
+            ]
+        )
+    return filename
+
+
+def test_export_directory(tmpdir, tileset):
+    path = str(tmpdir.join("tiles"))
+    assert export_directory(tileset, path, batch_size=2) == 4
+
+    # rows are flipped to xyz
+    assert open(os.path.join(path, "1", "0", "1.pbf"), "rb").read() == b"same"
+    assert open(os.path.join(path, "1", "1", "0.pbf"), "rb").read() == b"other"
+    assert os.path.exists(os.path.join(path, "metadata.json"))
+
+    # duplicate tiles are hard linked
+    assert os.path.samefile(
+        os.path.join(path, "1", "0", "1.pbf"), os.path.join(path, "1", "1", "1.pbf")
+    )
+
+
+def test_export_directory_tms(tmpdir, tileset):
+    path = str(tmpdir.join("tiles"))
+    export_directory(tileset, path, ext="mvt", scheme="tms", hardlinks=False)
+
+    assert open(os.path.join(path, "1", "1", "1.mvt"), "rb").read() == b"other"
+    assert not os.path.samefile(
+        os.path.join(path, "1", "0", "0.mvt"), os.path.join(path, "1", "1", "0.mvt")
+    )
+
+
+def test_export_directory_resume(tmpdir, tileset):
+    path = str(tmpdir.join("tiles"))
+    export_directory(tileset, path)
+
+    # existing tiles are not written again
+    tile_path = os.path.join(path, "0", "0", "0.pbf")
+    with open(tile_path, "wb") as f:
+        f.write(b"existing")
+
+    export_directory(tileset, path)
+    assert open(tile_path, "rb").read() == b"existing"
+
+    export_directory(tileset, path, resume=False)
+    assert open(tile_path, "rb").read() == b"0"
+
+
+def test_import_directory(tmpdir, tileset):
+    path = str(tmpdir.join("tiles"))
+    filename = str(tmpdir.join("out.mbtiles"))
+    export_directory(tileset, path)
+
+    assert import_directory(path, filename, batch_size=3) == 4
+
+    with MBtiles(tileset) as src, MBtiles(filename) as out:
+        assert sorted(out.list_tiles()) == sorted(src.list_tiles())
+        assert out.read_tile(1, 1, 1) == b"other"
+        assert out.meta["name"] == "test"
+
+    # only tiles that are not present are imported
+    os.makedirs(os.path.join(path, "2", "0"))
+    with open(os.path.join(path, "2", "0", "0.pbf"), "wb") as f:
+        f.write(b"new")
+    assert import_directory(path, filename) == 1
+
+    with MBtiles(filename) as out:
+        assert out.read_tile(2, 0, 3) == b"new"
+
+
+def test_invalid_scheme(tmpdir, tileset):
+    with pytest.raises(ValueError):
+        export_directory(tileset, str(tmpdir.join("tiles")), scheme="bad")
+
+
+@pytest.mark.parametrize("ext", ["tar", "tar.gz"])
+def test_tar(tmpdir, tileset, ext):
+    tarfilename = str(tmpdir.join("tiles." + ext))
+    filename = str(tmpdir.join("out.mbtiles"))
+
+    assert export_tar(tileset, tarfilename, batch_size=2) == 4
+    assert import_tar(tarfilename, filename, batch_size=2) == 4
+
+    with MBtiles(tileset) as src, MBtiles(filename) as out:
+        assert sorted(out.list_tiles()) == sorted(src.list_tiles())
+        for z, x, y in src.list_tiles():
+            assert out.read_tile(z, x, y) == src.read_tile(z, x, y)
+        assert out.meta["format"] == "pbf"
+
+    # resuming imports nothing new
+    assert import_tar(tarfilename, filename) == 0
@@ -1,9 +1,11 @@
+import hashlib
 import sqlite3
+import zlib
 import os
 import sys
 import pytest
 
-from pymbtiles import MBtiles, Tile, TileCoordinate
+from pymbtiles import MBtiles, Tile, TileCoordinate, ZoomStats
 
 IS_PY2 = sys.version_info[0] == 2
 
@@ -172,6 +174,20 @@ def test_read_tile(tmpdir, blank_png_tile):
         assert src.read_tile(0, 0, 0) == blank_png_tile
 
 
+def test_read_tile_id(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles([Tile(1, 0, 0, blank_png_tile), Tile(1, 0, 1, blank_png_tile)])
+        out.write_tile(1, 1, 0, b"")
+
+    with MBtiles(filename, mode="r") as src:
+        tile_id = src.read_tile_id(1, 0, 0)
+        assert tile_id == hashlib.sha1(blank_png_tile).hexdigest()
+        assert src.read_tile_id(1, 0, 1) == tile_id
+        assert src.read_tile_id(1, 1, 0) != tile_id
+        assert src.read_tile_id(5, 0, 0) is None
+
+
 def test_read_missing_tile(tmpdir, blank_png_tile):
     filename = str(tmpdir.join("test.mbtiles"))
 
@@ -209,6 +225,58 @@ def test_write_metadata(tmpdir):
         assert row[0] == "bar"
 
 
+def test_metadata_flush(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    def stored():
+        db = sqlite3.connect(filename)
+        try:
+            return dict(db.execute("SELECT name, value from metadata").fetchall())
+        finally:
+            db.close()
+
+    with MBtiles(filename, mode="w", profile="wal_concurrent") as out:
+        out.meta = {"name": "test", "version": "1.0.0"}
+        out.meta["format"] = "png"
+        assert out.meta.dirty
+        assert stored() == {}
+
+        out.meta.flush()
+        assert not out.meta.dirty
+        assert stored() == {"name": "test", "version": "1.0.0", "format": "png"}
+
+        # unchanged values are not written again
+        out.meta.update({"name": "test", "format": "png"})
+        assert not out.meta.dirty
+
+        # changes are written with tiles
+        del out.meta["version"]
+        out.meta["description"] = "tiles"
+        out.write_tiles([Tile(0, 0, 0, blank_png_tile)])
+        assert not out.meta.dirty
+        assert stored() == {"name": "test", "format": "png", "description": "tiles"}
+
+        assert out.meta.pop("description") == "tiles"
+        assert out.meta.pop("foo", None) is None
+        out.meta.setdefault("attribution", "me")
+
+    # written on close
+    assert stored() == {"name": "test", "format": "png", "attribution": "me"}
+
+    with MBtiles(filename, mode="r+") as out:
+        assert out.meta["attribution"] == "me"
+        out.meta.clear()
+        out.meta = {"name": "new"}
+
+    assert stored() == {"name": "new"}
+
+    # file is still closed if metadata cannot be written
+    src = MBtiles(filename, mode="r")
+    src.meta["name"] = "foo"
+    with pytest.raises(sqlite3.OperationalError):
+        src.close()
+
+
 def test_overwite_metadata(tmpdir):
     filename = str(tmpdir.join("test.mbtiles"))
 
@@ -296,3 +364,658 @@ def test_read_metadata(tmpdir):
 
     with MBtiles(filename, mode="r") as src:
         src.meta == metadata
+
+
+def test_list_tiles_batched_order(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [
+        Tile(z, x, y, "{}/{}/{}".format(z, x, y).encode("ascii"))
+        for z in (2, 0, 1)
+        for x in range(2 ** z)
+        for y in range(2 ** z)
+    ]
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(tiles)
+
+    expected = sorted(TileCoordinate(*tile[:3]) for tile in tiles)
+
+    with MBtiles(filename, mode="r") as src:
+        for batch_size in (1, 3, 7, 21, 100):
+            batches = list(src.list_tiles_batched(batch_size))
+            assert [tile for batch in batches for tile in batch] == expected
+            assert all(len(batch) <= batch_size for batch in batches)
+
+        # reading other tiles between batches must not disturb iteration
+        listed = []
+        for batch in src.list_tiles_batched(2, data=True):
+            for tile in batch:
+                assert isinstance(tile, Tile)
+                assert src.read_tile(tile.z, tile.x, tile.y) == tile.data
+                listed.append(tile)
+
+        assert [TileCoordinate(*tile[:3]) for tile in listed] == expected
+
+
+def test_iter_tiles(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles([Tile(1, 1, 0, b"123"), Tile(0, 0, 0, blank_png_tile)])
+
+    with MBtiles(filename, mode="r") as src:
+        assert list(src.iter_tiles(batch_size=1)) == [(0, 0, 0), (1, 1, 0)]
+        assert list(src.iter_tiles(data=True)) == [
+            Tile(0, 0, 0, blank_png_tile),
+            Tile(1, 1, 0, b"123"),
+        ]
+
+
+def test_read_tiles(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(3, x, y, b"%d-%d" % (x, y)) for x in range(8) for y in range(8)]
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(tiles)
+
+    with MBtiles(filename, mode="r") as src:
+        coords = [(3, 1, 2), TileCoordinate(4, 0, 0), (3, 7, 7), (3, 1, 2)]
+        assert src.read_tiles(coords) == [
+            Tile(3, 1, 2, b"1-2"),
+            Tile(4, 0, 0, None),
+            Tile(3, 7, 7, b"7-7"),
+            Tile(3, 1, 2, b"1-2"),
+        ]
+
+        # enough tiles to span several queries
+        coords = [tile[:3] for tile in reversed(tiles)] * 10
+        read = src.read_tiles(coords)
+        assert [tile[:3] for tile in read] == coords
+        assert read[:64] == list(reversed(tiles))
+
+        assert src.read_tiles([]) == []
+
+
+def test_read_tiles_in_bbox(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(3, x, y, b"%d-%d" % (x, y)) for x in range(8) for y in range(8)]
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(tiles + [Tile(4, 2, 2, b"")])
+
+    with MBtiles(filename, mode="r") as src:
+        assert src.read_tiles_in_bbox(3, 2, 3, 4, 5) == [
+            Tile(3, 2, 4, b"2-4"),
+            Tile(3, 2, 5, b"2-5"),
+            Tile(3, 3, 4, b"3-4"),
+            Tile(3, 3, 5, b"3-5"),
+        ]
+        assert len(src.read_tiles_in_bbox(3, 0, 7, 0, 7)) == 64
+        assert src.read_tiles_in_bbox(5, 0, 7, 0, 7) == []
+
+
+def test_invalid_profile(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="w", profile="foo")
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="w", profile="readonly_serving")
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="w", pragmas={"cache_size": "1; DROP TABLE map"})
+
+
+def test_profile_pragmas(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w") as out:
+        assert out.profile == "bulk_load"
+        assert out._cursor.execute("PRAGMA journal_mode").fetchone()[0] == "off"
+
+    with MBtiles(
+        filename, mode="w", profile="wal_concurrent", pragmas={"page_size": 8192}
+    ) as out:
+        assert out._cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert out._cursor.execute("PRAGMA page_size").fetchone()[0] == 8192
+
+    with MBtiles(filename, mode="r", profile="readonly_serving") as src:
+        assert src._cursor.execute("PRAGMA query_only").fetchone()[0] == 1
+
+
+def test_wal_concurrent(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="wal_concurrent") as out:
+        out.write_tile(0, 0, 0, blank_png_tile)
+
+        # readers can read committed tiles while the file is open for writing
+        with MBtiles(filename, mode="r", profile="readonly_serving") as src:
+            assert src.read_tile(0, 0, 0) == blank_png_tile
+
+            out.write_tiles([Tile(1, 0, 0, b"123")])
+            assert src.read_tile(1, 0, 0) == b"123"
+
+        busy, log, checkpointed = out.checkpoint("truncate")
+        assert busy == 0
+
+        with pytest.raises(ValueError):
+            out.checkpoint("foo")
+
+
+def test_immutable(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test tiles"}
+        out.write_tile(0, 0, 0, blank_png_tile)
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="r+", immutable=True)
+
+    with MBtiles(
+        filename, mode="r", profile="readonly_serving", immutable=True
+    ) as src:
+        assert src.read_tile(0, 0, 0) == blank_png_tile
+        assert src.meta["name"] == "test tiles"
+        assert src._cursor.execute("PRAGMA mmap_size").fetchone()[0] > 0
+
+
+def test_write_duplicate_tiles(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(2, x, y, blank_png_tile) for x in range(4) for y in range(4)]
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(tiles)
+        out.write_tile(0, 0, 0, b"123")
+
+        stats = out.write_stats
+        assert stats["tiles"] == 17
+        assert stats["images"] == 2
+        assert stats["duplicates"] == 15
+        assert stats["dedup_ratio"] == 15 / 17.0
+
+    # duplicates of tiles already in the file are not written again
+    with MBtiles(filename, mode="r+") as out:
+        out.write_tile(1, 0, 0, blank_png_tile)
+        assert out.write_stats["images"] == 0
+
+    with sqlite3.connect(filename) as db:
+        assert db.execute("SELECT count(*) FROM images").fetchone()[0] == 2
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([t[:3] for t in tiles]) == tiles
+        assert src.read_tile(1, 0, 0) == blank_png_tile
+
+
+def test_tile_id_hash(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="w", tile_id_hash="foo")
+
+    with MBtiles(filename, mode="w", tile_id_hash="md5") as out:
+        out.write_tile(0, 0, 0, blank_png_tile)
+
+    with MBtiles(filename, mode="w", tile_id_hash=lambda data: str(len(data))) as out:
+        out.write_tiles([Tile(0, 0, 0, b"123"), Tile(1, 0, 0, b"456")])
+
+    with sqlite3.connect(filename) as db:
+        assert db.execute("SELECT tile_id FROM images").fetchall() == [("3",)]
+
+
+def test_defer_indexes(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="r+", defer_indexes=True)
+
+    with MBtiles(filename, mode="w", defer_indexes=True) as out:
+        out.write_tiles([Tile(1, 0, 0, b"a"), Tile(1, 0, 1, blank_png_tile)])
+        out.write_tiles([Tile(1, 0, 0, b"b"), Tile(0, 0, 0, blank_png_tile)])
+        # forget known tile_ids so that tile data are written again
+        out._known_tile_ids.clear()
+        out.write_tile(1, 1, 1, b"b")
+
+        # tiles can be read before indexes are built
+        assert out.read_tile(1, 0, 1) == blank_png_tile
+
+    with sqlite3.connect(filename) as db:
+        indexes = {
+            row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        }
+        assert {"map_index", "images_id"}.issubset(indexes)
+        assert db.execute("SELECT count(*) FROM map").fetchone()[0] == 4
+        assert db.execute("SELECT count(*) FROM images").fetchone()[0] == 3
+
+    with MBtiles(filename) as src:
+        # last tile written is kept
+        assert src.read_tile(1, 0, 0) == b"b"
+        assert src.read_tile(1, 1, 1) == b"b"
+        assert src.read_tile(0, 0, 0) == blank_png_tile
+
+    # no duplicates
+    with MBtiles(filename, mode="w", defer_indexes=True) as out:
+        out.write_tile(0, 0, 0, blank_png_tile)
+        out.build_indexes()
+        out.write_tile(0, 0, 0, b"a")
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(0, 0, 0) == b"a"
+
+
+def test_stats(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(
+            [
+                Tile(3, 1, 2, b"1"),
+                Tile(3, 3, 5, b"12"),
+                Tile(3, 6, 2, b"123"),
+                Tile(3, 7, 3, b"12345"),
+                Tile(0, 0, 0, b""),
+            ]
+        )
+
+        stats = out.stats()
+        assert sorted(stats) == [0, 3]
+        assert stats[3] == ZoomStats(3, 4, 1, 7, 2, 5, 11, 1, 5, {1: 1, 2: 1, 4: 1, 8: 1})
+        assert stats[0] == ZoomStats(0, 1, 0, 0, 0, 0, 0, 0, 0, {0: 1})
+
+        # writing tiles updates statistics for that zoom level
+        out.write_tile(3, 0, 0, b"123456789")
+        out.write_tile(5, 0, 0, b"1")
+        stats = out.stats()
+        assert sorted(stats) == [0, 3, 5]
+        assert stats[3].tile_count == 5
+        assert stats[3].total_bytes == 20
+        assert stats[3].min_column == 0
+        assert stats[3].size_histogram[16] == 1
+
+    with sqlite3.connect(filename) as db:
+        assert db.execute("SELECT count(*) FROM tile_stats").fetchone()[0] == 3
+
+    with MBtiles(filename) as src:
+        assert src.stats() == stats
+        assert src.stats(refresh=True) == stats
+
+
+def test_stats_tiles_table(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with sqlite3.connect(filename) as db:
+        db.execute(
+            "CREATE TABLE tiles "
+            "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        db.execute("INSERT INTO tiles VALUES (1, 0, 1, ?), (1, 1, 0, ?)", (b"a", b"bc"))
+
+    with MBtiles(filename) as src:
+        assert src.zoom_range() == (1, 1)
+        assert src.row_range(1) == (0, 1)
+        assert src.stats()[1].total_bytes == 3
+        assert src.tiles_in_bbox(1, (-180, -85, 180, 85)) == [(1, 0, 1), (1, 1, 0)]
+
+
+def test_tiles_in_bbox(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(
+            Tile(2, x, y, b"") for x in range(4) for y in range(4)
+        )
+
+    with MBtiles(filename) as src:
+        assert len(src.tiles_in_bbox(2, (-180, -90, 180, 90))) == 16
+
+        # northeast quadrant; rows are TMS so northern rows are higher
+        assert src.tiles_in_bbox(2, (1, 1, 179, 84)) == [
+            (2, 2, 2),
+            (2, 2, 3),
+            (2, 3, 2),
+            (2, 3, 3),
+        ]
+
+        assert src.tiles_in_bbox(2, (-80, -10, -10, 10)) == [(2, 1, 1), (2, 1, 2)]
+        assert src.tiles_in_bbox(3, (-180, -90, 180, 90)) == []
+
+
+def test_compression(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(1, 0, 0, b"a" * 100), Tile(1, 0, 1, b"b" * 100)]
+
+    with MBtiles(filename, mode="w", compression="gzip", compression_level=9) as out:
+        out.write_tiles(tiles)
+        out.write_tile(0, 0, 0, b"")
+
+    with MBtiles(filename) as src:
+        data = src.read_tile(1, 0, 0)
+        assert data[:2] == b"\x1f\x8b"
+        assert zlib.decompress(data, 31) == b"a" * 100
+
+    # codec is detected from tile data
+    with MBtiles(filename, decompress=True) as src:
+        assert src.read_tile(1, 0, 0) == b"a" * 100
+        assert src.read_tile(0, 0, 0) == b""
+        assert src.read_tile(5, 0, 0) is None
+        assert src.read_tiles([(1, 0, 0), (1, 0, 1)]) == tiles
+        assert src.read_tiles_in_bbox(1, 0, 1, 0, 1) == tiles
+        assert list(src.iter_tiles(data=True))[1:] == tiles
+
+    with MBtiles(filename, compression="gzip", decompress=True) as src:
+        assert src.read_tile(1, 0, 1) == b"b" * 100
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, compression="bad")
+
+
+def test_compact(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(Tile(4, x, 0, os.urandom(4096)) for x in range(16))
+        out.write_tiles(Tile(4, x, 0, b"new") for x in range(8))
+
+        result = out.compact(batch_size=3)
+        assert result["images_deleted"] == 8
+        assert result["bytes_reclaimed"] == 0
+        assert result["free_bytes"] > 0
+
+        count = out._cursor.execute("SELECT count(*) FROM images").fetchone()[0]
+        assert count == 9
+        assert out.read_tile(4, 0, 0) == b"new"
+        assert len(out.read_tile(4, 8, 0)) == 4096
+
+        # nothing left to delete; vacuum returns free pages
+        result = out.compact(vacuum="full")
+        assert result["images_deleted"] == 0
+        assert result["bytes_reclaimed"] > 0
+        assert result["free_bytes"] == 0
+
+        # previously deleted tile data are written again
+        out.write_tile(4, 15, 0, b"a")
+        out.write_tile(4, 14, 0, b"a")
+        assert out.read_tile(4, 14, 0) == b"a"
+
+        with pytest.raises(ValueError):
+            out.compact(vacuum="foo")
+
+        # file was not created with auto_vacuum INCREMENTAL
+        with pytest.raises(ValueError):
+            out.compact(vacuum="incremental")
+
+        with out.transaction():
+            with pytest.raises(ValueError):
+                out.compact()
+
+    with MBtiles(filename) as src:
+        with pytest.raises(ValueError):
+            src.compact()
+
+
+def test_compact_concurrent_rewrite(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w", profile="wal_concurrent") as out:
+        out.write_tiles(Tile(4, x, 0, "old{0}".format(x).encode()) for x in range(8))
+        out.write_tiles(Tile(4, x, 0, b"new") for x in range(8))
+
+        # another connection rewrites the last tile with DELETE and INSERT
+        # between batches, using tile data not yet deleted; the new row of map
+        # reuses the rowid of the deleted row
+        db = sqlite3.connect(filename, isolation_level=None)
+        cursor = out._cursor
+
+        class Cursor(object):
+            batches = 0
+
+            def execute(self, sql, *args):
+                if sql == "BEGIN IMMEDIATE":
+                    Cursor.batches += 1
+                    if Cursor.batches == 2:
+                        tile_id = db.execute(
+                            "SELECT tile_id FROM images WHERE tile_data=?",
+                            (sqlite3.Binary(b"old7"),),
+                        ).fetchone()[0]
+                        db.execute("BEGIN")
+                        db.execute(
+                            "DELETE FROM map WHERE zoom_level=4 AND tile_column=7"
+                        )
+                        db.execute(
+                            "INSERT INTO map "
+                            "(zoom_level, tile_column, tile_row, tile_id) "
+                            "VALUES (4, 7, 0, ?)",
+                            (tile_id,),
+                        )
+                        db.execute("COMMIT")
+
+                return cursor.execute(sql, *args)
+
+            def __getattr__(self, name):
+                return getattr(cursor, name)
+
+        out._cursor = Cursor()
+        try:
+            result = out.compact(batch_size=2)
+        finally:
+            out._cursor = cursor
+            db.close()
+
+        assert result["images_deleted"] == 7
+        assert out.read_tile(4, 7, 0) == b"old7"
+        assert out.read_tile(4, 0, 0) == b"new"
+
+
+def test_compact_incremental(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(
+        filename,
+        mode="w",
+        profile="wal_concurrent",
+        pragmas={"auto_vacuum": "INCREMENTAL"},
+    ) as out:
+        out.write_tiles(Tile(4, x, 0, os.urandom(4096)) for x in range(16))
+        out.write_tiles(Tile(4, x, 0, b"new") for x in range(16))
+
+        result = out.compact(vacuum="incremental", batch_size=4)
+        assert result["images_deleted"] == 16
+        assert result["bytes_reclaimed"] > 0
+        assert result["free_bytes"] == 0
+        assert out.read_tile(4, 3, 0) == b"new"
+
+
+def test_compact_into(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test"}
+        out.write_tiles(Tile(4, x, 0, os.urandom(4096)) for x in range(16))
+        out.write_tiles(Tile(4, x, 0, b"new") for x in range(16))
+
+        result = out.compact(into=outfilename)
+        assert result["images_deleted"] == 16
+        assert result["bytes_after"] == os.path.getsize(outfilename)
+        assert result["bytes_reclaimed"] > 0
+
+    with MBtiles(outfilename) as src:
+        assert src.meta["name"] == "test"
+        assert src.read_tile(4, 15, 0) == b"new"
+
+
+def test_write_columns(tmpdir, blank_png_tile):
+    from array import array
+
+    filename = str(tmpdir.join("test.mbtiles"))
+    xs = [x for x in range(4) for _ in range(4)]
+    ys = [y for _ in range(4) for y in range(4)]
+    blobs = [b"a", b"b"] * 8
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_columns(array("i", [2] * 16), array("i", xs), array("i", ys), blobs)
+        assert out.write_stats["tiles"] == 16
+        assert out.write_stats["images"] == 2
+
+        # tile data already present are not written again
+        out.write_columns([3, 3], [0, 1], [0, 0], [b"a", blank_png_tile])
+        assert out.write_stats["images"] == 3
+
+        with pytest.raises(ValueError):
+            out.write_columns([0], [0], [0, 1], [b"a"])
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles(zip([2] * 16, xs, ys)) == [
+            Tile(2, x, y, data) for x, y, data in zip(xs, ys, blobs)
+        ]
+        assert src.read_tile(3, 1, 0) == blank_png_tile
+
+
+def test_write_columns_numpy(tmpdir):
+    np = pytest.importorskip("numpy")
+
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w", compression="gzip") as out:
+        with out.transaction(batch_size=2) as tx:
+            out.write_columns(
+                np.full(3, 1, dtype="uint8"),
+                np.array([0, 1, 1], dtype="uint32"),
+                np.array([0, 0, 1], dtype="uint32"),
+                [b"a", b"b", b"c"],
+            )
+            assert tx.commits == 1
+
+    with MBtiles(filename, decompress=True) as src:
+        assert src.read_tile(1, 1, 1) == b"c"
+        assert src.zoom_range() == (1, 1)
+
+
+def test_scheme(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(2, 0, 0, b"a"), Tile(2, 1, 3, b"b"), Tile(2, 3, 1, b"c")]
+
+    with pytest.raises(ValueError):
+        MBtiles(filename, mode="w", scheme="foo")
+
+    with MBtiles(filename, mode="w", scheme="xyz") as out:
+        out.write_tiles(tiles[:2])
+        out.write_columns([2], [3], [1], [b"c"])
+
+        with pytest.raises(ValueError):
+            out.write_tile(2, 0, 4, b"d")
+
+        with pytest.raises(ValueError):
+            out.write_columns([1], [2], [0], [b"d"])
+
+    # rows are stored in the TMS scheme
+    db = sqlite3.connect(filename)
+    assert sorted(
+        db.execute("SELECT zoom_level, tile_column, tile_row FROM map").fetchall()
+    ) == [(2, 0, 3), (2, 1, 0), (2, 3, 2)]
+    db.close()
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(2, 0, 3) == b"a"
+        assert src.row_range(2) == (0, 3)
+
+    with MBtiles(filename, scheme="xyz") as src:
+        assert src.has_tile(2, 1, 3)
+        assert not src.has_tile(2, 1, 0)
+        assert src.read_tile(2, 3, 1) == b"c"
+        assert src.read_tile_id(2, 0, 0) == hashlib.sha1(b"a").hexdigest()
+        assert src.read_tiles([(2, 1, 3), (2, 0, 0), (2, 1, 0)]) == [
+            tiles[1],
+            tiles[0],
+            Tile(2, 1, 0, None),
+        ]
+        assert sorted(src.list_tiles()) == sorted(t[:3] for t in tiles)
+        assert [
+            tile
+            for batch in src.list_tiles_batched(batch_size=1, data=True)
+            for tile in batch
+        ] == tiles
+        assert src.row_range(2) == (0, 3)
+        assert src.stats()[2][4:6] == (0, 3)
+
+        # northeast quadrant; rows are XYZ so northern rows are lower
+        assert src.tiles_in_bbox(2, (1, 1, 179, 84)) == [(2, 3, 1)]
+        assert src.read_tiles_in_bbox(2, 0, 3, 0, 1) == [tiles[0], tiles[2]]
+
+
+def test_flip_y(tmpdir):
+    from pymbtiles import flip_y
+
+    assert flip_y(2, 0) == 3
+    assert flip_y(2, [0, 3]) == [3, 0]
+    assert flip_y([1, 2], [0, 1]) == [1, 2]
+
+    np = pytest.importorskip("numpy")
+    zs = np.array([1, 20], dtype="uint8")
+    flipped = flip_y(zs, np.array([0, 1], dtype="uint32"))
+    assert flipped.tolist() == [1, (1 << 20) - 2]
+
+    # numpy arrays mixed with other sequences
+    assert flip_y([1, 20], np.array([0, 1], dtype="uint32")).tolist() == [
+        1,
+        (1 << 20) - 2,
+    ]
+    assert flip_y(zs, [0, 1]).tolist() == [1, (1 << 20) - 2]
+    assert flip_y(np.uint8(20), 1) == (1 << 20) - 2
+
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w", scheme="xyz") as out:
+        out.write_columns([1, 1], [0, 1], np.array([0, 1]), [b"a", b"b"])
+        out.write_columns(np.array([2]), [3], [0], [b"c"])
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([(1, 0, 1), (1, 1, 0), (2, 3, 3)]) == [
+            Tile(1, 0, 1, b"a"),
+            Tile(1, 1, 0, b"b"),
+            Tile(2, 3, 3, b"c"),
+        ]
+
+
+def test_rewrite_scheme(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [
+        Tile(z, x, y, "{0}/{1}/{2}".format(z, x, y).encode("ascii"))
+        for z in range(3)
+        for x in range(1 << z)
+        for y in range(1 << z)
+    ]
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(tiles)
+        out.meta = {"name": "test"}
+        out.stats()
+
+    with MBtiles(filename, mode="r+") as out:
+        assert out.rewrite_scheme("tms") == 0
+        assert out.rewrite_scheme("xyz", batch_size=5) == len(tiles)
+        assert out.meta["scheme"] == "xyz"
+        assert out.meta["name"] == "test"
+        assert out.read_tiles(t[:3] for t in tiles) == tiles
+        assert out.stats()[2][4:6] == (0, 3)
+
+    with MBtiles(filename, scheme="xyz") as src:
+        assert src.read_tile(2, 1, 0) == b"2/1/3"
+        assert src._row_sql == "tile_row"
+
+    # interrupted during phase 1 of a rewrite back to TMS
+    db = sqlite3.connect(filename, isolation_level=None)
+    db.execute(
+        "INSERT INTO metadata VALUES ('scheme_rewrite', ?)",
+        ('{"scheme": "tms", "phase": 1}',),
+    )
+    db.execute(
+        "UPDATE map SET tile_row = tile_row - (1 << zoom_level) WHERE rowid <= 10"
+    )
+    db.close()
+
+    with pytest.raises(ValueError):
+        MBtiles(filename)
+
+    with MBtiles(filename, mode="r+") as out:
+        with pytest.raises(ValueError):
+            out.rewrite_scheme("xyz")
+
+        assert out.rewrite_scheme("tms") == len(tiles)
+        assert "scheme" not in out.meta
+        assert "scheme_rewrite" not in out.meta
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles(t[:3] for t in tiles) == tiles
@@ -1,10 +1,19 @@
 import sqlite3
+import zlib
 import os
 import sys
 import pytest
 
 from pymbtiles import MBtiles, Tile, TileCoordinate
-from pymbtiles.ops import extend, union, difference
+from pymbtiles.ops import (
+    apply_patch,
+    compact,
+    diff,
+    difference,
+    extend,
+    recompress,
+    union,
+)
 
 IS_PY2 = sys.version_info[0] == 2
 
@@ -66,3 +75,337 @@ def test_difference(tmpdir):
         tiles = set(src.list_tiles())
         assert tiles == {(1, 0, 0)}
 
+
+
+def test_extend_shared_images(tmpdir):
+    source = str(tmpdir.join("source.mbtiles"))
+    target = str(tmpdir.join("target.mbtiles"))
+    with MBtiles(source, mode="w") as out:
+        out.write_tiles(
+            [Tile(1, 0, 0, b"a"), Tile(1, 0, 1, b"b"), Tile(1, 1, 1, b"c")]
+        )
+
+    with MBtiles(target, mode="w") as out:
+        out.write_tiles([Tile(0, 0, 0, b"a"), Tile(1, 1, 1, b"d")])
+
+    extend(source, target)
+
+    with MBtiles(target) as src:
+        assert src.read_tiles(sorted(src.list_tiles())) == [
+            Tile(0, 0, 0, b"a"),
+            Tile(1, 0, 0, b"a"),
+            Tile(1, 0, 1, b"b"),
+            Tile(1, 1, 1, b"d"),
+        ]
+
+    with sqlite3.connect(target) as db:
+        # b"a" was already present and should not be copied again; b"c" is not used
+        assert db.execute("SELECT count(*) FROM images").fetchone()[0] == 3
+
+
+def test_extend_missing_images(tmpdir):
+    source = str(tmpdir.join("source.mbtiles"))
+    target = str(tmpdir.join("target.mbtiles"))
+    with MBtiles(source, mode="w") as out:
+        out.write_tiles([Tile(1, 0, 0, b"a"), Tile(1, 0, 1, b"b")])
+
+    with MBtiles(target, mode="w") as out:
+        out.write_tiles([Tile(1, 0, 0, b"c")])
+
+    # tile in map without tile data in images
+    with sqlite3.connect(target) as db:
+        db.execute("DELETE FROM images")
+
+    extend(source, target)
+
+    with MBtiles(target) as src:
+        assert src.read_tile(1, 0, 0) == b"a"
+        assert src.read_tile(1, 0, 1) == b"b"
+
+
+def test_extend_conflicting_tile_ids(tmpdir):
+    source = str(tmpdir.join("source.mbtiles"))
+    target = str(tmpdir.join("target.mbtiles"))
+    with MBtiles(source, mode="w") as out:
+        out.write_tiles([Tile(1, 0, 0, b"a")])
+
+    with MBtiles(target, mode="w") as out:
+        out.write_tiles([Tile(0, 0, 0, b"b")])
+
+    # make both tilesets use the same (non-hash) tile_id for different data
+    for filename in (source, target):
+        with sqlite3.connect(filename) as db:
+            db.execute("UPDATE map SET tile_id='1'")
+            db.execute("UPDATE images SET tile_id='1'")
+
+    extend(source, target)
+
+    with MBtiles(target) as src:
+        assert src.read_tile(0, 0, 0) == b"b"
+        assert src.read_tile(1, 0, 0) == b"a"
+
+
+def test_extend_tiles_table(tmpdir):
+    """Tilesets that store tiles in a single table cannot be merged in SQL."""
+    source = str(tmpdir.join("source.mbtiles"))
+    target = str(tmpdir.join("target.mbtiles"))
+
+    with sqlite3.connect(source) as db:
+        db.execute(
+            "CREATE TABLE tiles "
+            "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        db.execute("CREATE TABLE metadata (name text, value text)")
+        db.execute("INSERT INTO tiles VALUES (0, 0, 0, ?), (1, 0, 0, ?)", (b"a", b"b"))
+
+    with MBtiles(target, mode="w") as out:
+        out.write_tiles([Tile(0, 0, 0, b"c")])
+
+    extend(source, target)
+
+    with MBtiles(target) as src:
+        assert src.read_tile(0, 0, 0) == b"c"
+        assert src.read_tile(1, 0, 0) == b"b"
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    difference(source, target, outfilename)
+    with MBtiles(outfilename) as src:
+        assert src.list_tiles() == []
+
+
+def test_difference_metadata(tmpdir):
+    left = str(tmpdir.join("left.mbtiles"))
+    right = str(tmpdir.join("right.mbtiles"))
+    outfilename = str(tmpdir.join("out.mbtiles"))
+
+    with MBtiles(left, mode="w") as out:
+        out.meta = {"name": "left"}
+        out.write_tiles([Tile(0, 0, 0, b"a"), Tile(1, 0, 0, b"a"), Tile(1, 0, 1, b"b")])
+
+    with MBtiles(right, mode="w") as out:
+        out.write_tiles([Tile(1, 0, 1, b"a")])
+
+    difference(left, right, outfilename)
+
+    with MBtiles(outfilename) as src:
+        assert src.meta == {"name": "left"}
+        assert src.read_tiles(sorted(src.list_tiles())) == [
+            Tile(0, 0, 0, b"a"),
+            Tile(1, 0, 0, b"a"),
+        ]
+
+    with sqlite3.connect(outfilename) as db:
+        assert db.execute("SELECT count(*) FROM images").fetchone()[0] == 1
+
+
+def test_recompress(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test"}
+        out.write_tiles(
+            [Tile(0, 0, 0, b"a" * 100), Tile(1, 0, 0, b"b" * 100), Tile(1, 0, 1, b"")]
+        )
+    with MBtiles(filename, mode="r+", compression="gzip") as out:
+        out.write_tile(1, 1, 1, b"b" * 100)
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    result = recompress(filename, outfilename, compression="zlib", compression_level=9)
+    assert result["tiles"] == 4
+    assert result["bytes_after"] < result["bytes_before"]
+
+    with MBtiles(outfilename) as src:
+        assert src.meta["name"] == "test"
+        assert src.read_tile(1, 0, 0) == zlib.compress(b"b" * 100, 9)
+        # tiles that decompress to the same data share tile data
+        assert src.read_tile(1, 1, 1) == src.read_tile(1, 0, 0)
+        count = src._cursor.execute("SELECT count(*) FROM images").fetchone()[0]
+        assert count == 3
+
+    # in place, decompressing with the codec of the file
+    result = recompress(outfilename, compression=None, source_compression="zlib")
+    assert result["bytes_after"] > result["bytes_before"]
+
+    with MBtiles(outfilename) as src:
+        assert src.read_tile(0, 0, 0) == b"a" * 100
+        assert src.read_tile(1, 0, 1) == b""
+        assert src.meta["name"] == "test"
+        count = src._cursor.execute("SELECT count(*) FROM images").fetchone()[0]
+        assert count == 3
+
+
+def test_recompress_tiles_table(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with sqlite3.connect(filename) as db:
+        db.execute(
+            "CREATE TABLE tiles "
+            "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        db.execute("CREATE TABLE metadata (name text, value text)")
+        db.execute("INSERT INTO tiles VALUES (0, 0, 0, ?)", (b"a" * 100,))
+
+    with pytest.raises(ValueError):
+        recompress(filename)
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    assert recompress(filename, outfilename)["tiles"] == 1
+    with MBtiles(outfilename, decompress=True) as src:
+        assert src.read_tile(0, 0, 0) == b"a" * 100
+
+
+def _write_versions(old, new):
+    with MBtiles(old, mode="w") as out:
+        out.meta = {"name": "old", "version": "1"}
+        out.write_tiles(
+            [
+                Tile(0, 0, 0, b"same"),
+                Tile(1, 0, 0, b"changed"),
+                Tile(1, 0, 1, b"deleted"),
+                Tile(1, 1, 1, b"same"),
+            ]
+        )
+
+    with MBtiles(new, mode="w") as out:
+        out.meta = {"name": "new"}
+        out.write_tiles(
+            [
+                Tile(0, 0, 0, b"same"),
+                Tile(1, 0, 0, b"new data"),
+                Tile(1, 1, 0, b"added"),
+                Tile(1, 1, 1, b"same"),
+            ]
+        )
+
+
+@pytest.mark.parametrize("compare", ["tile_id", "data"])
+def test_diff_and_apply_patch(tmpdir, compare):
+    old = str(tmpdir.join("old.mbtiles"))
+    new = str(tmpdir.join("new.mbtiles"))
+    patch = str(tmpdir.join("patch.mbtiles"))
+    _write_versions(old, new)
+
+    assert diff(old, new, patch, compare=compare) == {
+        "added": 1,
+        "changed": 1,
+        "deleted": 1,
+    }
+
+    with MBtiles(patch) as src:
+        assert sorted(src.list_tiles()) == [(1, 0, 0), (1, 1, 0)]
+        assert src._cursor.execute("SELECT * FROM deletions").fetchall() == [
+            (1, 0, 1)
+        ]
+
+    apply_patch(patch, old)
+
+    with MBtiles(old) as src, MBtiles(new) as expected:
+        assert sorted(src.list_tiles()) == sorted(expected.list_tiles())
+        for z, x, y in expected.list_tiles():
+            assert src.read_tile(z, x, y) == expected.read_tile(z, x, y)
+        assert dict(src.meta) == {"name": "new"}
+
+    with pytest.raises(ValueError):
+        apply_patch(new, old)
+
+
+def test_diff_tiles_table(tmpdir):
+    old = str(tmpdir.join("old.mbtiles"))
+    new = str(tmpdir.join("new.mbtiles"))
+    patch = str(tmpdir.join("patch.mbtiles"))
+    _write_versions(str(tmpdir.join("unused.mbtiles")), new)
+
+    with sqlite3.connect(old) as db:
+        db.execute(
+            "CREATE TABLE tiles "
+            "(zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        db.execute("CREATE TABLE metadata (name text, value text)")
+        db.execute(
+            "INSERT INTO tiles VALUES (0, 0, 0, ?), (1, 0, 1, ?)", (b"same", b"x")
+        )
+
+    assert diff(old, new, patch) == {"added": 3, "changed": 0, "deleted": 1}
+
+    apply_patch(patch, old)
+    with MBtiles(old) as src:
+        assert sorted(src.list_tiles()) == [(0, 0, 0), (1, 0, 0), (1, 1, 0), (1, 1, 1)]
+        assert src.read_tile(1, 0, 0) == b"new data"
+
+
+def test_compact(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(Tile(4, x, 0, os.urandom(4096)) for x in range(16))
+        out.write_tiles(Tile(4, x, 0, b"new") for x in range(16))
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    size = os.path.getsize(filename)
+    result = compact(filename, outfilename)
+    assert result["images_deleted"] == 16
+    assert result["bytes_before"] == size
+    assert result["bytes_after"] == os.path.getsize(outfilename)
+    assert result["bytes_reclaimed"] > 0
+    assert result["free_bytes"] == 0
+    assert os.path.getsize(filename) == size
+
+    # the copy is vacuumed incrementally instead of being written again
+    with MBtiles(outfilename) as src:
+        assert src._pragma_value("auto_vacuum") == 2
+    with MBtiles(filename) as src:
+        assert src._pragma_value("auto_vacuum") == 0
+
+    with pytest.raises(ValueError):
+        compact(filename, outfilename)
+
+    with pytest.raises(ValueError):
+        compact(filename, vacuum="foo")
+
+    result = compact(filename)
+    assert result["images_deleted"] == 16
+    assert result["bytes_reclaimed"] > 0
+    assert os.path.getsize(filename) == result["bytes_after"]
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(4, 0, 0) == b"new"
+
+
+def test_ops_xyz_rows(tmpdir):
+    xyz = str(tmpdir.join("xyz.mbtiles"))
+    tms = str(tmpdir.join("tms.mbtiles"))
+    tiles = [Tile(2, 1, 0, b"a"), Tile(2, 2, 1, b"b")]
+
+    with MBtiles(xyz, mode="w") as out:
+        out.meta = {"name": "xyz"}
+        out.write_tiles(tiles)
+    with MBtiles(xyz, mode="r+") as out:
+        out.rewrite_scheme("xyz")
+
+    with MBtiles(tms, mode="w") as out:
+        out.write_tiles([Tile(2, 2, 1, b"c")])
+
+    # rows stored in different schemes are converted when copied
+    extend(xyz, tms)
+    with MBtiles(tms) as src:
+        assert "scheme" not in src.meta
+        assert src.read_tiles(t[:3] for t in tiles) == [
+            Tile(2, 1, 0, b"a"),
+            Tile(2, 2, 1, b"c"),
+        ]
+
+    right = str(tmpdir.join("right.mbtiles"))
+    with MBtiles(right, mode="w") as out:
+        out.write_tiles([Tile(2, 2, 1, b"d")])
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    difference(xyz, right, outfilename)
+    with MBtiles(outfilename) as src:
+        assert dict(src.meta) == {"name": "xyz"}
+        assert src.list_tiles() == [(2, 1, 0)]
+        assert src.read_tile(2, 1, 0) == b"a"
+
+    with pytest.raises(ValueError):
+        diff(tms, xyz, str(tmpdir.join("patch.mbtiles")))
+
+    patch = str(tmpdir.join("patch2.mbtiles"))
+    diff(xyz, xyz, patch)
+    with pytest.raises(ValueError):
+        apply_patch(patch, tms)
@@ -0,0 +1,159 @@
+import json
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles import pmtiles
+from pymbtiles.pmtiles import (
+    mbtiles_to_pmtiles,
+    pmtiles_to_mbtiles,
+    read_header,
+    tileid_to_zxy,
+    zxy_to_tileid,
+)
+
+
+def test_tileid():
+    assert zxy_to_tileid(0, 0, 0) == 0
+    assert [zxy_to_tileid(1, x, y) for x, y in ((0, 0), (0, 1), (1, 1), (1, 0))] == [
+        1,
+        2,
+        3,
+        4,
+    ]
+    assert zxy_to_tileid(2, 0, 0) == 5
+
+    for z in range(5):
+        for x in range(1 << z):
+            for y in range(1 << z):
+                assert tileid_to_zxy(zxy_to_tileid(z, x, y)) == (z, x, y)
+
+    with pytest.raises(ValueError):
+        zxy_to_tileid(1, 2, 0)
+
+
+def test_directory_roundtrip():
+    entries = [
+        pmtiles.Entry(0, 0, 10, 1),
+        pmtiles.Entry(1, 10, 5, 3),
+        pmtiles.Entry(5, 0, 10, 1),
+        pmtiles.Entry(300, 15, 200, 1),
+    ]
+    data = pmtiles._serialize_directory(entries)
+    assert pmtiles._deserialize_directory(pmtiles._decompress(data, 2)) == entries
+
+
+def _write_tileset(filename):
+    tiles = [Tile(0, 0, 0, b"root")]
+    # zoom 2 is all the same tile, except one
+    for x in range(4):
+        for y in range(4):
+            tiles.append(Tile(2, x, y, b"x" if (x, y) == (1, 2) else b"empty"))
+
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {
+            "name": "test",
+            "format": "png",
+            "bounds": "-10,-20,10,20",
+            "json": json.dumps({"vector_layers": [{"id": "a"}]}),
+        }
+        out.write_tiles(tiles)
+
+    return tiles
+
+
+def test_mbtiles_to_pmtiles(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    pmtiles_filename = str(tmpdir.join("test.pmtiles"))
+    tiles = _write_tileset(filename)
+
+    header = mbtiles_to_pmtiles(filename, pmtiles_filename, batch_size=3)
+    assert header.addressed_tiles == len(tiles)
+    # the repeated tile is stored once
+    assert header.tile_contents == 3
+    # runs of the repeated tile are stored as one entry
+    assert header.tile_entries < len(tiles)
+    assert header.tile_type == 2
+    assert (header.min_zoom, header.max_zoom) == (0, 2)
+    assert header.min_lon == -100000000
+
+    with open(pmtiles_filename, "rb") as f:
+        assert read_header(f) == header
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    assert pmtiles_to_mbtiles(pmtiles_filename, outfilename) == len(tiles)
+
+    with MBtiles(filename) as src, MBtiles(outfilename) as out:
+        assert sorted(out.list_tiles()) == sorted(src.list_tiles())
+        for z, x, y in src.list_tiles():
+            assert out.read_tile(z, x, y) == src.read_tile(z, x, y)
+
+        assert out.meta["name"] == "test"
+        assert out.meta["format"] == "png"
+        assert json.loads(out.meta["json"]) == {"vector_layers": [{"id": "a"}]}
+
+
+def test_leaf_directories(tmpdir, monkeypatch):
+    filename = str(tmpdir.join("test.mbtiles"))
+    pmtiles_filename = str(tmpdir.join("test.pmtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(
+            Tile(3, x, y, str(x * 8 + y).encode("utf-8"))
+            for x in range(8)
+            for y in range(8)
+        )
+
+    monkeypatch.setattr(pmtiles, "MAX_ROOT_SIZE", 30)
+    header = mbtiles_to_pmtiles(filename, pmtiles_filename, leaf_size=4)
+    assert header.leaf_length > 0
+    assert header.tile_entries == 64
+
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    assert pmtiles_to_mbtiles(pmtiles_filename, outfilename) == 64
+
+    with MBtiles(outfilename) as out:
+        assert out.read_tile(3, 1, 2) == b"10"
+
+
+def test_invalid_file(tmpdir):
+    filename = str(tmpdir.join("bad.pmtiles"))
+    with open(filename, "wb") as f:
+        f.write(b"\0" * 127)
+
+    with pytest.raises(ValueError):
+        pmtiles_to_mbtiles(filename, str(tmpdir.join("out.mbtiles")))
+
+
+def test_pmtiles_to_mbtiles_runs(tmpdir, monkeypatch):
+    filename = str(tmpdir.join("test.mbtiles"))
+    pmtiles_filename = str(tmpdir.join("test.pmtiles"))
+    with MBtiles(filename, mode="w", compression="gzip") as out:
+        out.write_tiles(Tile(4, x, y, b"ocean") for x in range(16) for y in range(16))
+
+    header = mbtiles_to_pmtiles(filename, pmtiles_filename)
+    assert header.tile_entries == 1
+    assert header.tile_compression == pmtiles.COMPRESSION_GZIP
+
+    # tiles of a run are written in batches of batch_size
+    batches = []
+    write_tiles = MBtiles.write_tiles
+    monkeypatch.setattr(
+        MBtiles,
+        "write_tiles",
+        lambda self, tiles: batches.append(len(tiles)) or write_tiles(self, tiles),
+    )
+    outfilename = str(tmpdir.join("out.mbtiles"))
+    assert pmtiles_to_mbtiles(pmtiles_filename, outfilename, batch_size=100) == 256
+    assert batches == [100, 100, 56]
+
+
+def test_mbtiles_to_pmtiles_zstd(tmpdir):
+    pytest.importorskip("zstandard")
+
+    filename = str(tmpdir.join("test.mbtiles"))
+    pmtiles_filename = str(tmpdir.join("test.pmtiles"))
+    with MBtiles(filename, mode="w", compression="zstd") as out:
+        out.write_tiles([Tile(0, 0, 0, b"a")])
+
+    header = mbtiles_to_pmtiles(filename, pmtiles_filename)
+    assert header.tile_compression == pmtiles.COMPRESSION_ZSTD
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.cache import TileCache
+from pymbtiles.pool import MBtilesPool
+
+
+@pytest.fixture
+def tileset(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"name": "test tiles"}
+        out.write_tiles(
+            Tile(4, x, y, b"%d-%d" % (x, y)) for x in range(16) for y in range(16)
+        )
+    return filename
+
+
+def test_pool_missing_file(tmpdir):
+    with pytest.raises(IOError):
+        MBtilesPool(str(tmpdir.join("missing.mbtiles")))
+
+    with pytest.raises(ValueError):
+        MBtilesPool(str(tmpdir.join("missing.mbtiles")), size=0)
+
+
+def test_pool_read(tileset):
+    with MBtilesPool(tileset, size=2) as pool:
+        assert pool.read_tile(4, 1, 2) == b"1-2"
+        assert pool.read_tile(5, 0, 0) is None
+        assert pool.has_tile(4, 0, 0)
+        assert pool.read_tiles([(4, 3, 3), (0, 0, 0)]) == [
+            Tile(4, 3, 3, b"3-3"),
+            Tile(0, 0, 0, None),
+        ]
+        assert pool.meta == {"name": "test tiles"}
+
+        with pool.connection() as src:
+            assert len(src.list_tiles()) == 256
+
+        stats = pool.stats
+        assert stats["connections"] == 1
+        assert stats["checkouts"] == 6
+        assert stats["hits"] == 2
+        assert stats["misses"] == 2
+        assert stats["hit_rate"] == 0.5
+
+        assert len(pool.read_tile_id(4, 1, 2)) == 40
+        assert pool.read_tile_id(5, 0, 0) is None
+        tile_id, data = pool.read_tile_and_id(4, 1, 2)
+        assert (tile_id, data) == (pool.read_tile_id(4, 1, 2), b"1-2")
+        assert pool.read_tile_and_id(5, 0, 0) == (None, None)
+
+        assert pool.read_tile_id_and_head(4, 1, 2, 2) == (tile_id, b"1-")
+        assert pool.read_tile_id_and_head(5, 0, 0, 2) == (None, None)
+
+    with pytest.raises(ValueError):
+        pool.read_tile(4, 1, 2)
+
+
+def test_pool_threads(tileset):
+    errors = []
+
+    with MBtilesPool(tileset, size=2) as pool:
+
+        def read(x):
+            try:
+                for y in range(16):
+                    assert pool.read_tile(4, x, y) == b"%d-%d" % (x, y)
+            except Exception as e:  # pragma: no cover
+                errors.append(e)
+
+        threads = [threading.Thread(target=read, args=(x,)) for x in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        stats = pool.stats
+        assert stats["connections"] <= 2
+        assert stats["checkouts"] == 256
+        assert stats["hits"] == 256
+
+
+def test_pool_timeout(tileset):
+    with MBtilesPool(tileset, size=1, timeout=0.01) as pool:
+        with pool.connection():
+            with pytest.raises(RuntimeError):
+                pool.read_tile(4, 0, 0)
+
+        assert pool.stats["waits"] == 0
+        assert pool.read_tile(4, 0, 0) == b"0-0"
+
+
+def test_pool_read_tile_and_id_cache(tileset):
+    with MBtilesPool(tileset, cache=TileCache()) as pool:
+        tile_id = pool.read_tile_id(4, 1, 2)
+        assert pool.read_tile_and_id(4, 1, 2) == (tile_id, b"1-2")
+
+        # the tile_id in the file may not be of cached tile data
+        assert pool.read_tile_and_id(4, 1, 2) == (None, b"1-2")
+        assert pool.read_tile_id_and_head(4, 1, 2, 1) == (tile_id, b"1")
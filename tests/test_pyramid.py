@@ -0,0 +1,90 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.pyramid import build_overviews, decode_image, downsample, encode_image
+
+
+def _tile(color, size=4):
+    array = np.zeros((size, size, 4), dtype=np.uint8)
+    array[:] = color
+    return encode_image(array)
+
+
+def test_downsample():
+    mosaic = np.arange(16, dtype=np.uint8).reshape(4, 4, 1)
+    assert downsample(mosaic)[:, :, 0].tolist() == [[3, 5], [11, 13]]
+
+
+@pytest.mark.parametrize("scheme", ["tms", "xyz"])
+def test_build_overviews(tmpdir, scheme):
+    filename = str(tmpdir.join("test.mbtiles"))
+    red = _tile((255, 0, 0, 255))
+    blue = _tile((0, 0, 255, 255))
+
+    with MBtiles(filename, mode="w") as out:
+        out.meta = {"format": "png", "minzoom": "2", "maxzoom": "2"}
+        # zoom 2: red everywhere except for one blue tile in the top left
+        # quadrant; 3 tiles missing from the bottom right quadrant
+        out.write_tiles(
+            Tile(2, x, y, blue if (x, y) == (0, 3) else red)
+            for x in range(4)
+            for y in range(4)
+            if not (x >= 2 and y < 2 and (x, y) != (3, 0))
+        )
+
+    with MBtiles(filename, mode="r+") as out:
+        out.rewrite_scheme(scheme)
+
+    assert build_overviews(filename, batch_size=1, workers=2) == 5
+
+    with MBtiles(filename) as src:
+        assert src.meta["minzoom"] == "0"
+        assert sorted(src.list_tiles())[:5] == [
+            (0, 0, 0),
+            (1, 0, 0),
+            (1, 0, 1),
+            (1, 1, 0),
+            (1, 1, 1),
+        ]
+
+        # uniform children are reused as is
+        assert src.read_tile(1, 0, 0) == red
+        assert src.read_tile(1, 1, 1) == red
+
+        # top left of the top left quadrant is blue
+        top_left = decode_image(src.read_tile(1, 0, 1))
+        assert top_left[0, 0].tolist() == [0, 0, 255, 255]
+        assert top_left[-1, -1].tolist() == [255, 0, 0, 255]
+
+        # missing children are transparent
+        bottom_right = decode_image(src.read_tile(1, 1, 0))
+        assert bottom_right[0, 0].tolist() == [0, 0, 0, 0]
+        assert bottom_right[-1, -1].tolist() == [255, 0, 0, 255]
+
+        assert decode_image(src.read_tile(0, 0, 0)).shape == (4, 4, 4)
+
+
+@pytest.mark.parametrize("scheme", ["tms", "xyz"])
+def test_build_overviews_uniform(tmpdir, scheme):
+    filename = str(tmpdir.join("test.mbtiles"))
+    red = _tile((255, 0, 0, 255))
+
+    with MBtiles(filename, mode="w") as out:
+        out.write_tiles(Tile(3, x, y, red) for x in range(4) for y in range(2))
+
+    with MBtiles(filename, mode="r+") as out:
+        out.rewrite_scheme(scheme)
+
+    build_overviews(filename, min_zoom=1, processes=False)
+
+    with MBtiles(filename) as src:
+        assert src.zoom_range() == (1, 3)
+        # parents with missing children are semi transparent and identical,
+        # so they share tile data
+        assert src.read_tile(2, 0, 0) == src.read_tile(2, 1, 0) == red
+        assert src.read_tile(1, 0, 0) != red
+        count = src._cursor.execute("SELECT count(*) FROM images").fetchone()[0]
+        assert count == 2
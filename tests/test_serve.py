@@ -0,0 +1,217 @@
+import json
+import threading
+import zlib
+
+import pytest
+
+from pymbtiles import IS_PY2, MBtiles, Tile
+from pymbtiles.cache import TileCache
+from pymbtiles.serve import TileServer
+
+if IS_PY2:
+    from httplib import HTTPConnection
+else:
+    from http.client import HTTPConnection
+
+
+@pytest.fixture
+def tileset(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, "w", compression="gzip") as out:
+        out.meta = {
+            "name": "test",
+            "format": "pbf",
+            "bounds": "-180,-85,180,85",
+            "center": "0,0,1",
+            "json": json.dumps({"vector_layers": [{"id": "test"}]}),
+        }
+        # XYZ row 0 is TMS row 1
+        out.write_tiles([Tile(1, 0, 1, b"top left"), Tile(1, 1, 0, b"bottom right")])
+    return filename
+
+
+@pytest.fixture
+def server(tileset):
+    server = TileServer(tileset, port=0, max_age=60)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, path, headers=None, method="GET"):
+    connection = HTTPConnection(*server.server_address)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_serve_tile(server):
+    response, body = request(server, "/1/0/0.pbf", {"Accept-Encoding": "gzip"})
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/x-protobuf"
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("Cache-Control") == "public, max-age=60"
+    assert zlib.decompress(body, 31) == b"top left"
+
+    etag = response.getheader("ETag")
+    with MBtiles(server.pool.filename) as src:
+        assert etag == '"{0}"'.format(src.read_tile_id(1, 0, 1))
+
+    response, body = request(
+        server, "/1/0/0", {"If-None-Match": etag, "Accept-Encoding": "gzip"}
+    )
+    assert response.status == 304
+    assert response.getheader("ETag") == etag
+    assert response.getheader("Content-Length") is None
+    assert body == b""
+
+    # decompressed for clients that do not accept gzip
+    response, body = request(server, "/1/1/1")
+    assert response.status == 200
+    assert response.getheader("Content-Encoding") is None
+    assert body == b"bottom right"
+
+    identity_etag = response.getheader("ETag")
+    assert identity_etag != etag
+    response, _ = request(server, "/1/1/1", {"If-None-Match": identity_etag})
+    assert response.status == 304
+    assert response.getheader("ETag") == identity_etag
+
+    # ETags of one representation do not match the other
+    response, body = request(
+        server, "/1/1/1", {"If-None-Match": identity_etag, "Accept-Encoding": "gzip"}
+    )
+    assert response.status == 200
+    assert response.getheader("ETag") != identity_etag
+    response, body = request(
+        server, "/1/1/1", {"If-None-Match": response.getheader("ETag")}
+    )
+    assert response.status == 200
+    assert body == b"bottom right"
+
+    response, body = request(server, "/1/0/0", method="HEAD")
+    assert response.status == 200
+    assert body == b""
+
+    for path in (
+        "/1/1/0",
+        "/1/2/0",
+        "/foo",
+        "/1/0",
+        "/1000000000/0/0",
+        "/70/{0}/0".format(2 ** 65),
+    ):
+        response, _ = request(server, path)
+        assert response.status == 404
+
+
+def test_serve_revalidate(server):
+    response, _ = request(server, "/1/0/0")
+    etag = response.getheader("ETag")
+
+    def read_tile_and_id(z, x, y):  # pragma: no cover
+        raise AssertionError("tile data read")
+
+    # matching ETags are found without reading tile data
+    read = server.pool.read_tile_and_id
+    server.pool.read_tile_and_id = read_tile_and_id
+    try:
+        response, _ = request(server, "/1/0/0", {"If-None-Match": etag})
+        assert response.status == 304
+        response, _ = request(server, "/1/1/0", {"If-None-Match": etag})
+        assert response.status == 404
+    finally:
+        server.pool.read_tile_and_id = read
+
+    response, _ = request(server, "/1/1/1", {"If-None-Match": etag})
+    assert response.status == 200
+
+
+def test_serve_cache(tileset):
+    server = TileServer(tileset, port=0, cache=TileCache())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        response, body = request(server, "/1/0/0", {"Accept-Encoding": "gzip"})
+        etag = response.getheader("ETag")
+
+        with MBtiles(tileset, "r+", compression="gzip") as out:
+            out.write_tile(1, 0, 1, b"new")
+
+        # tile data from the cache are sent with their own ETag, not the
+        # tile_id now in the file
+        response, cached = request(server, "/1/0/0", {"Accept-Encoding": "gzip"})
+        assert cached == body
+        assert response.getheader("ETag") == etag
+
+        response, _ = request(
+            server, "/1/0/0", {"If-None-Match": etag, "Accept-Encoding": "gzip"}
+        )
+        assert response.status == 304
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_serve_keep_alive(server):
+    connection = HTTPConnection(*server.server_address)
+    try:
+        for _ in range(3):
+            connection.request("GET", "/1/0/0")
+            response = connection.getresponse()
+            assert response.read() == b"top left"
+    finally:
+        connection.close()
+
+
+def test_tilejson(server):
+    response, body = request(server, "/tilejson.json")
+    assert response.status == 200
+
+    tilejson = json.loads(body.decode("utf-8"))
+    assert tilejson["name"] == "test"
+    assert tilejson["tiles"] == [
+        "http://{0}:{1}/{{z}}/{{x}}/{{y}}.pbf".format(*server.server_address)
+    ]
+    assert tilejson["minzoom"] == 1
+    assert tilejson["maxzoom"] == 1
+    assert tilejson["bounds"] == [-180, -85, 180, 85]
+    assert tilejson["center"] == [0, 0, 1]
+    assert tilejson["vector_layers"] == [{"id": "test"}]
+
+
+def test_serve_tiles_table(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    with MBtiles(filename, "w") as out:
+        out._cursor.executescript(
+            "DROP VIEW tiles; "
+            "CREATE TABLE tiles (zoom_level integer, tile_column integer, "
+            "tile_row integer, tile_data blob);"
+            "INSERT INTO tiles VALUES (0, 0, 0, x'0102');"
+        )
+
+    server = TileServer(filename, port=0, scheme="tms")
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        response, body = request(server, "/0/0/0.png")
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "image/png"
+        assert body == b"\x01\x02"
+
+        etag = response.getheader("ETag")
+        response, _ = request(server, "/0/0/0.png", {"If-None-Match": etag})
+        assert response.status == 304
+
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,152 @@
+import os
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.sharded import ShardedMBtiles, quadkey, reshard
+
+
+def make_tiles(max_zoom=3):
+    return [
+        Tile(z, x, y, "{0}/{1}/{2}".format(z, x, y).encode("utf-8"))
+        for z in range(max_zoom + 1)
+        for x in range(2 ** z)
+        for y in range(2 ** z)
+    ]
+
+
+def test_quadkey():
+    assert quadkey(0, 0, 0) == ""
+    # rows are TMS, so row 1 at zoom 1 is the top row
+    assert quadkey(1, 0, 1) == "0"
+    assert quadkey(1, 1, 1) == "1"
+    assert quadkey(1, 0, 0) == "2"
+    assert quadkey(3, 3, 2) == "213"
+
+
+@pytest.mark.parametrize("partition", ["zoom", "quadkey"])
+def test_sharded(tmpdir, partition):
+    path = str(tmpdir.join("tileset"))
+    tiles = make_tiles()
+
+    with ShardedMBtiles(path, "w", partition=partition, quadkey_zoom=1) as out:
+        out.meta = {"name": "test"}
+        out.write_tiles(tiles)
+        out.write_tile(4, 0, 0, b"a")
+        assert out.write_stats["tiles"] == len(tiles) + 1
+
+    with ShardedMBtiles(path) as src:
+        assert src.partition == partition
+        assert src.meta["name"] == "test"
+        if partition == "zoom":
+            assert src.shards == ["z0", "z1", "z2", "z3", "z4"]
+        else:
+            assert src.shards == ["base", "q0", "q1", "q2", "q3"]
+
+        assert src.zoom_range() == (0, 4)
+        assert src.read_tile(3, 5, 6) == b"3/5/6"
+        assert src.read_tile(4, 0, 0) == b"a"
+        assert src.read_tile(4, 1, 0) is None
+        assert src.read_tile(10, 0, 0) is None
+        assert src.has_tile(2, 1, 1)
+        assert not src.has_tile(10, 0, 0)
+
+        coords = [(3, 7, 0), (10, 0, 0), (0, 0, 0)]
+        assert src.read_tiles(coords) == [
+            Tile(3, 7, 0, b"3/7/0"),
+            Tile(10, 0, 0, None),
+            Tile(0, 0, 0, b"0/0/0"),
+        ]
+
+        assert sorted(src.list_tiles()) == sorted(
+            [tile[:3] for tile in tiles] + [(4, 0, 0)]
+        )
+        assert sorted(src.iter_tiles(batch_size=5, data=True)) == sorted(
+            tiles + [Tile(4, 0, 0, b"a")]
+        )
+
+        with pytest.raises(ValueError):
+            src.write_tile(5, 0, 0, b"a")
+
+    # only tiles of the same shard are in each shard
+    shard = "z3" if partition == "zoom" else "q1"
+    with MBtiles(os.path.join(path, shard + ".mbtiles")) as src:
+        if partition == "zoom":
+            assert src.zoom_range() == (3, 3)
+        else:
+            assert all(t.x >= 2 ** (t.z - 1) for t in src.list_tiles())
+
+    with ShardedMBtiles(path, "r+") as out:
+        out.write_tile(3, 5, 6, b"new")
+        del out.meta["name"]
+
+        # the shard of a failed write is left empty
+        with pytest.raises(ValueError):
+            out.write_tile(5, 0, 32, b"a")
+        assert out.zoom_range() == (0, 4)
+
+    with ShardedMBtiles(path) as src:
+        assert src.read_tile(3, 5, 6) == b"new"
+        assert "name" not in src.meta
+
+    # existing shards are deleted
+    with ShardedMBtiles(path, "w") as out:
+        assert out.shards == []
+    assert sorted(os.listdir(path)) == ["manifest.json"]
+
+
+def test_sharded_xyz(tmpdir):
+    path = str(tmpdir.join("tileset"))
+
+    with ShardedMBtiles(
+        path, "w", partition="quadkey", quadkey_zoom=1, scheme="xyz"
+    ) as out:
+        out.write_tiles([Tile(2, 0, 0, b"a"), Tile(2, 3, 3, b"b")])
+        assert out.shard_key(2, 0, 0) == "q0"
+        assert out.shards == ["q0", "q3"]
+
+    # tiles are found in the TMS scheme, and in the scheme they were written
+    with ShardedMBtiles(path) as src:
+        assert src.read_tile(2, 0, 3) == b"a"
+        assert src.read_tile(2, 3, 0) == b"b"
+
+    with ShardedMBtiles(path, scheme="xyz") as src:
+        assert src.read_tile(2, 0, 0) == b"a"
+
+
+def test_sharded_invalid(tmpdir):
+    path = str(tmpdir.join("tileset"))
+
+    with pytest.raises(IOError):
+        ShardedMBtiles(path)
+
+    with pytest.raises(ValueError):
+        ShardedMBtiles(path, "w", partition="foo")
+
+    with pytest.raises(ValueError):
+        ShardedMBtiles(path, "w", partition="quadkey", quadkey_zoom=0)
+
+
+def test_reshard(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = make_tiles()
+    with MBtiles(filename, "w") as out:
+        out.meta = {"name": "test"}
+        out.write_tiles(tiles)
+        out.rewrite_scheme("xyz")
+
+    path = str(tmpdir.join("zoom"))
+    assert reshard(filename, path, batch_size=7) == len(tiles)
+
+    # from one sharded tileset to another
+    quadkey_path = str(tmpdir.join("quadkey"))
+    assert reshard(path, quadkey_path, partition="quadkey", quadkey_zoom=2) == len(
+        tiles
+    )
+
+    with ShardedMBtiles(quadkey_path) as src:
+        assert src.meta["name"] == "test"
+        # how rows are stored in the source file does not apply to shards
+        assert "scheme" not in src.meta
+        assert len(src.shards) == 17
+        assert sorted(src.iter_tiles(data=True)) == sorted(tiles)
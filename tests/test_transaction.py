@@ -0,0 +1,251 @@
+import sqlite3
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+from pymbtiles.cache import TileCache
+
+
+def count_stored(filename):
+    db = sqlite3.connect(filename)
+    try:
+        return db.execute("SELECT count(*) FROM map").fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_transaction(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(4, x, y, b"%d-%d" % (x, y)) for x in range(16) for y in range(16)]
+
+    with MBtiles(filename, mode="w", profile="wal_concurrent") as out:
+        with out.transaction(batch_size=100) as tx:
+            for i in range(0, len(tiles), 10):
+                out.write_tiles(tiles[i : i + 10])
+
+            # committed every 100 tiles
+            assert tx.commits == 2
+            assert tx.pending == 56
+            assert count_stored(filename) == 200
+
+            tx.write_tile(0, 0, 0, b"a")
+            out.meta["name"] = "test"
+            assert tx.tiles_written == 257
+
+        assert count_stored(filename) == 257
+        assert tx.rate > 0
+        assert not out.meta.dirty
+
+        # tiles written after the session use their own transactions
+        out.write_tile(0, 0, 0, b"b")
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([tile[:3] for tile in tiles]) == tiles
+        assert src.read_tile(0, 0, 0) == b"b"
+        assert src.meta["name"] == "test"
+
+
+def test_transaction_max_bytes(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w") as out:
+        with out.transaction(max_bytes=1000) as tx:
+            for x in range(10):
+                tx.write_tile(4, x, 0, bytes(bytearray([x])) * 400)
+
+        assert tx.commits == 4
+
+
+def test_transaction_rollback(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="safe") as out:
+        with pytest.raises(RuntimeError):
+            with out.transaction(batch_size=2) as tx:
+                out.write_tiles([Tile(1, 0, 0, b"a"), Tile(1, 0, 1, b"b")])
+                out.write_tile(1, 1, 0, b"c")
+                raise RuntimeError()
+
+        # tiles committed before the error are kept
+        assert tx.tiles_written == 2
+        assert out.write_stats["tiles"] == 2
+        assert out.write_stats["images"] == 2
+        assert out.read_tile(1, 0, 0) == b"a"
+        assert out.read_tile(1, 1, 0) is None
+
+        # tile data rolled back are written again
+        out.write_tile(1, 1, 1, b"c")
+        assert out.read_tile(1, 1, 1) == b"c"
+
+        with out.transaction():
+            with pytest.raises(ValueError):
+                out.transaction().__enter__()
+
+    with MBtiles(filename) as src:
+        with pytest.raises(ValueError):
+            src.transaction()
+
+
+def test_savepoint(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="safe") as out:
+        with out.transaction(batch_size=1) as tx:
+            out.write_tile(1, 0, 0, b"a")
+            assert tx.commits == 1
+
+            with pytest.raises(RuntimeError):
+                with tx.savepoint():
+                    out.write_tiles([Tile(1, 0, 1, b"b"), Tile(1, 1, 1, b"a")])
+
+                    # not committed within a savepoint
+                    assert tx.commits == 1
+                    with pytest.raises(ValueError):
+                        tx.commit()
+
+                    raise RuntimeError()
+
+            assert tx.tiles_written == 1
+
+            with tx.savepoint():
+                out.write_tile(1, 1, 0, b"b")
+
+            # committed once the savepoint is released
+            out.write_tile(1, 1, 1, b"c")
+            assert tx.commits == 2
+            assert tx.tiles_written == 3
+
+        assert out.read_tile(1, 0, 1) is None
+        assert out.read_tile(1, 1, 0) == b"b"
+        assert out.read_tile(1, 1, 1) == b"c"
+        assert out.write_stats["tiles"] == 3
+
+    # rolling back requires a journal
+    with MBtiles(filename, mode="r+", profile="bulk_load") as out:
+        with out.transaction() as tx:
+            with pytest.raises(ValueError):
+                with tx.savepoint():
+                    pass
+
+
+def test_transaction_parallel_writer(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(4, x, y, b"%d-%d" % (x, y)) for x in range(16) for y in range(16)]
+
+    with MBtiles(filename, mode="w") as out:
+        with out.transaction(batch_size=100) as tx:
+            with out.parallel_writer(workers=2, batch_size=10) as writer:
+                writer.write_tiles(tiles)
+
+        assert tx.commits == 3
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([tile[:3] for tile in tiles]) == tiles
+
+
+def test_write_tiles_rollback(tmpdir):
+    # errors raised by tiles roll back the transaction of write_tiles
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    def tiles():
+        yield Tile(1, 0, 0, b"a")
+        raise RuntimeError()
+
+    with MBtiles(filename, mode="w", profile="safe") as out:
+        with pytest.raises(RuntimeError):
+            out.write_tiles(tiles())
+
+        assert out.read_tile(1, 0, 0) is None
+        out.write_tiles([Tile(1, 0, 0, b"a")])
+        assert out.read_tile(1, 0, 0) == b"a"
+
+
+def test_transaction_atomic_writes(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="safe") as out:
+        with out.transaction() as tx:
+            out.write_tiles([Tile(1, 0, 0, b"a")])
+
+            # tiles of a call that fails partway are not kept
+            with pytest.raises(ValueError):
+                out.write_tiles([Tile(1, 0, 1, b"b"), Tile(1, 0, 2, b"c")])
+            with pytest.raises(ValueError):
+                out.write_columns([1, 1], [1, 2], [1, 1], [b"d", b"e"])
+
+            assert tx.pending == 1
+
+        assert out.write_stats["tiles"] == 1
+        assert out.list_tiles() == [(1, 0, 0)]
+
+
+def test_transaction_metadata(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="safe") as out:
+        out.meta = {"name": "test"}
+
+        with out.transaction():
+            out.meta["description"] = "a"
+            out.meta.flush()
+            assert not out.meta.dirty
+
+            # metadata already changed are written within the session
+            out.meta["attribution"] = "b"
+            out.meta = {"version": "1"}
+
+        with pytest.raises(RuntimeError):
+            with out.transaction():
+                out.meta["name"] = "other"
+                out.meta.flush()
+                raise RuntimeError()
+
+        # metadata written within the session are rolled back
+        assert out.meta["name"] == "test"
+
+    with MBtiles(filename) as src:
+        assert src.meta["name"] == "test"
+        assert src.meta["description"] == "a"
+        assert src.meta["attribution"] == "b"
+        assert src.meta["version"] == "1"
+
+
+def test_close_transaction(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    out = MBtiles(filename, mode="w", profile="safe")
+    with out.transaction() as tx:
+        out.write_tile(1, 0, 0, b"a")
+        out.meta["name"] = "test"
+
+        # the session is committed
+        out.close()
+        assert tx.commits == 1
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(1, 0, 0) == b"a"
+        assert src.meta["name"] == "test"
+
+
+def test_transaction_rollback_cache(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w", profile="safe", cache=TileCache()) as out:
+        out.write_tiles([Tile(1, 0, 0, b"old"), Tile(1, 0, 1, b"old")])
+
+        with pytest.raises(RuntimeError):
+            with out.transaction() as tx:
+                out.write_tile(1, 0, 0, b"new")
+                assert out.read_tile(1, 0, 0) == b"new"
+
+                with pytest.raises(RuntimeError):
+                    with tx.savepoint():
+                        out.write_columns([1], [0], [1], [b"new"])
+                        assert out.read_tile(1, 0, 1) == b"new"
+                        raise RuntimeError()
+
+                # tiles rolled back are not read from the cache
+                assert out.read_tile(1, 0, 1) == b"old"
+                raise RuntimeError()
+
+        assert out.read_tile(1, 0, 0) == b"old"
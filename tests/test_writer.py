@@ -0,0 +1,89 @@
+import zlib
+
+import pytest
+
+from pymbtiles import MBtiles, Tile
+
+
+def test_parallel_writer(tmpdir, blank_png_tile):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(4, x, y, b"%d-%d" % (x, y)) for x in range(16) for y in range(16)]
+
+    with MBtiles(filename, mode="w") as out:
+        with out.parallel_writer(workers=2, batch_size=10, max_pending=2) as writer:
+            writer.write_tiles(tiles)
+            writer.write_tile(0, 0, 0, blank_png_tile)
+
+        assert writer.tiles_written == len(tiles) + 1
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([tile[:3] for tile in tiles]) == tiles
+        assert src.read_tile(0, 0, 0) == blank_png_tile
+
+
+def test_parallel_writer_processes(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(2, x, y, b"%d-%d" % (x, y)) for x in range(4) for y in range(4)]
+
+    with MBtiles(filename, mode="w") as out:
+        with out.parallel_writer(workers=2, batch_size=3, processes=True) as writer:
+            writer.write_tiles(tiles)
+
+    with MBtiles(filename) as src:
+        assert src.read_tiles([tile[:3] for tile in tiles]) == tiles
+
+
+def test_parallel_writer_order(tmpdir):
+    # later tiles overwrite earlier tiles, even across batches
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w") as out:
+        with out.parallel_writer(workers=4, batch_size=1) as writer:
+            for i in range(50):
+                writer.write_tile(0, 0, 0, b"%d" % i)
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(0, 0, 0) == b"49"
+
+
+def test_parallel_writer_error(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+
+    with MBtiles(filename, mode="w") as out:
+        writer = out.parallel_writer(workers=2, batch_size=2)
+        writer.write_tiles([Tile(1, 0, 0, b"a"), Tile(1, 0, 1, b"b")])
+        writer.write_tiles([Tile(1, 1, 0, b"c"), Tile(1, 1, 1, None)])
+
+        with pytest.raises(TypeError):
+            writer.close()
+
+        with pytest.raises(ValueError):
+            writer.write_tile(0, 0, 0, b"")
+
+    with MBtiles(filename) as src:
+        # the batch before the error was written
+        assert sorted(src.list_tiles()) == [(1, 0, 0), (1, 0, 1)]
+
+
+def test_parallel_writer_readonly(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    MBtiles(filename, mode="w").close()
+
+    with MBtiles(filename) as src:
+        with pytest.raises(ValueError):
+            src.parallel_writer()
+
+
+def test_parallel_writer_compression(tmpdir):
+    filename = str(tmpdir.join("test.mbtiles"))
+    tiles = [Tile(2, x, y, b"%d-%d" % (x, y)) for x in range(4) for y in range(4)]
+
+    with MBtiles(filename, mode="w", compression="zlib") as out:
+        with out.parallel_writer(workers=2, batch_size=3, processes=True) as writer:
+            writer.write_tiles(tiles)
+
+    with MBtiles(filename) as src:
+        assert src.read_tile(2, 0, 0) == zlib.compress(b"0-0", 6)
+
+    with MBtiles(filename, compression="zlib", decompress=True) as src:
+        assert src.read_tiles([tile[:3] for tile in tiles]) == tiles